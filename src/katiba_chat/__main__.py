@@ -1,12 +1,37 @@
 """CLI entrypoint"""
 
+import logging
 import sys
 
-from .entrypoints.cli import entrypoint as cli_entrypoint
+COMMANDS = ("serve", "build-index")
+USAGE = f"Usage: {sys.argv[0]} [--] '<query>' | serve | build-index [options]"
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print(f"Usage: {sys.argv[0]} '<query>'", file=sys.stderr)
+    args = sys.argv[1:]
+    command = None
+    if args and args[0] in COMMANDS:
+        command = args.pop(0)
+    elif args[:1] == ["--"]:
+        # a query that is also the name of a command is asked after "--"
+        args.pop(0)
+    # imported per command, as loading the query entrypoint needs the
+    # LLM settings and the index build runs without them
+    # pylint: disable=import-outside-toplevel
+    if command == "build-index":
+        from .entrypoints import build
+
+        logging.basicConfig(level=logging.INFO)
+        build.main(args)
+    elif len(args) != (0 if command else 1):
+        print(USAGE, file=sys.stderr)
         sys.exit(1)
-    query = sys.argv[1]
-    cli_entrypoint(query)
+    elif command == "serve":
+        # configured first, so that loading the indexes is logged too
+        logging.basicConfig(level=logging.INFO)
+        from .entrypoints.cli import serve as cli_serve
+
+        cli_serve()
+    else:
+        from .entrypoints.cli import entrypoint as cli_entrypoint
+
+        cli_entrypoint(args[0])
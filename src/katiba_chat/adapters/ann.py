@@ -0,0 +1,223 @@
+"""Approximate nearest neighbour search adapters"""
+
+import json
+import logging
+import math
+import pathlib
+
+import numpy
+
+from . import files, retrieval, vectors
+
+log = logging.getLogger(__name__)
+
+
+class IVFIndex:
+    """Inverted file index over normalized embeddings
+
+    The embeddings are partitioned into `num_lists` clusters with
+    spherical k-means. A search only scores the members of the
+    `num_probes` clusters whose centroids are most similar to the query,
+    trading recall for latency: probing every list is an exact search.
+    The candidates are scored from the indexed embeddings themselves,
+    which are not saved with the index.
+    """
+
+    CENTROIDS_FILENAME = "centroids.npy"
+    IDS_FILENAME = "ids.npy"
+    OFFSETS_FILENAME = "offsets.npy"
+    PARAMS_FILENAME = "params.json"
+    # a copy of the embeddings saved by earlier versions
+    EMBEDDINGS_FILENAME = "embeddings.npy"
+
+    def __init__(
+        self,
+        centroids: numpy.ndarray,
+        ids: numpy.ndarray,
+        offsets: numpy.ndarray,
+        embeddings: vectors.NormalizedEmbeddings,
+        num_probes: int = 8,
+    ):
+        """Use an already built index of `embeddings`
+
+        `ids` holds the embedding positions grouped by list, with the
+        members of list `i` at `ids[offsets[i]:offsets[i + 1]]`.
+        `data_version` identifies the data the index was built from.
+        """
+        self.centroids = centroids
+        self.ids = ids
+        self.offsets = offsets
+        self.embeddings = embeddings
+        self.num_probes = num_probes
+        self.data_version: str | None = None
+
+    @property
+    def num_lists(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(  # pylint: disable=too-many-arguments
+        cls,
+        embeddings: vectors.NormalizedEmbeddings,
+        num_lists: int | None = None,
+        num_probes: int = 8,
+        num_iterations: int = 20,
+        seed: int = 0,
+    ):
+        """Cluster `embeddings` into an index
+
+        `num_lists` defaults to the square root of the number of
+        embeddings.
+        """
+        num_lists = num_lists or max(1, round(math.sqrt(len(embeddings))))
+        num_lists = min(num_lists, len(embeddings))
+        centroids, assignments = _spherical_kmeans(
+            embeddings.rows(slice(None)), num_lists, num_iterations, seed
+        )
+        ids = numpy.argsort(assignments, kind="stable")
+        counts = numpy.bincount(assignments, minlength=num_lists)
+        offsets = numpy.concatenate([[0], numpy.cumsum(counts)])
+        return cls(centroids, ids, offsets, embeddings, num_probes)
+
+    @classmethod
+    def load(
+        cls,
+        directory: retrieval.FileSystemPath,
+        embeddings: vectors.NormalizedEmbeddings,
+        num_probes: int | None = None,
+    ):
+        """Open the index of `embeddings` saved in `directory`"""
+        directory = pathlib.Path(directory)
+        with open(directory / cls.PARAMS_FILENAME, "rt") as f:
+            params = json.load(f)
+        index = cls(
+            numpy.load(directory / cls.CENTROIDS_FILENAME),
+            numpy.load(directory / cls.IDS_FILENAME, mmap_mode="r"),
+            numpy.load(directory / cls.OFFSETS_FILENAME),
+            embeddings,
+            num_probes or params["num_probes"],
+        )
+        index.data_version = params.get("data_version")
+        return index
+
+    def save(self, directory: retrieval.FileSystemPath):
+        """Write the index to `directory`, replacing any saved there
+
+        The parameters are removed first and written last, so an index
+        left incomplete by a crash is rebuilt rather than loaded.
+        """
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        params_path = directory / self.PARAMS_FILENAME
+        params_path.unlink(missing_ok=True)
+        (directory / self.EMBEDDINGS_FILENAME).unlink(missing_ok=True)
+        for filename, array in [
+            (self.CENTROIDS_FILENAME, self.centroids),
+            (self.IDS_FILENAME, self.ids),
+            (self.OFFSETS_FILENAME, self.offsets),
+        ]:
+            files.save_array(directory / filename, array)
+        files.write_json(
+            params_path,
+            {"num_probes": self.num_probes, "data_version": self.data_version},
+        )
+
+    def search(
+        self, query_embedding: numpy.ndarray, k: int
+    ) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """Approximate positions and scores of the `k` nearest embeddings"""
+        query_embedding = numpy.asarray(query_embedding, dtype=numpy.float32)
+        probed_lists = vectors.top_k(
+            self.centroids @ query_embedding, self.num_probes
+        )
+        candidate_ranges = [
+            numpy.arange(self.offsets[i], self.offsets[i + 1])
+            for i in probed_lists
+        ]
+        candidates = numpy.asarray(
+            self.ids[numpy.concatenate(candidate_ranges)]
+        )
+        scores = self.embeddings.rows(candidates) @ query_embedding
+        best = vectors.top_k(scores, k)
+        return candidates[best], scores[best]
+
+
+class ApproximateSentenceTransformersIndex(
+    retrieval.SentenceTransformersIndex
+):
+    # pylint: disable=too-few-public-methods
+    """Semantic search through an IVF index of the article embeddings"""
+
+    def __init__(
+        self,
+        data_path: retrieval.FileSystemPath,
+        index_dirname: retrieval.FileSystemPath,
+        num_lists: int | None = None,
+        num_probes: int = 8,
+        **kwargs,
+    ):
+        """Initialize the index, building the IVF index if it is missing
+        or was built from other article data
+
+        Other keyword arguments are passed on to SentenceTransformersIndex
+        """
+        super().__init__(data_path, index_dirname, **kwargs)
+        ivf_dir = self._index_dir / "ivf"
+        is_built = (ivf_dir / IVFIndex.PARAMS_FILENAME).exists()
+        if is_built:
+            self.ivf_index = IVFIndex.load(
+                ivf_dir, self._embeddings, num_probes
+            )
+        data_version = self.manifest.digest
+        if not is_built or self.ivf_index.data_version != data_version:
+            log.info("Creating IVF index at: %s", ivf_dir)
+            self.ivf_index = IVFIndex.build(
+                self._embeddings, num_lists, num_probes
+            )
+            self.ivf_index.data_version = data_version
+            self.ivf_index.save(ivf_dir)
+
+    def _nearest(self, query_embedding, k):
+        return self.ivf_index.search(query_embedding, k)
+
+    def _nearest_batch(self, query_embeddings, k):
+        return [self._nearest(q, k) for q in query_embeddings]
+
+
+class ApproximateHybridIndex(retrieval.HybridIndex):
+    # pylint: disable=too-few-public-methods
+
+    SEMANTIC_INDEX_CLS = ApproximateSentenceTransformersIndex
+
+
+def recall_at_k(
+    approximate_ids: list[numpy.ndarray], exact_ids: list[numpy.ndarray]
+) -> float:
+    """Mean fraction of the exact neighbours found by the approximation"""
+    recalls = [
+        len(set(approx.tolist()) & set(exact.tolist())) / len(exact)
+        for approx, exact in zip(approximate_ids, exact_ids)
+        if len(exact)
+    ]
+    return sum(recalls) / len(recalls) if recalls else 0.0
+
+
+def _spherical_kmeans(
+    embeddings: numpy.ndarray, num_clusters: int, num_iterations: int, seed
+):
+    rng = numpy.random.default_rng(seed)
+    initial = rng.choice(len(embeddings), num_clusters, replace=False)
+    centroids = embeddings[initial]
+    for _ in range(num_iterations):
+        assignments = numpy.argmax(embeddings @ centroids.T, axis=1)
+        sums = numpy.zeros_like(centroids)
+        numpy.add.at(sums, assignments, embeddings)
+        empty = numpy.flatnonzero(~sums.any(axis=1))
+        # reseed empty clusters with random members
+        sums[empty] = embeddings[rng.choice(len(embeddings), len(empty))]
+        centroids = vectors.normalize(sums)
+    assignments = numpy.argmax(embeddings @ centroids.T, axis=1)
+    return centroids, assignments
@@ -0,0 +1,164 @@
+"""Micro-batching of concurrent searches
+
+Encoding one query at a time leaves most of the throughput of batched
+matrix operations unused. Queries that arrive within a few milliseconds
+of each other are instead searched together: one batched encode and one
+matrix product for all of them.
+"""
+
+import dataclasses
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Protocol
+
+import numpy
+
+from .. import core
+from ..core import instrumentation
+
+log = logging.getLogger(__name__)
+
+
+class ArticleLookup(Protocol):
+    # pylint: disable=too-few-public-methods
+    def __getitem__(self, number: int) -> core.Article: ...
+
+
+class BatchableIndex(core.AbstractIndex, Protocol):
+    """An index embedding queries and reading its results from a store"""
+
+    @property
+    def store(self) -> ArticleLookup: ...
+
+    def embed(self, query: core.Query) -> numpy.ndarray: ...
+
+
+@dataclasses.dataclass
+class _Request:
+    query: core.Query
+    num_results: int
+    future: Future = dataclasses.field(default_factory=Future)
+    enqueued: float = dataclasses.field(default_factory=time.perf_counter)
+
+
+class MicroBatchingIndex(core.AbstractIndex):
+    """Search an index for concurrent queries in batches
+
+    A search waits up to `max_wait` seconds for other searches to join
+    it, then a scheduler thread searches all of them, at most
+    `max_batch_size`, with one call to the `search_ids_batch` method of
+    `index`. Each caller gets its own results, read from the `store` of
+    `index`. Searches that are already batched go to `index` directly.
+
+    The limits are exposed as gauges, and the batches searched, the
+    queries in them and the time queries wait as instrumentation.
+    """
+
+    def __init__(
+        self,
+        index: BatchableIndex,
+        max_batch_size: int = 32,
+        max_wait: float = 0.005,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.index = index
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: queue.SimpleQueue[_Request | None] = queue.SimpleQueue()
+        self._closed = False
+        # enqueuing is kept from racing the sentinel put by closing
+        self._closing_lock = threading.Lock()
+        self._scheduler = threading.Thread(
+            target=self._schedule, name="micro-batching", daemon=True
+        )
+        self._scheduler.start()
+        instrumentation.set_gauge("query_batch_max_size", max_batch_size)
+        instrumentation.set_gauge("query_batch_max_wait_seconds", max_wait)
+
+    def embed(self, query: core.Query):
+        """Get the normalized embedding of a query from `index`"""
+        return self.index.embed(query)
+
+    def search(self, query, num_results):
+        return core.unscored(self.search_scored(query, num_results))
+
+    def search_batch(self, queries, num_results):
+        return self.index.search_batch(queries, num_results)
+
+    def search_scored(self, query, num_results):
+        store = self.index.store
+        return [
+            (store[number], score)
+            for number, score in self.search_ids(query, num_results)
+        ]
+
+    def search_scored_batch(self, queries, num_results):
+        return self.index.search_scored_batch(queries, num_results)
+
+    def search_ids(self, query, num_results):
+        request = _Request(query, num_results)
+        with self._closing_lock:
+            if self._closed:
+                return self.index.search_ids(query, num_results)
+            self._queue.put(request)
+        return request.future.result()
+
+    def search_ids_batch(self, queries, num_results):
+        return self.index.search_ids_batch(queries, num_results)
+
+    def close(self):
+        """Stop the scheduler once the queued searches are done"""
+        with self._closing_lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._scheduler.join()
+
+    def _schedule(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = request.enqueued + self.max_wait
+            stopping = False
+            while len(batch) < self.max_batch_size:
+                try:
+                    request = self._queue.get(
+                        timeout=max(0.0, deadline - time.perf_counter())
+                    )
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            self._search(batch)
+            if stopping:
+                return
+
+    def _search(self, batch: list[_Request]):
+        start = time.perf_counter()
+        for request in batch:
+            instrumentation.observe(
+                "query_batch.wait", start - request.enqueued
+            )
+        instrumentation.increment("query_batches")
+        instrumentation.increment("batched_queries", len(batch))
+        # the deepest search asked for serves the shallower ones
+        num_results = max(request.num_results for request in batch)
+        try:
+            with instrumentation.span("query_batch", batch_size=len(batch)):
+                results = self.index.search_ids_batch(
+                    [request.query for request in batch], num_results
+                )
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            for request in batch:
+                request.future.set_exception(error)
+            return
+        for request, scored in zip(batch, results):
+            request.future.set_result(scored[: request.num_results])
@@ -0,0 +1,587 @@
+"""Caching adapters"""
+
+import asyncio
+import json
+import logging
+import pathlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable, Hashable, Iterator
+from dataclasses import dataclass
+from typing import Any
+
+import numpy
+
+from .. import core
+from ..core import instrumentation
+from . import files
+
+log = logging.getLogger(__name__)
+
+FileSystemPath = str | pathlib.Path
+Embedder = Callable[[core.Query], numpy.ndarray]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+@dataclass
+class AnswerCacheStats(CacheStats):
+    # the subset of hits matched by embedding similarity
+    semantic_hits: int = 0
+
+
+class LRUCache:
+    """Thread-safe mapping with least-recently-used and TTL eviction"""
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float | None = None,
+        name: str | None = None,
+        on_evict: Callable[[Hashable], None] | None = None,
+    ):
+        """Hold up to `max_size` entries, each for at most `ttl` seconds
+
+        The hits and misses of a cache with a `name` are counted by the
+        instrumentation under that name. `on_evict` is called with the
+        key of each entry evicted or expired, while the cache is locked.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self._on_evict = on_evict
+        self.stats = CacheStats()
+        self._entries: OrderedDict[Hashable, tuple[float, Any]]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                del self._entries[key]
+                self._evicted(key)
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+        if self.name is not None:
+            instrumentation.increment(
+                "cache_misses" if entry is None else "cache_hits",
+                cache=self.name,
+            )
+        return default if entry is None else entry[1]
+
+    def put(self, key: Hashable, value, created: float | None = None):
+        created = time.time() if created is None else created
+        with self._lock:
+            self._entries[key] = (created, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._evicted(evicted)
+
+    def entries(self) -> list[tuple[Hashable, float, Any]]:
+        """Snapshot of the live entries as (key, created, value) tuples"""
+        with self._lock:
+            return [
+                (key, *entry)
+                for key, entry in self._entries.items()
+                if not self._is_expired(entry)
+            ]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evicted(self, key: Hashable):
+        if self._on_evict is not None:
+            self._on_evict(key)
+
+    def _is_expired(self, entry) -> bool:
+        created, _ = entry
+        return self.ttl is not None and time.time() - created > self.ttl
+
+
+class CachedIndex(core.AbstractIndex):
+    # pylint: disable=too-few-public-methods
+    """Memoize the ranked results of an index per query
+
+    Results are not memoized when the index reports through a
+    `last_search_complete` attribute that some of its backends were
+    left out, such as a HybridIndex whose semantic index is loading.
+    """
+
+    def __init__(self, index: core.AbstractIndex, max_size: int = 1024):
+        self._index = index
+        self.results_cache = LRUCache(max_size, name="retrieval")
+
+    def search(self, query, num_results):
+        key = _results_key(query, num_results)
+        results = self.results_cache.get(key)
+        if results is None:
+            results = list(self._index.search(query, num_results))
+            if getattr(self._index, "last_search_complete", True):
+                self.results_cache.put(key, results)
+        return list(results)
+
+    def search_batch(self, queries, num_results):
+        results = [
+            self.results_cache.get(_results_key(query, num_results))
+            for query in queries
+        ]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing:
+            missing_results = self._index.search_batch(
+                [queries[i] for i in missing], num_results
+            )
+            is_complete = getattr(self._index, "last_search_complete", True)
+            for i, query_results in zip(missing, missing_results):
+                results[i] = list(query_results)
+                if is_complete:
+                    key = _results_key(queries[i], num_results)
+                    self.results_cache.put(key, results[i])
+        return [list(query_results) for query_results in results]
+
+
+class AnswerCache:
+    """Answers to questions, looked up by their text or their meaning
+
+    A question is looked up by its normalized text first. Failing that,
+    and when an `embed` function is given, the answer to the most
+    similar cached question is used if their cosine similarity is at
+    least `similarity_threshold`. An `embed` function that raises
+    core.IndexNotReadyError limits lookups to exact matches.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        embed: Embedder | None = None,
+        *,
+        similarity_threshold: float = 0.9,
+        max_size: int = 1024,
+        ttl: float | None = None,
+        path: FileSystemPath | None = None,
+        version: str | None = None,
+        save_interval: float = 5.0,
+    ):
+        """Hold up to `max_size` answers, each for at most `ttl` seconds
+
+        If `path` is given, the cache is loaded from that file so that
+        it survives restarts. New answers are saved to it in the
+        background, at most `save_interval` seconds after they are
+        stored, and by `save`, which should also be called on shutdown.
+        Answers saved under another `version`, which should identify
+        the corpora, prompt and model they came from, are not loaded.
+        """
+        self._embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.stats = AnswerCacheStats()
+        self._questions = _QuestionEmbeddings(max_size)
+        self._answers = LRUCache(
+            max_size, ttl, on_evict=self._questions.remove
+        )
+        # held around every use of the answers, whose evictions it guards
+        self._lock = threading.RLock()
+        self._file = (
+            _AnswerFile(path, version, save_interval, self._answers.entries)
+            if path
+            else None
+        )
+        if self._file is not None:
+            for entry in self._file.load():
+                embedding = entry["embedding"]
+                if embedding is not None:
+                    embedding = numpy.asarray(embedding, dtype=numpy.float32)
+                self._put(
+                    entry["key"], entry["text"], embedding, entry["created"]
+                )
+
+    def lookup(self, query: core.Query):
+        """Find the answer to `query`, None if there is none
+
+        Returns the key and embedding to `store` a new answer under,
+        with the answer. Questions limited to some corpora are only
+        matched by their text, among questions limited to the same.
+        """
+        key = normalize_query(query)
+        if query.corpora is not None:
+            key += f" [{','.join(sorted(query.corpora))}]"
+        with self._lock:
+            entry = self._answers.get(key)
+        if entry is not None:
+            self.stats.hits += 1
+            instrumentation.increment("cache_hits", cache="answer")
+            log.debug("Exact answer cache hit: %s", key)
+            return key, entry["embedding"], core.LLMResponse(entry["text"])
+
+        embedding = (
+            None if query.corpora is not None else self._embedding(query)
+        )
+        if embedding is not None:
+            entry = self._nearest(embedding)
+            if entry is not None:
+                self.stats.hits += 1
+                self.stats.semantic_hits += 1
+                instrumentation.increment("cache_hits", cache="answer")
+                log.debug("Semantic answer cache hit: %s", key)
+                return key, embedding, core.LLMResponse(entry["text"])
+
+        self.stats.misses += 1
+        instrumentation.increment("cache_misses", cache="answer")
+        return key, embedding, None
+
+    def store(self, key, embedding, response: core.LLMResponse):
+        self._put(key, response.text, embedding)
+        if self._file is not None:
+            self._file.schedule_save()
+
+    def save(self):
+        """Save the answers to the cache file now, if any are unsaved"""
+        if self._file is not None:
+            self._file.save()
+
+    def _embedding(self, query: core.Query) -> numpy.ndarray | None:
+        if self._embed is None:
+            return None
+        try:
+            embedding = self._embed(query)
+        except core.IndexNotReadyError:
+            return None
+        return numpy.asarray(embedding, dtype=numpy.float32)
+
+    def _nearest(self, embedding: numpy.ndarray):
+        with self._lock:
+            for similarity, key in self._questions.most_similar(embedding):
+                if similarity < self.similarity_threshold:
+                    return None
+                entry = self._answers.get(key)
+                if entry is not None:
+                    return entry
+                # expired, and now evicted
+            return None
+
+    def _put(self, key, text, embedding, created=None):
+        with self._lock:
+            self._answers.put(
+                key, {"text": text, "embedding": embedding}, created=created
+            )
+            if embedding is None:
+                self._questions.remove(key)
+            else:
+                # rows of evicted answers were freed by the put
+                self._questions.put(key, embedding)
+
+
+class _QuestionEmbeddings:
+    """Embeddings of the cached questions, one row each"""
+
+    def __init__(self, max_size: int):
+        self._matrix: numpy.ndarray | None = None
+        self._in_use = numpy.zeros(max_size, dtype=bool)
+        self._row_keys: list[Hashable] = [None] * max_size
+        self._rows: dict[Hashable, int] = {}
+
+    def put(self, key: Hashable, embedding: numpy.ndarray):
+        if self._matrix is None:
+            self._matrix = numpy.zeros(
+                (len(self._in_use), len(embedding)), dtype=numpy.float32
+            )
+        row = self._rows.get(key)
+        if row is None:
+            row = int(numpy.argmin(self._in_use))
+            self._rows[key] = row
+        self._matrix[row] = embedding
+        self._in_use[row] = True
+        self._row_keys[row] = key
+
+    def remove(self, key: Hashable):
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._in_use[row] = False
+            self._row_keys[row] = None
+
+    def most_similar(
+        self, embedding: numpy.ndarray
+    ) -> Iterator[tuple[float, Hashable]]:
+        """Similarity and key of each question, the most similar first"""
+        if self._matrix is None:
+            return
+        similarities = numpy.where(
+            self._in_use, self._matrix @ embedding, -numpy.inf
+        )
+        while True:
+            best = int(numpy.argmax(similarities))
+            if similarities[best] == -numpy.inf:
+                return
+            yield float(similarities[best]), self._row_keys[best]
+            similarities[best] = -numpy.inf
+
+
+class _AnswerFile:
+    """The file the answers are saved to, under a `version`
+
+    Saves are scheduled `save_interval` seconds after the first unsaved
+    answer, and write the `entries` of the answers then cached.
+    """
+
+    def __init__(
+        self,
+        path: FileSystemPath,
+        version: str | None,
+        save_interval: float,
+        entries: Callable[[], list[tuple[Hashable, float, Any]]],
+    ):
+        self.path = pathlib.Path(path)
+        self.version = version
+        self.save_interval = save_interval
+        self._entries = entries
+        # pending while there are unsaved answers
+        self._timer: threading.Timer | None = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def load(self) -> list[dict]:
+        """The saved answers, none if saved under another version"""
+        if not self.path.exists():
+            return []
+        with open(self.path, "rt") as f:
+            saved = json.load(f)
+        if not isinstance(saved, dict) or saved["version"] != self.version:
+            log.info("Ignoring answers cached for another version")
+            return []
+        log.info(
+            "Loaded %s cached answers from: %s",
+            len(saved["answers"]),
+            self.path,
+        )
+        return saved["answers"]
+
+    def schedule_save(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.save_interval, self.save)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def save(self):
+        with self._save_lock:
+            with self._lock:
+                if self._timer is None:
+                    return
+                self._timer.cancel()
+                self._timer = None
+            answers = [
+                {
+                    "key": key,
+                    "created": created,
+                    "text": value["text"],
+                    "embedding": (
+                        None
+                        if value["embedding"] is None
+                        else value["embedding"].tolist()
+                    ),
+                }
+                for key, created, value in self._entries()
+            ]
+            files.write_json(
+                self.path, {"version": self.version, "answers": answers}
+            )
+
+
+class CachedLLM(core.AbstractLLM):
+    """Answer repeated questions from a cache instead of the LLM
+
+    See AnswerCache for how questions are matched and the options.
+    """
+
+    def __init__(self, llm: core.AbstractLLM, *args, **kwargs):
+        self._llm = llm
+        self.cache = AnswerCache(*args, **kwargs)
+
+    @property
+    def stats(self) -> AnswerCacheStats:
+        return self.cache.stats
+
+    def generate(self, prompt):
+        key, embedding, response = self.cache.lookup(prompt.query)
+        if response is None:
+            response = self._llm.generate(prompt)
+            self.cache.store(key, embedding, response)
+        return response
+
+    def generate_batch(self, prompts):
+        lookups = [self.cache.lookup(prompt.query) for prompt in prompts]
+        missing = [i for i, (_, _, r) in enumerate(lookups) if r is None]
+        responses = [response for _, _, response in lookups]
+        if missing:
+            generated = self._llm.generate_batch([prompts[i] for i in missing])
+            for i, response in zip(missing, generated):
+                key, embedding, _ = lookups[i]
+                self.cache.store(key, embedding, response)
+                responses[i] = response
+        return responses
+
+    def generate_stream(self, prompt):
+        key, embedding, response = self.cache.lookup(prompt.query)
+        if response is not None:
+            yield response
+            return
+        generated_text = ""
+        for part in self._llm.generate_stream(prompt):
+            generated_text += str(part)
+            yield part
+        self.cache.store(key, embedding, core.LLMResponse(generated_text))
+
+
+class AsyncCachedLLM(core.AbstractAsyncLLM):
+    """Answer repeated questions from a cache instead of an async LLM
+
+    Cache lookups may embed the question, so they run in a worker
+    thread, as do stores. See AnswerCache for the options.
+    """
+
+    def __init__(self, llm: core.AbstractAsyncLLM, *args, **kwargs):
+        self._llm = llm
+        self.cache = AnswerCache(*args, **kwargs)
+
+    @property
+    def stats(self) -> AnswerCacheStats:
+        return self.cache.stats
+
+    async def generate(self, prompt):
+        key, embedding, response = await asyncio.to_thread(
+            self.cache.lookup, prompt.query
+        )
+        if response is None:
+            response = await self._llm.generate(prompt)
+            await asyncio.to_thread(self.cache.store, key, embedding, response)
+        return response
+
+    async def generate_stream(self, prompt):
+        key, embedding, response = await asyncio.to_thread(
+            self.cache.lookup, prompt.query
+        )
+        if response is not None:
+            yield response
+            return
+        generated_text = ""
+        async for part in self._llm.generate_stream(prompt):
+            generated_text += str(part)
+            yield part
+        await asyncio.to_thread(
+            self.cache.store, key, embedding, core.LLMResponse(generated_text)
+        )
+
+
+class CoalescingLLM(core.AbstractAsyncLLM):
+    """Share one generation between identical prompts in flight
+
+    A prompt that is already being answered waits for that answer, or
+    follows that stream from its first part, instead of asking the LLM
+    again. Answers are not kept once complete.
+    """
+
+    def __init__(self, llm: core.AbstractAsyncLLM):
+        self._llm = llm
+        self._generations: dict[str, asyncio.Future] = {}
+        self._streams: dict[str, _SharedStream] = {}
+        self.coalesced = 0
+
+    async def generate(self, prompt):
+        key = str(prompt)
+        generation = self._generations.get(key)
+        if generation is None:
+            generation = asyncio.ensure_future(self._llm.generate(prompt))
+            self._generations[key] = generation
+            generation.add_done_callback(
+                lambda _: self._generations.pop(key, None)
+            )
+        else:
+            self._count_coalesced()
+        # one waiter giving up does not cancel the others' answer
+        return await asyncio.shield(generation)
+
+    async def generate_stream(self, prompt):
+        key = str(prompt)
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = _SharedStream(self._llm.generate_stream(prompt))
+            self._streams[key] = stream
+            stream.task.add_done_callback(
+                lambda _: self._streams.pop(key, None)
+            )
+        else:
+            self._count_coalesced()
+        async for part in stream.parts():
+            yield part
+
+    def _count_coalesced(self):
+        self.coalesced += 1
+        instrumentation.increment("coalesced_generations")
+
+
+class _SharedStream:
+    # pylint: disable=too-few-public-methods
+    """Parts of a stream, read once and replayed to each follower"""
+
+    def __init__(self, parts: AsyncIterator[core.LLMResponse]):
+        self._parts: list[core.LLMResponse] = []
+        self._done = False
+        self._error: Exception | None = None
+        self._changed = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._read(parts))
+
+    async def parts(self) -> AsyncIterator[core.LLMResponse]:
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: position < len(self._parts) or self._done
+                )
+                new_parts = self._parts[position:]
+                done = self._done
+            for part in new_parts:
+                yield part
+            position += len(new_parts)
+            if done:
+                if self._error is not None:
+                    raise self._error
+                return
+
+    async def _read(self, parts):
+        try:
+            async for part in parts:
+                async with self._changed:
+                    self._parts.append(part)
+                    self._changed.notify_all()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # raised to every follower instead
+            self._error = e
+        finally:
+            async with self._changed:
+                self._done = True
+                self._changed.notify_all()
+
+
+def normalize_query(query: core.Query) -> str:
+    """Case-fold a query and strip surrounding punctuation and whitespace"""
+    text = re.sub(r"\s+", " ", str(query)).strip(" ?!.,;:").casefold()
+    return text
+
+
+def _results_key(query: core.Query, num_results: int):
+    corpora = None if query.corpora is None else tuple(sorted(query.corpora))
+    return str(query), corpora, num_results
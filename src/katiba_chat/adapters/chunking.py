@@ -0,0 +1,133 @@
+"""Clause level retrieval
+
+Articles are split into clause passages, which are indexed as records
+of their own by the usual lexical and semantic indexes. Search results
+are reassembled into articles holding only the clauses that matched.
+"""
+
+import dataclasses
+import json
+import logging
+import pathlib
+from collections.abc import Iterable
+
+from .. import core
+from . import files
+from .retrieval import FileSystemPath
+
+log = logging.getLogger(__name__)
+
+# passage numbers are the article number times this plus the position of
+# the passage in the article, so they stay put when other articles change
+PASSAGE_NUMBER_STRIDE = 1000
+
+
+def passage_number(clause: core.Clause) -> int:
+    if not 0 <= clause.position < PASSAGE_NUMBER_STRIDE:
+        raise ValueError(
+            f"Article {clause.article_number} has more than "
+            f"{PASSAGE_NUMBER_STRIDE} passages"
+        )
+    return clause.article_number * PASSAGE_NUMBER_STRIDE + clause.position
+
+
+def clause_of(passage: core.Article) -> core.Clause:
+    """The clause held by a passage record found by a search"""
+    article_number, position = divmod(passage.number, PASSAGE_NUMBER_STRIDE)
+    return core.Clause(article_number, position, passage.clauses)
+
+
+def passage_records(
+    articles: Iterable[dict], max_chars: int = 1000
+) -> list[dict]:
+    """Article records with one record per clause passage
+
+    Each passage keeps the title, chapter and part of its article, with
+    the article number and passage position encoded in its number.
+    """
+    records = []
+    for data in articles:
+        article = core.Article(**data)
+        for clause in core.split_clauses(article, max_chars):
+            passage = dataclasses.replace(
+                article, clauses=clause.text, number=passage_number(clause)
+            )
+            records.append(dataclasses.asdict(passage))
+    return records
+
+
+def write_passages(
+    data_path: FileSystemPath,
+    destination: FileSystemPath,
+    max_chars: int = 1000,
+) -> pathlib.Path:
+    """Write the passages of the articles at `data_path` to `destination`
+
+    The file is only replaced when its passages change, so indexes of it
+    are not updated needlessly.
+    """
+    destination = pathlib.Path(destination)
+    with open(data_path, "rt") as data:
+        records = passage_records(json.load(data), max_chars)
+    try:
+        with open(destination, "rt") as existing:
+            if json.load(existing) == records:
+                return destination
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    log.info("Writing %d clause passages to: %s", len(records), destination)
+    files.write_json(destination, records)
+    return destination
+
+
+class ClauseIndex(core.AbstractIndex):
+    """Search clause passages, returning articles with the best clauses
+
+    `passage_index` is an index of the records made by `passage_records`.
+    Each search fetches `candidate_depth` passages per requested result
+    and groups them by article. Articles are ranked by their best
+    passage and hold only their matching clauses, in article order.
+    """
+
+    def __init__(
+        self,
+        passage_index: core.AbstractIndex,
+        data_path: FileSystemPath,
+        candidate_depth: int = 3,
+    ):
+        self.passage_index = passage_index
+        self.candidate_depth = candidate_depth
+        with open(data_path, "rt") as f:
+            self._articles = {
+                article.number: article
+                for article in (core.Article(**d) for d in json.load(f))
+            }
+
+    @property
+    def last_search_complete(self) -> bool:
+        return getattr(self.passage_index, "last_search_complete", True)
+
+    def search(self, query, num_results):
+        passages = self.passage_index.search(
+            query, num_results * self.candidate_depth
+        )
+        return self._excerpts(passages, num_results)
+
+    def search_batch(self, queries, num_results):
+        passage_sets = self.passage_index.search_batch(
+            queries, num_results * self.candidate_depth
+        )
+        return [
+            self._excerpts(passages, num_results) for passages in passage_sets
+        ]
+
+    def _excerpts(self, passages, num_results):
+        clauses: dict[int, list[core.Clause]] = {}
+        for passage in passages:
+            clause = clause_of(passage)
+            if clause.article_number in self._articles:
+                clauses.setdefault(clause.article_number, []).append(clause)
+        return [
+            core.excerpt(self._articles[number], article_clauses)
+            for number, article_clauses in list(clauses.items())[:num_results]
+        ]
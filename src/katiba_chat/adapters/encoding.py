@@ -0,0 +1,223 @@
+"""Encoding of queries without PyTorch
+
+Sentence Transformers runs its models through PyTorch, whose import and
+inference dominate the cost of encoding a short query on a CPU. Models
+published with an ONNX export, often also quantized to int8, can be run
+with ONNX Runtime and the tokenizers library instead, without importing
+PyTorch. katiba_chat.bench.encoders measures how load time, latency and
+embeddings compare on a given machine.
+"""
+
+import dataclasses
+import itertools
+import json
+import logging
+import pathlib
+from collections.abc import Sequence
+from typing import Any, Protocol
+
+import numpy
+
+log = logging.getLogger(__name__)
+
+# quantized to int8 for x86 CPUs with AVX2, which nearly all servers have
+DEFAULT_ONNX_FILE = "onnx/model_quint8_avx2.onnx"
+POOLING_MODES = ("cls", "mean", "max")
+
+
+class Encoder(Protocol):
+    # pylint: disable=too-few-public-methods
+    """Embeds texts like SentenceTransformer.encode
+
+    One text is embedded as a vector, and a list of texts as a matrix
+    """
+
+    def encode(self, texts, /, *args, **kwargs) -> Any: ...
+
+
+class OnnxEncoder:
+    """Encode texts with an ONNX model of Sentence Transformers
+
+    `session` runs the transformer over the ids and masks of texts cut
+    short by `tokenizer`, and the token embeddings are pooled by
+    `pooling`, one of cls, mean or max, then normalized if `normalize`.
+    `identity` tells apart the embeddings of different ONNX files. Use
+    `from_pretrained` to load the model and its settings.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        tokenizer,
+        session,
+        pooling: str = "mean",
+        normalize: bool = False,
+        identity: str = "onnx",
+    ):
+        if pooling not in POOLING_MODES:
+            raise ValueError(f"Unsupported pooling: {pooling}")
+        self.tokenizer = tokenizer
+        self.session = session
+        self.pooling = pooling
+        self.normalize = normalize
+        self.identity = identity
+        self._input_names = [i.name for i in session.get_inputs()]
+
+    @classmethod
+    def from_pretrained(
+        cls,
+        model_name: str,
+        file_name: str = DEFAULT_ONNX_FILE,
+        num_threads: int | None = None,
+    ) -> "OnnxEncoder":
+        """Load the named model from a directory or the Hugging Face Hub
+
+        `file_name` is the ONNX file of the model to run, by default its
+        int8 quantization. ONNX Runtime uses `num_threads` threads per
+        encoding, or as many as there are cores.
+        """
+        # importing on demand, as these are optional dependencies
+        # pylint: disable=import-outside-toplevel
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_file = _model_file_getter(model_name)
+        modules = json.loads(model_file("modules.json").read_text())
+        module_paths = {
+            m["type"].rsplit(".", 1)[-1]: m["path"] for m in modules
+        }
+        settings = json.loads(
+            model_file("sentence_bert_config.json").read_text()
+        )
+        pooling_settings = json.loads(
+            model_file(f"{module_paths['Pooling']}/config.json").read_text()
+        )
+        pooling = [
+            mode
+            for mode in POOLING_MODES
+            if pooling_settings.get(f"pooling_mode_{mode}_token")
+            or pooling_settings.get(f"pooling_mode_{mode}_tokens")
+        ]
+        if len(pooling) != 1:
+            raise ValueError(f"Unsupported pooling of model: {model_name}")
+
+        tokenizer = Tokenizer.from_file(str(model_file("tokenizer.json")))
+        tokenizer.enable_truncation(settings["max_seq_length"])
+        if tokenizer.padding is None:
+            tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        session = onnxruntime.InferenceSession(
+            str(model_file(file_name)),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+        log.info("Loaded %s of %s", file_name, model_name)
+        return cls(
+            tokenizer,
+            session,
+            pooling=pooling[0],
+            normalize="Normalize" in module_paths,
+            identity=f"onnx:{file_name}",
+        )
+
+    def encode(
+        self,
+        sentences: str | Sequence[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        **kwargs,
+    ) -> numpy.ndarray:
+        """Embed a text as a vector, or a list of texts as a matrix
+
+        Texts are encoded `batch_size` at a time. Other keyword
+        arguments of SentenceTransformer.encode are accepted but ignored.
+        """
+        # pylint: disable=unused-argument
+        if isinstance(sentences, str):
+            embeddings = self.encode([sentences], 1, normalize_embeddings)
+            return embeddings[0]
+        # texts of similar length are batched, keeping padding short
+        order = sorted(range(len(sentences)), key=lambda i: -len(sentences[i]))
+        positions = iter(order)
+        batches = []
+        while batch := list(itertools.islice(positions, batch_size)):
+            batches.append(self._encode_batch([sentences[i] for i in batch]))
+        if not batches:
+            return numpy.empty((0, 0), dtype=numpy.float32)
+        embeddings = numpy.concatenate(batches)[numpy.argsort(order)]
+        if self.normalize or normalize_embeddings:
+            embeddings /= numpy.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+    def _encode_batch(self, texts: list[str]) -> numpy.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": [e.ids for e in encodings],
+            "attention_mask": [e.attention_mask for e in encodings],
+            "token_type_ids": [e.type_ids for e in encodings],
+        }
+        feeds = {
+            name: numpy.array(inputs[name], dtype=numpy.int64)
+            for name in self._input_names
+        }
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = numpy.array(inputs["attention_mask"], dtype=numpy.float32)
+        return pool(token_embeddings, mask, self.pooling)
+
+
+def encoder_identity(encoder: Encoder) -> str | None:
+    """Identify the backend of `encoder`, None for Sentence Transformers"""
+    return getattr(encoder, "identity", None)
+
+
+@dataclasses.dataclass
+class EncoderParity:
+    """Cosine similarities of the embeddings of two encoders"""
+
+    min_similarity: float
+    mean_similarity: float
+
+    def __str__(self):
+        return (
+            f"cosine similarity min {self.min_similarity:.4f}, "
+            f"mean {self.mean_similarity:.4f}"
+        )
+
+
+def encoder_parity(
+    reference: Encoder, candidate: Encoder, texts: Sequence[str]
+) -> EncoderParity:
+    """Compare the embeddings of `texts` by `candidate` to `reference`"""
+    expected = reference.encode(list(texts), normalize_embeddings=True)
+    actual = candidate.encode(list(texts), normalize_embeddings=True)
+    similarities = numpy.sum(expected * actual, axis=1)
+    return EncoderParity(float(similarities.min()), float(similarities.mean()))
+
+
+def pool(
+    token_embeddings: numpy.ndarray, mask: numpy.ndarray, pooling: str
+) -> numpy.ndarray:
+    """Pool the embeddings of the tokens of each text left unmasked"""
+    if pooling == "cls":
+        return token_embeddings[:, 0]
+    mask = mask[:, :, numpy.newaxis]
+    if pooling == "max":
+        return numpy.where(mask > 0, token_embeddings, -numpy.inf).max(axis=1)
+    return (token_embeddings * mask).sum(axis=1) / numpy.maximum(
+        mask.sum(axis=1), 1e-9
+    )
+
+
+def _model_file_getter(model_name: str):
+    """Get the paths of files of the named model, downloading if needed"""
+    if pathlib.Path(model_name).is_dir():
+        return lambda file_name: pathlib.Path(model_name) / file_name
+
+    # pylint: disable=import-outside-toplevel
+    from huggingface_hub import hf_hub_download
+
+    def model_file(file_name: str) -> pathlib.Path:
+        return pathlib.Path(hf_hub_download(model_name, file_name))
+
+    return model_file
@@ -0,0 +1,67 @@
+"""Writing of files that readers never see partially written
+
+Each file is written to a temporary file next to it, which then replaces
+it in one rename, so a crash or a concurrent reader finds either the
+previous file or the new one whole. The data is synced to disk before
+the rename, and the new file keeps the permissions of the one it
+replaces, or those the umask gives a new file.
+"""
+
+import contextlib
+import json
+import os
+import pathlib
+import stat
+import tempfile
+from collections.abc import Iterator
+from typing import IO, Any
+
+import numpy
+
+# Read once, as setting the umask to read it is not thread-safe
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextlib.contextmanager
+def replacing(path: str | pathlib.Path, mode: str = "wt") -> Iterator[IO]:
+    """Open a temporary file that replaces `path` once written
+
+    If writing fails, the temporary file is removed and any previous
+    file at `path` is left as it was.
+    """
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        mode, dir=path.parent, suffix=".tmp", delete=False
+    ) as f:
+        try:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+            os.chmod(f.name, _mode_for(path))
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, path)
+
+
+def _mode_for(path: pathlib.Path) -> int:
+    """Permissions for a file replacing `path`"""
+    try:
+        return stat.S_IMODE(path.stat().st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def write_json(path: str | pathlib.Path, data: Any):
+    """Write `data` as JSON to `path`, replacing any previous file whole"""
+    with replacing(path) as f:
+        json.dump(data, f)
+
+
+def save_array(path: str | pathlib.Path, array: numpy.ndarray):
+    """Save `array` to `path`, replacing any previous file whole"""
+    with replacing(path, "wb") as f:
+        numpy.save(f, array)
@@ -0,0 +1,144 @@
+"""Fusion of the ranked results of several search backends
+
+Each backend's results are given as an array of article numbers, best
+first, with an array of the backend's scores for them. A fusion
+strategy combines them into one ranking of article numbers.
+"""
+
+from collections.abc import Mapping
+from typing import Protocol
+
+import numpy
+
+# article numbers and backend scores, best first
+RankedIds = tuple[numpy.ndarray, numpy.ndarray]
+
+NORMALIZATIONS = ("zscore", "minmax")
+
+
+class FusionStrategy(Protocol):
+    # pylint: disable=too-few-public-methods
+    def fuse(self, result_sets: Mapping[str, RankedIds]) -> RankedIds:
+        """Rank the article numbers found by the named backends"""
+
+
+class ReciprocalRankFusion(FusionStrategy):
+    # pylint: disable=too-few-public-methods
+    """Score each article by the sum of 1 / (k + rank) over backends
+
+    Only ranks are used, so backends with incomparable scores combine
+    well. A larger `k` flattens the advantage of the top ranks.
+    """
+
+    def __init__(
+        self, k: float = 60, weights: Mapping[str, float] | None = None
+    ):
+        self.k = k
+        self.weights = dict(weights or {})
+
+    def fuse(self, result_sets):
+        contributions = {
+            name: self.weights.get(name, 1.0)
+            / (self.k + numpy.arange(1, len(ids) + 1))
+            for name, (ids, _) in result_sets.items()
+        }
+        return _combine(result_sets, contributions)
+
+
+class WeightedScoreFusion(FusionStrategy):
+    # pylint: disable=too-few-public-methods
+    """Score each article by the weighted sum of its normalized scores
+
+    Each backend's scores are normalized over its results, by z-score
+    or into [0, 1] by min-max, before weighting with `weights` by
+    backend name. Backends without a weight count once.
+    """
+
+    def __init__(
+        self,
+        weights: Mapping[str, float] | None = None,
+        normalization: str = "zscore",
+    ):
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"Unsupported normalization: {normalization}")
+        self.weights = dict(weights or {})
+        self.normalization = normalization
+
+    def fuse(self, result_sets):
+        normalize = _zscore if self.normalization == "zscore" else _minmax
+        contributions = {
+            name: self.weights.get(name, 1.0) * normalize(scores)
+            for name, (_, scores) in result_sets.items()
+        }
+        return _combine(result_sets, contributions)
+
+
+class ConvexCombination(WeightedScoreFusion):
+    # pylint: disable=too-few-public-methods
+    """Mix min-max normalized semantic and lexical scores
+
+    Articles score `alpha` times their semantic score plus `1 - alpha`
+    times their lexical score.
+    """
+
+    def __init__(self, alpha: float = 0.5):
+        if not 0 <= alpha <= 1:
+            raise ValueError(f"alpha must be between 0 and 1: {alpha}")
+        super().__init__(
+            {"semantic": alpha, "lexical": 1 - alpha}, normalization="minmax"
+        )
+        self.alpha = alpha
+
+
+def fusion_strategy(name: str, **options) -> FusionStrategy:
+    """Create the fusion strategy called `name` with `options`"""
+    strategies: dict[str, type[FusionStrategy]] = {
+        "rrf": ReciprocalRankFusion,
+        "weighted": WeightedScoreFusion,
+        "convex": ConvexCombination,
+    }
+    try:
+        strategy_cls = strategies[name]
+    except KeyError:
+        raise ValueError(f"Unknown fusion strategy: {name}") from None
+    return strategy_cls(**options)
+
+
+def _combine(
+    result_sets: Mapping[str, RankedIds],
+    contributions: Mapping[str, numpy.ndarray],
+) -> RankedIds:
+    """Sum the contributions to each article and rank them
+
+    Ties are broken by the order in which articles first appear
+    """
+    if not result_sets:
+        return numpy.empty(0, dtype=numpy.int64), numpy.empty(0)
+    ids = numpy.concatenate([ids for ids, _ in result_sets.values()])
+    weights = numpy.concatenate([contributions[n] for n in result_sets])
+    unique_ids, first_seen, inverse = numpy.unique(
+        ids, return_index=True, return_inverse=True
+    )
+    scores = numpy.bincount(inverse, weights=weights)
+    order = numpy.lexsort((first_seen, -scores))
+    return unique_ids[order], scores[order]
+
+
+def _zscore(scores: numpy.ndarray) -> numpy.ndarray:
+    scores = numpy.asarray(scores, dtype=numpy.float64)
+    if len(scores) == 0:
+        return scores
+    spread = scores.std()
+    if spread == 0:
+        return numpy.zeros_like(scores)
+    return (scores - scores.mean()) / spread
+
+
+def _minmax(scores: numpy.ndarray) -> numpy.ndarray:
+    scores = numpy.asarray(scores, dtype=numpy.float64)
+    if len(scores) == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return numpy.ones_like(scores)
+    return (scores - low) / (high - low)
@@ -1,27 +1,80 @@
 """Generation Adapters"""
 
-from openai import OpenAI
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import openai
 
 from .. import core
+from ..core import instrumentation
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
 
 
 class OpenAICompatibleLLM(core.AbstractLLM):
 
-    OPENAI_BASE_URL = "https://api.openai.com/v1"
+    OPENAI_BASE_URL = OPENAI_BASE_URL
 
     def __init__(
-        self, model_name: str, api_key, base_url: str = OPENAI_BASE_URL
+        self,
+        model_name: str,
+        api_key,
+        base_url: str = OPENAI_BASE_URL,
+        client: openai.OpenAI | None = None,
     ):
         self.model_name = model_name
-        self.client = OpenAI(base_url=base_url, api_key=api_key)
+        self.client = client or openai.OpenAI(
+            base_url=base_url, api_key=api_key
+        )
+
+    @classmethod
+    def pooled(
+        cls,
+        model_name: str,
+        api_key,
+        base_url: str = OPENAI_BASE_URL,
+        **client_options,
+    ):
+        """Create an LLM that uses the process-wide client
+
+        See `pooled_client` for the accepted client options
+        """
+        client = pooled_client(api_key, base_url, **client_options)
+        return cls(model_name, api_key, base_url, client=client)
 
     def generate(self, prompt):
         request_args = self.format_completions_request(
             self.model_name, str(prompt)
         )
         response = self.client.chat.completions.create(**request_args)
-        generated_text = response.choices[0].message.content
-        return core.LLMResponse(generated_text)
+        _count_tokens(response)
+        return core.LLMResponse(response.choices[0].message.content)
+
+    def generate_batch(self, prompts, max_concurrency: int = 8):
+        """Generate responses, keeping `max_concurrency` requests in flight"""
+        with ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="generate-batch"
+        ) as executor:
+            return list(executor.map(self.generate, prompts))
+
+    def generate_stream(self, prompt):
+        prompt_text = str(prompt)
+        request_args = self.format_completions_request(
+            self.model_name, prompt_text
+        )
+        generated_parts = []
+        with self.client.chat.completions.create(
+            stream=True, **request_args
+        ) as stream:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                generated_text = chunk.choices[0].delta.content
+                if generated_text:
+                    generated_parts.append(generated_text)
+                    yield core.LLMResponse(generated_text)
+        _count_streamed_tokens(prompt_text, generated_parts)
 
     @staticmethod
     def format_completions_request(model_name: str, prompt: str):
@@ -29,3 +82,159 @@ class OpenAICompatibleLLM(core.AbstractLLM):
             "model": model_name,
             "messages": [{"role": "user", "content": prompt}],
         }
+
+
+class AsyncOpenAICompatibleLLM(core.AbstractAsyncLLM):
+    """Generate without blocking the event loop while waiting on the LLM"""
+
+    def __init__(
+        self,
+        model_name: str,
+        api_key,
+        base_url: str = OPENAI_BASE_URL,
+        client: openai.AsyncOpenAI | None = None,
+    ):
+        self.model_name = model_name
+        self.client = client or openai.AsyncOpenAI(
+            base_url=base_url, api_key=api_key
+        )
+
+    @classmethod
+    def pooled(
+        cls,
+        model_name: str,
+        api_key,
+        base_url: str = OPENAI_BASE_URL,
+        **client_options,
+    ):
+        """Create an LLM that uses the process-wide async client
+
+        See `pooled_client` for the accepted client options
+        """
+        client = pooled_async_client(api_key, base_url, **client_options)
+        return cls(model_name, api_key, base_url, client=client)
+
+    async def generate(self, prompt):
+        request_args = OpenAICompatibleLLM.format_completions_request(
+            self.model_name, str(prompt)
+        )
+        response = await self.client.chat.completions.create(**request_args)
+        _count_tokens(response)
+        return core.LLMResponse(response.choices[0].message.content)
+
+    async def generate_stream(self, prompt):
+        prompt_text = str(prompt)
+        request_args = OpenAICompatibleLLM.format_completions_request(
+            self.model_name, prompt_text
+        )
+        generated_parts = []
+        stream = await self.client.chat.completions.create(
+            stream=True, **request_args
+        )
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                generated_text = chunk.choices[0].delta.content
+                if generated_text:
+                    generated_parts.append(generated_text)
+                    yield core.LLMResponse(generated_text)
+        _count_streamed_tokens(prompt_text, generated_parts)
+
+
+def _count_tokens(response):
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        instrumentation.increment(
+            "llm_tokens", usage.prompt_tokens, kind="prompt"
+        )
+        instrumentation.increment(
+            "llm_tokens", usage.completion_tokens, kind="completion"
+        )
+
+
+def _count_streamed_tokens(prompt_text: str, generated_parts: list[str]):
+    # usage is not sent with every provider's streams, so the tokens of
+    # streamed answers are estimated
+    if not instrumentation.enabled():
+        return
+    instrumentation.increment(
+        "llm_tokens", core.estimate_tokens(prompt_text), kind="prompt"
+    )
+    instrumentation.increment(
+        "llm_tokens",
+        core.estimate_tokens("".join(generated_parts)),
+        kind="completion",
+    )
+
+
+def _limits(
+    max_connections: int, max_keepalive_connections: int, keepalive_expiry
+):
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+@functools.cache
+def pooled_client(  # pylint: disable=too-many-arguments
+    api_key,
+    base_url: str = OPENAI_BASE_URL,
+    *,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    max_retries: int = 3,
+    timeout: float = 600.0,
+) -> openai.OpenAI:
+    """Get the process-wide client for a provider
+
+    Calls with the same arguments share one client, and with it one HTTP
+    connection pool whose idle connections are kept alive for
+    `keepalive_expiry` seconds. Requests that fail with a 429 or 5xx
+    response are retried with exponential backoff up to `max_retries`
+    times.
+    """
+    http_client = openai.DefaultHttpxClient(
+        limits=_limits(
+            max_connections, max_keepalive_connections, keepalive_expiry
+        ),
+    )
+    return openai.OpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        max_retries=max_retries,
+        timeout=timeout,
+        http_client=http_client,
+    )
+
+
+@functools.cache
+def pooled_async_client(  # pylint: disable=too-many-arguments
+    api_key,
+    base_url: str = OPENAI_BASE_URL,
+    *,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    max_retries: int = 3,
+    timeout: float = 600.0,
+) -> openai.AsyncOpenAI:
+    """Get the process-wide async client for a provider
+
+    Like `pooled_client`, for use from one event loop
+    """
+    http_client = openai.DefaultAsyncHttpxClient(
+        limits=_limits(
+            max_connections, max_keepalive_connections, keepalive_expiry
+        ),
+    )
+    return openai.AsyncOpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        max_retries=max_retries,
+        timeout=timeout,
+        http_client=http_client,
+    )
@@ -0,0 +1,253 @@
+"""Offline creation of the search indexes
+
+Indexes are built into a temporary directory next to their destination
+and swapped in once complete, so a serving process never sees a
+partially built index.
+"""
+
+import contextlib
+import dataclasses
+import itertools
+import logging
+import multiprocessing
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from .. import core
+from . import retrieval
+from .encoding import Encoder, encoder_identity
+from .manifest import IndexManifest, article_key, content_hash, iter_articles
+
+log = logging.getLogger(__name__)
+
+# model loaded by each embedding worker process
+_worker_model = None  # pylint: disable=invalid-name
+
+
+@dataclasses.dataclass
+class BuildReport:
+    name: str
+    num_articles: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """Articles indexed per second"""
+        return self.num_articles / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.name}: {self.num_articles} articles in "
+            f"{self.seconds:.2f}s ({self.throughput:.1f} articles/s)"
+        )
+
+
+def build_lexical_index(
+    data_path: retrieval.FileSystemPath,
+    destination: retrieval.FileSystemPath,
+    procs: int = 1,
+    limitmb: int = 128,
+    index_cls: type[retrieval.WhooshIndex] = retrieval.WhooshIndex,
+) -> BuildReport:
+    """Index the articles at `data_path` with Whoosh
+
+    With `procs` above one, documents are indexed by that many processes,
+    each writing its own segment. `limitmb` is the memory each of them
+    may use while indexing.
+    """
+    start = time.perf_counter()
+    with _replacing_directory(destination) as build_dir:
+        num_articles = index_cls.create(
+            build_dir,
+            iter_articles(data_path),
+            procs=procs,
+            multisegment=procs > 1,
+            limitmb=limitmb,
+        )
+    return BuildReport(
+        "lexical index", num_articles, time.perf_counter() - start
+    )
+
+
+def build_semantic_index(  # pylint: disable=too-many-arguments
+    data_path: retrieval.FileSystemPath,
+    destination: retrieval.FileSystemPath,
+    model_name: str = retrieval.DEFAULT_ST_MODELNAME,
+    *,
+    batch_size: int = 64,
+    workers: int = 1,
+    index_cls: type[
+        retrieval.SentenceTransformersIndex
+    ] = retrieval.SentenceTransformersIndex,
+    index_options: dict | None = None,
+    encoder: Encoder | None = None,
+) -> BuildReport:
+    """Embed the articles at `data_path` in batches of `batch_size`
+
+    Articles are read and embedded one batch at a time, keeping only
+    their numbers and content hashes besides the embeddings. They are
+    embedded by `encoder`, by default the Sentence
+    Transformers model named `model_name`. With `workers` above one, that
+    model embeds batches in as many processes, each with its own copy.
+    The finished index is opened once with `index_cls` and
+    `index_options` to derive the files it searches, such as normalized
+    embeddings.
+    """
+    start = time.perf_counter()
+    with _replacing_directory(destination) as build_dir:
+        hashes: dict[str, str] = {}
+        numbers: list[int] = []
+
+        def texts():
+            for data in iter_articles(data_path):
+                record = retrieval.article_record(data)
+                hashes[article_key(record)] = content_hash(record)
+                numbers.append(record["number"])
+                yield str(core.Article(**data))
+
+        # loaded once, for embedding here and opening the index
+        if encoder is None:
+            model = _load_model(model_name)
+        else:
+            model, workers = encoder, 1
+        embeddings = list(
+            _encode_batches(
+                model, model_name, _batched(texts(), batch_size), workers
+            )
+        )
+        retrieval.SentenceTransformersIndex.save_index(
+            build_dir,
+            IndexManifest(hashes, model_name, encoder_identity(model)),
+            numpy.array(numbers, dtype=numpy.int64),
+            numpy.concatenate(embeddings),
+        )
+        log.info(
+            "Embedded %d articles in %.2fs",
+            len(numbers),
+            time.perf_counter() - start,
+        )
+        index_cls(
+            data_path,
+            build_dir,
+            model_name=model_name,
+            encoder=model,
+            **index_options or {},
+        )
+    return BuildReport(
+        "semantic index", len(numbers), time.perf_counter() - start
+    )
+
+
+def _load_model(model_name: str):
+    # importing on demand because load time can be quite slow
+    # pylint: disable=import-outside-toplevel
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+def _encode_batches(
+    model, model_name: str, batches: Iterable[list[str]], workers: int
+) -> Iterator[numpy.ndarray]:
+    """Encode batches with `model`, or `workers` processes loading it"""
+    if workers <= 1:
+        for batch in batches:
+            yield _encode(model, batch)
+        return
+
+    # forking after torch has started its threads can deadlock
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_load_worker_model,
+        initargs=(model_name, workers),
+    ) as executor:
+        yield from executor.map(_encode_in_worker, batches)
+
+
+def _load_worker_model(model_name: str, workers: int):
+    # pylint: disable=global-statement,import-outside-toplevel
+    global _worker_model
+    import torch
+
+    # share the cores between the workers rather than oversubscribe them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+    _worker_model = _load_model(model_name)
+
+
+def _encode_in_worker(batch: list[str]) -> numpy.ndarray:
+    assert _worker_model is not None
+    return _encode(_worker_model, batch)
+
+
+def _encode(model, batch: list[str]) -> numpy.ndarray:
+    # progress is reported per build rather than per batch
+    return model.encode(batch, batch_size=len(batch), show_progress_bar=False)
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+@contextlib.contextmanager
+def _replacing_directory(destination: retrieval.FileSystemPath):
+    """Build in a new directory that then replaces `destination`
+
+    `destination` is a symbolic link to the directory of the latest
+    build, replaced atomically so that the index is never missing. The
+    directory of the previous build is kept until the next one replaces
+    the latest, as processes that opened it may still read its files.
+    An index built before builds were linked is moved aside first, so
+    it is briefly missing that one time.
+
+    Symbolic links need extra privileges on Windows, where builds are
+    not supported.
+    """
+    destination = pathlib.Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    build_dir = pathlib.Path(
+        tempfile.mkdtemp(
+            prefix=f".{destination.name}.build-", dir=destination.parent
+        )
+    )
+    built = False
+    try:
+        yield build_dir
+        built = True
+    finally:
+        if not built:
+            shutil.rmtree(build_dir, ignore_errors=True)
+    build_dir.chmod(0o755)
+    latest = build_dir.rename(_generation_dir(destination))
+    previous = None
+    if destination.is_symlink():
+        previous = destination.parent / os.readlink(destination)
+    elif destination.exists():
+        previous = destination.rename(_generation_dir(destination))
+    link = destination.with_name(
+        f".{destination.name}.link-{uuid.uuid4().hex}"
+    )
+    link.symlink_to(latest.name, target_is_directory=True)
+    os.replace(link, destination)
+    log.info("Replaced index at: %s", destination)
+    # older builds, leaving alone any build still in progress
+    for path in destination.parent.glob(f".{destination.name}.*"):
+        in_progress = path.name.startswith(f".{destination.name}.build-")
+        if in_progress or path.is_symlink() or path in (latest, previous):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _generation_dir(destination: pathlib.Path) -> pathlib.Path:
+    """A new name for a directory of a build of `destination`"""
+    return destination.with_name(f".{destination.name}.gen-{uuid.uuid4().hex}")
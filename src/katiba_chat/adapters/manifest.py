@@ -0,0 +1,142 @@
+"""Manifests recording the article data an index was built from"""
+
+import dataclasses
+import hashlib
+import json
+import pathlib
+from collections.abc import Iterable, Iterator
+from typing import ClassVar
+
+from . import files
+
+MANIFEST_VERSION = 1
+
+
+def article_key(article: dict) -> str:
+    """Identify an article across versions of the data by its number"""
+    return str(article["number"])
+
+
+def content_hash(article: dict) -> str:
+    """Hash the fields of an article, independent of their order"""
+    canonical = json.dumps(article, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def iter_articles(
+    data_path: str | pathlib.Path, chunk_size: int = 1 << 16
+) -> Iterator[dict]:
+    """Read the articles of a JSON array one at a time
+
+    The file is read in chunks of `chunk_size` characters, so the whole
+    of it is never held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(data_path, "rt") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"Expected a JSON array in {data_path}")
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().removeprefix(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                article, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            yield article
+            buffer = buffer[end:]
+
+
+@dataclasses.dataclass(frozen=True)
+class ManifestChanges:
+    added: list[str]
+    changed: list[str]
+    removed: list[str]
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    @property
+    def updated(self) -> list[str]:
+        """Keys of the articles that need to be indexed again"""
+        return self.added + self.changed
+
+
+@dataclasses.dataclass
+class IndexManifest:
+    """Content hashes of the articles in an index, by article key
+
+    `model_name` is the embedding model of a semantic index, if any, and
+    `encoder` identifies the encoder running it, None for the Sentence
+    Transformers one. Indexes built with a different model or encoder
+    cannot be updated in place.
+    """
+
+    FILENAME: ClassVar[str] = "manifest.json"
+
+    hashes: dict[str, str]
+    model_name: str | None = None
+    encoder: str | None = None
+
+    @classmethod
+    def from_articles(
+        cls,
+        articles: Iterable[dict],
+        model_name: str | None = None,
+        encoder: str | None = None,
+    ):
+        hashes = {article_key(a): content_hash(a) for a in articles}
+        return cls(hashes, model_name, encoder)
+
+    @classmethod
+    def load(cls, directory: str | pathlib.Path):
+        """Read the manifest saved in `directory`, None if there is none"""
+        path = pathlib.Path(directory) / cls.FILENAME
+        try:
+            with open(path, "rt") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(data["hashes"], data.get("model_name"), data.get("encoder"))
+
+    def save(self, directory: str | pathlib.Path):
+        """Write the manifest to `directory`, replacing any previous one"""
+        path = pathlib.Path(directory) / self.FILENAME
+        data = {
+            "version": MANIFEST_VERSION,
+            "model_name": self.model_name,
+            "encoder": self.encoder,
+            "hashes": self.hashes,
+        }
+        files.write_json(path, data)
+
+    @property
+    def digest(self) -> str:
+        """Hash of the whole manifest, changing with any article or model"""
+        return content_hash(
+            {
+                "model_name": self.model_name,
+                "encoder": self.encoder,
+                "hashes": self.hashes,
+            }
+        )
+
+    def changes(self, other: "IndexManifest") -> ManifestChanges:
+        """Articles added, changed and removed going from this to `other`"""
+        return ManifestChanges(
+            added=[k for k in other.hashes if k not in self.hashes],
+            changed=[
+                k
+                for k, h in other.hashes.items()
+                if k in self.hashes and self.hashes[k] != h
+            ],
+            removed=[k for k in self.hashes if k not in other.hashes],
+        )
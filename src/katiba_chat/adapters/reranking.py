@@ -0,0 +1,212 @@
+"""Reranking of search results with a cross-encoder
+
+A cross-encoder reads the query and an article together, which ranks
+more precisely than the indexes but is too slow to score every article.
+It is used to reorder the best candidates of a faster index instead.
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+from .. import core
+from ..core import instrumentation
+from .caching import LRUCache
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# scores (query, article text) pairs, higher being more relevant
+PairScorer = Callable[[list[tuple[str, str]]], Sequence[float]]
+
+
+class RerankingIndex(core.AbstractIndex):
+    """Reorder the top candidates of an index with a cross-encoder
+
+    Each search fetches `candidate_depth` results from `index`, at
+    least as many as asked for, and ranks them by the scores of
+    `scorer`, a cross-encoder named `model_name` by default. Pairs are
+    scored `batch_size` at a time and their scores kept in an LRU cache
+    of `cache_size` entries.
+
+    When scoring takes longer than `latency_budget` seconds, the
+    candidates are returned in the order of `index` instead. Scoring
+    stops at the next batch, keeping the scores it made for later
+    searches. Up to `max_concurrency` searches are scored at once,
+    each in a worker thread of its own. Loading the cross-encoder does
+    not count against the budget, but delays the first search unless
+    done ahead of it by `warm_up`.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        index: core.AbstractIndex,
+        *,
+        model_name: str = DEFAULT_CROSS_ENCODER,
+        candidate_depth: int = 20,
+        latency_budget: float | None = None,
+        batch_size: int = 32,
+        cache_size: int = 4096,
+        scorer: PairScorer | None = None,
+        max_concurrency: int = 32,
+    ):
+        self.index = index
+        self.candidate_depth = candidate_depth
+        self.latency_budget = latency_budget
+        self.scores_cache = LRUCache(cache_size, name="rerank_scores")
+        self._scorer = _LazyScorer(model_name, batch_size, scorer)
+        self._executor = (
+            ThreadPoolExecutor(max_concurrency, thread_name_prefix="rerank")
+            if latency_budget is not None
+            else None
+        )
+        self._local = threading.local()
+
+    @property
+    def last_search_complete(self) -> bool:
+        """Whether this thread's last search was fully searched and reranked
+
+        Incomplete results are not memoized by a CachedIndex, so a
+        search that fell back to the first stage order is reranked when
+        repeated.
+        """
+        return self.last_search_reranked and getattr(
+            self.index, "last_search_complete", True
+        )
+
+    @property
+    def last_search_reranked(self) -> bool:
+        """Whether this thread's last search was reranked in its budget"""
+        return getattr(self._local, "reranked", False)
+
+    def warm_up(self):
+        """Load the cross-encoder ahead of the first search"""
+        self._scorer.get()
+
+    def search(self, query, num_results):
+        return self.search_batch([query], num_results)[0]
+
+    def search_batch(self, queries, num_results):
+        candidate_sets = [
+            list(candidates)
+            for candidates in self.index.search_batch(
+                queries, max(num_results, self.candidate_depth)
+            )
+        ]
+        pairs = [
+            (str(query), str(article))
+            for query, candidates in zip(queries, candidate_sets)
+            for article in candidates
+        ]
+        with instrumentation.span("rerank", num_pairs=len(pairs)):
+            scores = self._scores(pairs)
+        self._local.reranked = scores is not None
+        if scores is None:
+            instrumentation.increment("rerank_fallbacks")
+            log.warning(
+                "Reranking exceeded its %ss budget, keeping the first "
+                "stage order",
+                self.latency_budget,
+            )
+            return [candidates[:num_results] for candidates in candidate_sets]
+
+        results = []
+        offsets = numpy.cumsum([len(c) for c in candidate_sets])[:-1]
+        for candidates, candidate_scores in zip(
+            candidate_sets, numpy.split(scores, offsets)
+        ):
+            # stable, so that ties keep the order of the first stage
+            order = numpy.argsort(-candidate_scores, kind="stable")
+            results.append([candidates[i] for i in order[:num_results]])
+        return results
+
+    def _scores(self, pairs: list[tuple[str, str]]) -> numpy.ndarray | None:
+        """Scores of `pairs`, or None if they took longer than the budget"""
+        scores = numpy.array(
+            [self.scores_cache.get(pair, numpy.nan) for pair in pairs],
+            dtype=numpy.float64,
+        )
+        missing = numpy.flatnonzero(numpy.isnan(scores))
+        if len(missing) == 0:
+            return scores
+        missing_pairs = [pairs[i] for i in missing]
+        # loaded before the budget starts, which loading would exceed
+        self._scorer.get()
+        cancelled = threading.Event()
+        if self._executor is None:
+            missing_scores = self._score(missing_pairs, cancelled)
+        else:
+            future = self._executor.submit(
+                self._score, missing_pairs, cancelled
+            )
+            try:
+                missing_scores = future.result(timeout=self.latency_budget)
+            except TimeoutError:
+                cancelled.set()
+                return None
+        scores[missing] = missing_scores
+        return scores
+
+    def _score(
+        self, pairs: list[tuple[str, str]], cancelled: threading.Event
+    ) -> list[float]:
+        """Score `pairs` in batches until done or `cancelled`"""
+        scorer = self._scorer.get()
+        batch_size = self._scorer.batch_size
+        scores: list[float] = []
+        for start in range(0, len(pairs), batch_size):
+            if cancelled.is_set():
+                break
+            end = start + batch_size
+            batch = pairs[start:end]
+            for pair, score in zip(batch, scorer(batch)):
+                self.scores_cache.put(pair, float(score))
+                scores.append(float(score))
+        return scores
+
+
+class _LazyScorer:
+    # pylint: disable=too-few-public-methods
+    """The cross-encoder `model_name`, loaded on first use unless given"""
+
+    def __init__(
+        self, model_name: str, batch_size: int, scorer: PairScorer | None
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._scorer = scorer
+        self._lock = threading.Lock()
+
+    def get(self) -> PairScorer:
+        with self._lock:
+            if self._scorer is None:
+                self._scorer = _cross_encoder_scorer(
+                    self.model_name, self.batch_size
+                )
+            return self._scorer
+
+
+def _cross_encoder_scorer(model_name: str, batch_size: int) -> PairScorer:
+    # importing on demand because load time can be quite slow
+    # pylint: disable=import-outside-toplevel
+    from sentence_transformers import CrossEncoder
+
+    start = time.perf_counter()
+    model = CrossEncoder(model_name, device="cpu")
+    log.info(
+        "Loaded cross-encoder %s in %.2fs",
+        model_name,
+        time.perf_counter() - start,
+    )
+
+    def score(pairs):
+        return model.predict(
+            pairs, batch_size=batch_size, show_progress_bar=False
+        )
+
+    return score
@@ -1,9 +1,16 @@
 """Retrieval adapters"""
 
+import asyncio
+import contextlib
+import contextvars
 import dataclasses
 import json
 import logging
 import pathlib
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import Executor, ThreadPoolExecutor
 
 import numpy
 from whoosh import fields as F
@@ -11,6 +18,20 @@ from whoosh import index as whoosh_index
 from whoosh import qparser
 
 from .. import core
+from ..core import instrumentation
+from . import caching, files
+from .encoding import Encoder, encoder_identity
+from .fusion import FusionStrategy, ReciprocalRankFusion
+from .manifest import IndexManifest, article_key, content_hash, iter_articles
+from .store import ArticleStore
+from .vectors import (
+    EMBEDDING_DTYPES,
+    NormalizedEmbeddings,
+    normalize,
+    quantize,
+    top_k,
+    top_k_rows,
+)
 
 log = logging.getLogger(__name__)
 
@@ -21,60 +42,286 @@ FileSystemPath = str | pathlib.Path
 class SentenceTransformersIndex(core.AbstractIndex):
     # pylint: disable=too-few-public-methods
 
-    def __init__(
+    EMBEDDINGS_FILENAME = "article_embeddings.npy"
+    NUMBERS_FILENAME = "article_numbers.json"
+
+    def __init__(  # pylint: disable=too-many-arguments
         self,
         data_path: FileSystemPath,
         index_dirname: FileSystemPath,
         model_name: str = DEFAULT_ST_MODELNAME,
+        *,
+        cache_size: int = 1024,
+        embedding_dtype: str = "float32",
+        store: ArticleStore | None = None,
+        encoder: Encoder | None = None,
     ):
-
-        # importing on demand because load time can be quite slow
-        # pylint: disable=import-outside-toplevel
-        from sentence_transformers import SentenceTransformer, util
-
-        self._semantic_search = util.semantic_search
-
-        self._emb_filename = "article_embeddings.npy"
-        self._index_data_filename = "articles.json"
-        self.model = SentenceTransformer(model_name)
-        index_dir = pathlib.Path(index_dirname)
+        """Initialize the index, creating or updating it if necessary
+
+        Only articles added or changed since the index was built are
+        embedded again, going by the content hashes in its manifest.
+        Article embeddings are searched from a normalized copy stored
+        as `embedding_dtype`, one of float32, float16 or int8. The copy
+        is memory-mapped so processes on one machine share its pages,
+        and scored as described in NormalizedEmbeddings.
+
+        Articles found are read from `store`, by default one kept with
+        the index.
+
+        Texts are embedded by `encoder`, by default the Sentence
+        Transformers model named `model_name`. Another encoder must
+        embed like that model, and articles are embedded again when the
+        encoder changes, as it may not embed them identically.
+        """
+        if embedding_dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype: {embedding_dtype}")
+
+        self.model: Encoder
+        if encoder is None:
+            # importing on demand because load time can be quite slow
+            # pylint: disable=import-outside-toplevel
+            from sentence_transformers import SentenceTransformer
+
+            self.model = SentenceTransformer(model_name)
+        else:
+            self.model = encoder
+        self.embedding_cache = caching.LRUCache(
+            cache_size, name="query_embedding"
+        )
+        index_dir = self._index_dir = pathlib.Path(index_dirname)
         data_path = pathlib.Path(data_path)
         _ensure_exists(index_dir)
-        self._create_index_if_missing(data_path, index_dir)
-        self._index_emb = numpy.load(index_dir / self._emb_filename)
-        with open(index_dir / self._index_data_filename, "rt") as f:
-            self._index_data = json.load(f)
+        # article numbers by embedding row
+        self.manifest, self._numbers = self._update_index(
+            data_path, index_dir, model_name
+        )
+        self._embeddings = NormalizedEmbeddings.load(
+            self._normalized_embeddings(index_dir, embedding_dtype)
+        )
+        self.store = store or ArticleStore(
+            index_dir / ArticleStore.FILENAME, data_path
+        )
+
+    @property
+    def embeddings(self) -> numpy.ndarray:
+        """The normalized article embeddings as float32"""
+        return self._embeddings.rows(slice(None))
+
+    def embed(self, query: core.Query) -> numpy.ndarray:
+        """Get the normalized embedding of a query"""
+        text = str(query)
+        embedding = self.embedding_cache.get(text)
+        if embedding is None:
+            with instrumentation.span("encode"):
+                embedding = self.model.encode(text, normalize_embeddings=True)
+            self.embedding_cache.put(text, embedding)
+        return embedding
+
+    def embed_batch(self, queries) -> numpy.ndarray:
+        """Get the normalized embeddings of queries, encoded as a batch"""
+        texts = [str(query) for query in queries]
+        embeddings = {text: self.embedding_cache.get(text) for text in texts}
+        missing = [text for text, emb in embeddings.items() if emb is None]
+        if missing:
+            with instrumentation.span("encode", num_queries=len(missing)):
+                encoded = self.model.encode(missing, normalize_embeddings=True)
+            for text, embedding in zip(missing, encoded):
+                embeddings[text] = embedding
+                self.embedding_cache.put(text, embedding)
+        return numpy.stack([embeddings[text] for text in texts])
 
     def search(self, query, num_results):
-        query_embeddings = self.model.encode(str(query))
-        results = self._semantic_search(
-            query_embeddings, self._index_emb, top_k=num_results
+        article_indices, _ = self._nearest(self.embed(query), num_results)
+        return self.store.articles(self._numbers[article_indices].tolist())
+
+    def search_batch(self, queries, num_results):
+        return [
+            core.unscored(results)
+            for results in self.search_scored_batch(queries, num_results)
+        ]
+
+    def search_scored(self, query, num_results):
+        return _materialize(self.store, self.search_ids(query, num_results))
+
+    def search_scored_batch(self, queries, num_results):
+        return [
+            _materialize(self.store, results)
+            for results in self.search_ids_batch(queries, num_results)
+        ]
+
+    def search_ids(self, query, num_results):
+        article_indices, scores = self._nearest(self.embed(query), num_results)
+        return list(
+            zip(self._numbers[article_indices].tolist(), scores.tolist())
         )
-        article_indices = [r["corpus_id"] for r in results[0]]
-        matching_articles = [
-            core.Article(**self._index_data[idx]) for idx in article_indices
+
+    def search_ids_batch(self, queries, num_results):
+        if not queries:
+            return []
+        neighbours = self._nearest_batch(
+            self.embed_batch(queries), num_results
+        )
+        return [
+            list(zip(self._numbers[article_indices].tolist(), scores.tolist()))
+            for article_indices, scores in neighbours
         ]
-        return matching_articles
 
-    def _create_index_if_missing(
-        self, data_path: pathlib.Path, destination: pathlib.Path
-    ):
-        is_empty = len(list(destination.iterdir())) == 0
-        if not is_empty:
-            return
-        log.info("Creating index at: %s", destination)
-        with open(data_path, "rt") as f:
-            data = json.load(f)
+    def _update_index(
+        self,
+        data_path: pathlib.Path,
+        destination: pathlib.Path,
+        model_name: str,
+    ) -> tuple[IndexManifest, numpy.ndarray]:
+        """Embed the articles added or changed since the index was built
+
+        Embeddings of unchanged articles are reused, unless the index was
+        built with another model and has to be rebuilt whole. Returns the
+        manifest and the article numbers by embedding row.
+        """
+        hashes, numbers = _scan_articles(data_path)
+        new_manifest = IndexManifest(
+            hashes, model_name, encoder_identity(self.model)
+        )
+        old_manifest = IndexManifest.load(destination)
+        saved_numbers = self._saved_numbers(destination, old_manifest)
+        is_built = (destination / self.EMBEDDINGS_FILENAME).exists()
+        if is_built and saved_numbers is not None:
+            if old_manifest == new_manifest:
+                return new_manifest, saved_numbers
+
+        embeddings = self._reusable_embeddings(
+            destination, old_manifest, new_manifest, saved_numbers
+        )
+        stale = {key for key in hashes if key not in embeddings}
+        log.info(
+            "Updating index at %s: embedding %d of %d articles",
+            destination,
+            len(stale),
+            len(hashes),
+        )
+        if stale:
+            # read again, so that only the stale articles are held
+            texts = {
+                article_key(data): str(core.Article(**data))
+                for data in iter_articles(data_path)
+                if article_key(data) in stale
+            }
+            embeddings.update(
+                zip(texts, self.model.encode(list(texts.values())))
+            )
+        article_embeddings = numpy.stack([embeddings[key] for key in hashes])
+        self.save_index(destination, new_manifest, numbers, article_embeddings)
+        return new_manifest, numbers
 
-        articles = [core.Article(**d) for d in data]
-        articles_text = [str(a) for a in articles]
+    @classmethod
+    def save_index(
+        cls,
+        destination: pathlib.Path,
+        manifest: IndexManifest,
+        numbers: numpy.ndarray,
+        embeddings: numpy.ndarray,
+    ):
+        """Write embedded articles to `destination` with their manifest
+
+        `numbers` are the numbers of the articles in the manifest, with
+        their embeddings in the same order, made by the model and
+        encoder it records. Only the numbers are kept with the
+        embeddings, the articles being read from a store. Normalized
+        copies of previous embeddings are removed, to be created again
+        on load.
+        """
+        # a crash part way through leaves no manifest, forcing a rebuild
+        (destination / IndexManifest.FILENAME).unlink(missing_ok=True)
+        files.save_array(destination / cls.EMBEDDINGS_FILENAME, embeddings)
+        files.write_json(
+            destination / cls.NUMBERS_FILENAME,
+            {"digest": manifest.digest, "numbers": numbers.tolist()},
+        )
+        for path in destination.glob("article_embeddings.normalized.*.npy"):
+            path.unlink()
+        manifest.save(destination)
 
-        article_embeddings = self.model.encode(articles_text)
-        numpy.save(destination / self._emb_filename, article_embeddings)
+    @classmethod
+    def _saved_numbers(
+        cls, index_dir: pathlib.Path, manifest: IndexManifest | None
+    ) -> numpy.ndarray | None:
+        """Article numbers by embedding row saved with `manifest`
+
+        None if there are none, or they were saved with another manifest
+        """
+        try:
+            with open(index_dir / cls.NUMBERS_FILENAME, "rt") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        if manifest is None or data["digest"] != manifest.digest:
+            return None
+        return numpy.array(data["numbers"], dtype=numpy.int64)
 
-        article_dicts = [dataclasses.asdict(a) for a in articles]
-        with open(destination / self._index_data_filename, "wt") as f:
-            json.dump(article_dicts, f)
+    def _reusable_embeddings(
+        self,
+        index_dir: pathlib.Path,
+        old_manifest: IndexManifest | None,
+        new_manifest: IndexManifest,
+        numbers: numpy.ndarray | None,
+    ) -> dict[str, numpy.ndarray]:
+        """Embeddings of the indexed articles that are unchanged, by key
+
+        `numbers` are the indexed article numbers by embedding row
+        """
+        if old_manifest is None or numbers is None:
+            return {}
+        if (old_manifest.model_name, old_manifest.encoder) != (
+            new_manifest.model_name,
+            new_manifest.encoder,
+        ):
+            log.info(
+                "Embedding model changed from %s (%s), rebuilding index",
+                old_manifest.model_name,
+                old_manifest.encoder or "sentence-transformers",
+            )
+            return {}
+        try:
+            embeddings = numpy.load(index_dir / self.EMBEDDINGS_FILENAME)
+        except FileNotFoundError:
+            return {}
+        keys = [article_key({"number": n}) for n in numbers.tolist()]
+        return {
+            key: embedding
+            for key, embedding in zip(keys, embeddings)
+            if new_manifest.hashes.get(key) == old_manifest.hashes.get(key)
+        }
+
+    def _nearest(self, query_embedding: numpy.ndarray, k: int):
+        """Positions and scores of the `k` articles most similar to query"""
+        scores = self._score(query_embedding)
+        article_indices = top_k(scores, k)
+        return article_indices, scores[article_indices]
+
+    def _nearest_batch(self, query_embeddings: numpy.ndarray, k: int):
+        """Positions and scores of the `k` most similar articles per query"""
+        scores = self._embeddings.scores(query_embeddings)
+        article_indices = top_k_rows(scores, k)
+        best_scores = numpy.take_along_axis(scores, article_indices, axis=1)
+        return list(zip(article_indices, best_scores))
+
+    def _score(self, query_embedding: numpy.ndarray) -> numpy.ndarray:
+        """Cosine similarity of the query to every article"""
+        return self._embeddings.scores(query_embedding)
+
+    def _normalized_embeddings(
+        self, index_dir: pathlib.Path, dtype: str
+    ) -> pathlib.Path:
+        """Path of the normalized embeddings, created if missing"""
+        destination = index_dir / f"article_embeddings.normalized.{dtype}.npy"
+        if destination.exists():
+            return destination
+        log.info(
+            "Creating %s normalized embeddings at: %s", dtype, destination
+        )
+        embeddings = numpy.load(index_dir / self.EMBEDDINGS_FILENAME)
+        files.save_array(destination, quantize(normalize(embeddings), dtype))
+        return destination
 
 
 class WhooshIndex(
@@ -82,57 +329,325 @@ class WhooshIndex(
 ):  # pylint: disable=too-few-public-methods
     """Lexical Search indexing with Whoosh"""
 
+    # only the number is stored, the articles being read from the store
     schema = F.Schema(
-        title=F.TEXT(stored=True),
-        clauses=F.TEXT(stored=True),
-        chapter=F.TEXT(stored=True),
-        part=F.TEXT(stored=True),
-        number=F.STORED,
+        title=F.TEXT,
+        clauses=F.TEXT,
+        chapter=F.TEXT,
+        part=F.TEXT,
+        # unique, so that updated articles replace their old documents
+        number=F.NUMERIC(stored=True, unique=True),
     )
 
     def __init__(
-        self, data_pathname: FileSystemPath, index_dirname: FileSystemPath
+        self,
+        data_pathname: FileSystemPath,
+        index_dirname: FileSystemPath,
+        cache_size: int = 1024,
+        persistent_searcher: bool = True,
+        store: ArticleStore | None = None,
     ):
-        """Initialize the index, creating it if necessary"""
+        """Initialize the index, creating or updating it if necessary
+
+        Articles are added, replaced or deleted to match the data, going
+        by the content hashes in the index manifest. With
+        `persistent_searcher` set, each thread keeps a searcher open for
+        its searches, replacing it only when the index on disk changes.
+        Articles found are read from `store`, by default one kept with
+        the index.
+        """
 
         index_dir = pathlib.Path(index_dirname)
         data_path = pathlib.Path(data_pathname)
         _ensure_exists(index_dir)
-        self._create_index_if_missing(data_path, index_dir)
+        self._update_index(data_path, index_dir)
         self._index = whoosh_index.open_dir(index_dirname)
         self._search_fields = ["title", "clauses", "chapter", "part"]
+        self._parser = qparser.MultifieldParser(
+            self._search_fields, schema=self.schema, group=qparser.OrGroup
+        )
+        self.query_cache = caching.LRUCache(cache_size, name="parsed_query")
+        self._searchers = (
+            _ThreadSearchers(self._index) if persistent_searcher else None
+        )
+        self.store = store or ArticleStore(
+            index_dir / ArticleStore.FILENAME, data_path
+        )
 
-    def _create_index_if_missing(
+    def _update_index(
         self, data_path: pathlib.Path, destination: pathlib.Path
     ):
-        is_empty = len(list(destination.iterdir())) == 0
-        if is_empty:
+        """Index the articles added or changed since the index was built"""
+        with open(data_path, "rt") as f:
+            data = json.load(f)
+        new_manifest = IndexManifest.from_articles(data)
+        old_manifest = IndexManifest.load(destination)
+
+        if old_manifest is None or not whoosh_index.exists_in(
+            str(destination)
+        ):
             log.info("Creating index at: %s", destination)
-            with open(data_path, "rt") as f:
-                data = json.load(f)
+            self.create(destination, data)
+            return
 
-            data_index = whoosh_index.create_in(str(destination), self.schema)
-            writer = data_index.writer()
-            for doc in data:
-                writer.add_document(**doc)
-            writer.commit()
+        changes = old_manifest.changes(new_manifest)
+        if not changes:
+            return
+        log.info(
+            "Updating index at %s: %d added, %d changed, %d removed",
+            destination,
+            len(changes.added),
+            len(changes.changed),
+            len(changes.removed),
+        )
+        docs = {article_key(doc): doc for doc in data}
+        writer = whoosh_index.open_dir(str(destination)).writer()
+        for key in changes.removed:
+            writer.delete_by_term("number", int(key))
+        for key in changes.updated:
+            writer.update_document(**docs[key])
+        writer.commit()
+        new_manifest.save(destination)
+
+    @classmethod
+    def create(
+        cls,
+        destination: pathlib.Path,
+        articles: Iterable[dict],
+        **writer_options,
+    ) -> int:
+        """Index `articles` afresh at `destination`, returning how many
+
+        `writer_options` are passed on to the Whoosh writer, such as
+        `procs` and `multisegment` to index in several processes
+        """
+        data_index = whoosh_index.create_in(str(destination), cls.schema)
+        writer = data_index.writer(**writer_options)
+        hashes = {}
+        for doc in articles:
+            writer.add_document(**doc)
+            hashes[article_key(doc)] = content_hash(doc)
+        writer.commit()
+        IndexManifest(hashes).save(destination)
+        return len(hashes)
 
     def search(self, query, num_results):
-        with self._index.searcher() as searcher:
-            parser = qparser.MultifieldParser(
-                self._search_fields, schema=self.schema, group=qparser.OrGroup
+        return core.unscored(self.search_scored(query, num_results))
+
+    def search_batch(self, queries, num_results):
+        return [
+            core.unscored(results)
+            for results in self.search_scored_batch(queries, num_results)
+        ]
+
+    def search_scored(self, query, num_results):
+        return _materialize(self.store, self.search_ids(query, num_results))
+
+    def search_scored_batch(self, queries, num_results):
+        return [
+            _materialize(self.store, results)
+            for results in self.search_ids_batch(queries, num_results)
+        ]
+
+    def search_ids(self, query, num_results):
+        parsed_query = self._parse(query)
+        with self._open_searcher() as searcher:
+            return self._search(searcher, parsed_query, num_results)
+
+    def search_ids_batch(self, queries, num_results):
+        parsed_queries = [self._parse(query) for query in queries]
+        with self._open_searcher() as searcher:
+            return [
+                self._search(searcher, parsed_query, num_results)
+                for parsed_query in parsed_queries
+            ]
+
+    def close(self):
+        """Close the searchers kept open, if any"""
+        if self._searchers is not None:
+            self._searchers.close()
+
+    @contextlib.contextmanager
+    def _open_searcher(self):
+        if self._searchers is None:
+            with self._index.searcher() as searcher:
+                yield searcher
+            return
+        yield self._searchers.get()
+
+    @staticmethod
+    def _search(searcher, parsed_query, num_results):
+        results = searcher.search(parsed_query, limit=num_results)
+        return [(r["number"], r.score) for r in results]
+
+    def _parse(self, query: core.Query):
+        text = str(query)
+        parsed_query = self.query_cache.get(text)
+        if parsed_query is None:
+            parsed_query = self._parser.parse(text)
+            self.query_cache.put(text, parsed_query)
+        return parsed_query
+
+
+class _ThreadSearchers:
+    """The searchers of a Whoosh index, one kept open per thread
+
+    Searchers are not shared, as they are not safe to use from several
+    threads at once.
+    """
+
+    def __init__(self, index):
+        self._index = index
+        self._local = threading.local()
+        # the searchers of all threads, to close them
+        self._searchers: set = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._searchers)
+
+    def get(self):
+        """Get this thread's searcher, replacing it if the index changed"""
+        searcher = getattr(self._local, "searcher", None)
+        if searcher is not None and searcher.is_closed:
+            searcher = None
+        if searcher is not None and not searcher.up_to_date():
+            log.info("Replacing searcher for updated index")
+            with self._lock:
+                self._searchers.discard(searcher)
+            # a refreshed searcher would share readers with the old one
+            searcher.close()
+            searcher = None
+        if searcher is None:
+            searcher = self._local.searcher = self._index.searcher()
+            with self._lock:
+                self._searchers.add(searcher)
+        return searcher
+
+    def close(self):
+        """Close the searchers of all threads"""
+        with self._lock:
+            searchers, self._searchers = self._searchers, set()
+        for searcher in searchers:
+            searcher.close()
+
+
+class LazyIndex(core.AbstractIndex):
+    """Create an index when it is first needed
+
+    The index is created by `factory` on the first search, or ahead of
+    time in a background thread by `warm_up`. While a warm-up is in
+    progress, searches wait for it if `wait` is set and otherwise raise
+    core.IndexNotReadyError.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], core.AbstractIndex],
+        name: str = "index",
+        wait: bool = True,
+    ):
+        self.name = name
+        self._factory = factory
+        self._wait = wait
+        self._index: core.AbstractIndex | None = None
+        self._lock = threading.Lock()
+        self._warm_up_thread: threading.Thread | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    def warm_up(self):
+        """Start creating the index in a background thread"""
+        with self._lock:
+            if self._warm_up_thread is not None or self.ready:
+                return
+            self._warm_up_thread = threading.Thread(
+                target=self._create_in_background,
+                name=f"warm-up-{self.name}",
+                daemon=True,
             )
-            query = parser.parse(str(query))
-            results = searcher.search(query, limit=num_results)
-            results = [core.Article(**dict(r)) for r in results]
-        return results
+            self._warm_up_thread.start()
+
+    def get(self) -> core.AbstractIndex:
+        """Get the index, creating it if necessary"""
+        if self._index is not None:
+            return self._index
+        thread = self._warm_up_thread
+        if thread is not None and thread.is_alive():
+            if not self._wait:
+                raise core.IndexNotReadyError(f"{self.name} is still loading")
+            thread.join()
+        return self._create()
+
+    def search(self, query, num_results):
+        return self.get().search(query, num_results)
+
+    def search_batch(self, queries, num_results):
+        return self.get().search_batch(queries, num_results)
+
+    def search_scored(self, query, num_results):
+        return self.get().search_scored(query, num_results)
+
+    def search_scored_batch(self, queries, num_results):
+        return self.get().search_scored_batch(queries, num_results)
+
+    def search_ids(self, query, num_results):
+        return self.get().search_ids(query, num_results)
+
+    def search_ids_batch(self, queries, num_results):
+        return self.get().search_ids_batch(queries, num_results)
+
+    def _create_in_background(self):
+        try:
+            self._create()
+        except Exception:  # pylint: disable=broad-exception-caught
+            # the next search retries the creation
+            log.exception("Failed to load %s", self.name)
+
+    def _create(self):
+        with self._lock:
+            if self._index is None:
+                start = time.perf_counter()
+                self._index = self._factory()
+                log.info(
+                    "Loaded %s in %.2fs",
+                    self.name,
+                    time.perf_counter() - start,
+                )
+            return self._index
+
+
+class ExecutorIndex(core.AbstractAsyncIndex):
+    # pylint: disable=too-few-public-methods
+    """Search an index from async code without blocking the event loop
+
+    Searches, which encode queries and score articles on the CPU, run in
+    `executor`, or the event loop's default executor if not given.
+    """
+
+    def __init__(
+        self, index: core.AbstractIndex, executor: Executor | None = None
+    ):
+        self.index = index
+        self._executor = executor
+
+    async def search(self, query, num_results):
+        # the context carries the current span over to the worker thread
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, context.run, self.index.search, query, num_results
+        )
 
 
 class HybridIndex(core.AbstractIndex):
     # pylint: disable=too-few-public-methods
 
-    LEXICAL_INDEX_CLS = WhooshIndex
-    SEMANTIC_INDEX_CLS = SentenceTransformersIndex
+    LEXICAL_INDEX_CLS: type[WhooshIndex] = WhooshIndex
+    SEMANTIC_INDEX_CLS: type[SentenceTransformersIndex] = (
+        SentenceTransformersIndex
+    )
 
     @classmethod
     def from_index_locations(
@@ -140,50 +655,285 @@ class HybridIndex(core.AbstractIndex):
         lexical_index_dirname: FileSystemPath,
         semantic_index_dirname: FileSystemPath,
         data_location: FileSystemPath,
+        lexical_index_options: dict | None = None,
+        semantic_index_options: dict | None = None,
+        **kwargs,
     ):
-        """Creates a hybrid index from the given filesystem locations"""
-
+        """Creates a hybrid index from the given filesystem locations
+
+        The index options are passed on to the respective index classes
+        and any extra keyword arguments to the initializer. Both indexes
+        share one article store, kept with the lexical index unless a
+        `store` is given.
+        """
+        if "store" not in kwargs:
+            kwargs["store"] = ArticleStore(
+                pathlib.Path(lexical_index_dirname) / ArticleStore.FILENAME,
+                data_location,
+            )
+        store = kwargs["store"]
         lexical_index = cls.LEXICAL_INDEX_CLS(
-            data_location, lexical_index_dirname
+            data_location,
+            lexical_index_dirname,
+            **{"store": store, **(lexical_index_options or {})},
         )
         semantic_index = cls.SEMANTIC_INDEX_CLS(
-            data_location, semantic_index_dirname
+            data_location,
+            semantic_index_dirname,
+            **{"store": store, **(semantic_index_options or {})},
+        )
+        return cls(lexical_index, semantic_index, **kwargs)
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        lexical_search_index,
+        semantic_search_index,
+        *,
+        concurrent: bool = False,
+        timeouts: dict[str, float | None] | None = None,
+        fusion: FusionStrategy | None = None,
+        candidate_depth: int | None = None,
+        store: ArticleStore | None = None,
+    ):
+        """Combine the results of a lexical and a semantic index
+
+        When `concurrent` is set, both indexes are searched in parallel
+        threads. `timeouts` maps a backend name, "lexical" or "semantic",
+        to the seconds to wait for its results in concurrent mode. A
+        backend that misses its deadline is left out of the ranking.
+
+        Results are combined with the `fusion` strategy, reciprocal rank
+        fusion by default, from the top `candidate_depth` results of
+        each backend. The depth is at least the number of results asked
+        for.
+
+        With a `store` of the articles of both backends, the backends
+        give article numbers, and only the articles returned are read.
+        """
+        self.fusion = fusion or ReciprocalRankFusion()
+        self.candidate_depth = candidate_depth
+        self.store = store
+        self._backends = {
+            "lexical": lexical_search_index,
+            "semantic": semantic_search_index,
+        }
+        self._timeouts = timeouts or {}
+        self._executor = (
+            ThreadPoolExecutor(thread_name_prefix="hybrid-search")
+            if concurrent
+            else None
         )
-        return cls(lexical_index, semantic_index)
+        self._local = threading.local()
+
+    @property
+    def lexical_index(self):
+        return self._backends["lexical"]
+
+    @property
+    def semantic_index(self):
+        return self._backends["semantic"]
 
-    def __init__(self, lexical_search_index, semantic_search_index):
-        self._lexical_index = lexical_search_index
-        self._semantic_index = semantic_search_index
+    @property
+    def last_timings(self) -> dict[str, float | None]:
+        """Seconds taken by each backend in this thread's last search
+
+        A backend that was left out of the results is recorded as None
+        """
+        return getattr(self._local, "timings", {})
+
+    @property
+    def last_search_complete(self) -> bool:
+        """Whether every backend contributed to this thread's last search"""
+        return None not in self.last_timings.values()
 
     def search(self, query, num_results):
-        lexical_search_results = self._lexical_index.search(query, num_results)
-        semantic_search_results = self._semantic_index.search(
-            query, num_results
+        return core.unscored(self.search_scored(query, num_results))
+
+    def search_batch(self, queries, num_results):
+        return [
+            core.unscored(results)
+            for results in self.search_scored_batch(queries, num_results)
+        ]
+
+    def search_scored(self, query, num_results):
+        """Search, pairing each article with its fused score"""
+        method_name = "search_scored" if self.store is None else "search_ids"
+        result_sets = self._search_backends(
+            method_name, query, self._depth(num_results)
+        )
+        return self._rank(result_sets, num_results)
+
+    def search_scored_batch(self, queries, num_results):
+        method_name = (
+            "search_scored_batch" if self.store is None else "search_ids_batch"
         )
-        ranked_results = self._rank_results(
-            lexical_search_results, semantic_search_results
+        result_sets = self._search_backends(
+            method_name, queries, self._depth(num_results)
         )
-        return ranked_results[:num_results]
+        return [
+            self._rank(
+                {name: results[i] for name, results in result_sets.items()},
+                num_results,
+            )
+            for i in range(len(queries))
+        ]
 
-    @classmethod
-    def _rank_results(cls, *result_sets):
-        scores: dict[int, float] = {}
-        all_articles = {}
-        for results in result_sets:
-            for i, article in enumerate(results):
-                all_articles[article.number] = article
-                scores[article.number] = scores.get(
-                    article.number, 0
-                ) + cls.rrf_score(i + 1)
+    def _depth(self, num_results):
+        return max(num_results, self.candidate_depth or 0)
+
+    def _rank(
+        self, result_sets, num_results
+    ) -> list[tuple[core.Article, float]]:
+        """The top fused results of the backends with their scores
+
+        With a store, the backends give article numbers, and only the
+        articles returned in the end are read from it
+        """
+        if self.store is None:
+            articles: dict[int, core.Article] = {}
+            for results in result_sets.values():
+                for article, _ in results:
+                    articles.setdefault(article.number, article)
+            result_sets = {
+                name: [(article.number, score) for article, score in results]
+                for name, results in result_sets.items()
+            }
+            lookup = articles.__getitem__
+        else:
+            lookup = self.store.__getitem__
+        with instrumentation.span("fusion"):
+            ranked = fuse_ids(self.fusion, result_sets)[:num_results]
+        return [(lookup(number), score) for number, score in ranked]
+
+    def _search_backends(self, method_name: str, *args):
+        """Call the named search method on each backend with `args`"""
+        if self._executor is None:
+            result_sets = self._search_sequentially(method_name, *args)
+        else:
+            result_sets = self._search_concurrently(method_name, *args)
+        log.debug("Hybrid search timings: %s", self.last_timings)
+        for name, seconds in self.last_timings.items():
+            if seconds is None:
+                instrumentation.increment("backends_skipped", backend=name)
+            else:
+                instrumentation.observe(f"search.{name}", seconds)
+        return result_sets
+
+    def _search_sequentially(self, method_name, *args):
+        timings: dict[str, float | None] = {}
+        result_sets = {}
+        for name, index in self._backends.items():
+            try:
+                timings[name], results = instrumentation.timed(
+                    getattr(index, method_name), *args
+                )
+            except core.IndexNotReadyError:
+                timings[name] = None
+                log.debug("Skipping %s search: index not ready", name)
+                continue
+            result_sets[name] = results
+        self._local.timings = timings
+        return result_sets
+
+    def _search_concurrently(self, method_name, *args):
+        assert self._executor is not None
+        start = time.perf_counter()
+        futures = {
+            name: self._executor.submit(
+                instrumentation.timed, getattr(index, method_name), *args
+            )
+            for name, index in self._backends.items()
+        }
+        timings: dict[str, float | None] = {}
+        result_sets = {}
+        for name, future in futures.items():
+            timeout = self._timeouts.get(name)
+            if timeout is not None:
+                timeout = max(0.0, start + timeout - time.perf_counter())
+            try:
+                timings[name], results = future.result(timeout=timeout)
+            except TimeoutError:
+                future.cancel()
+                timings[name] = None
+                log.warning(
+                    "Dropping %s search results after %ss timeout",
+                    name,
+                    self._timeouts[name],
+                )
+                continue
+            except core.IndexNotReadyError:
+                timings[name] = None
+                log.debug("Skipping %s search: index not ready", name)
+                continue
+            result_sets[name] = results
+        self._local.timings = timings
+        return result_sets
+
+
+def fuse_results(
+    fusion: FusionStrategy,
+    result_sets: dict[str, list[tuple[core.Article, float]]],
+) -> list[core.Article]:
+    """Rank the articles in the scored results of each named backend"""
+    articles: dict[int, core.Article] = {}
+    for results in result_sets.values():
+        for article, _ in results:
+            articles.setdefault(article.number, article)
+    fused = fuse_ids(
+        fusion,
+        {
+            name: [(article.number, score) for article, score in results]
+            for name, results in result_sets.items()
+        },
+    )
+    return [articles[number] for number, _ in fused]
 
-        sorted_scores = sorted(
-            scores.items(), key=lambda num_score: num_score[1], reverse=True
-        )
-        return [all_articles[number] for number, _ in sorted_scores]
 
-    @staticmethod
-    def rrf_score(rank, k=60):
-        return 1 / (k + rank)
+def fuse_ids(
+    fusion: FusionStrategy,
+    result_sets: dict[str, list[tuple[int, float]]],
+) -> list[tuple[int, float]]:
+    """Rank the article numbers in the scored results of each backend
+
+    Each number is paired with its fused score
+    """
+    ranked_ids = {
+        name: (
+            numpy.array([number for number, _ in results], dtype=numpy.int64),
+            numpy.array([score for _, score in results], dtype=float),
+        )
+        for name, results in result_sets.items()
+    }
+    fused_ids, fused_scores = fusion.fuse(ranked_ids)
+    return list(zip(fused_ids.tolist(), fused_scores.tolist()))
+
+
+def article_record(data: dict) -> dict:
+    """Article fields as stored by the semantic index"""
+    return dataclasses.asdict(core.Article(**data))
+
+
+def _scan_articles(
+    data_path: FileSystemPath,
+) -> tuple[dict[str, str], numpy.ndarray]:
+    """Content hashes by key and numbers of the articles at `data_path`
+
+    Both are in the order of the articles, which are read one at a time
+    """
+    hashes = {}
+    numbers = []
+    for data in iter_articles(data_path):
+        record = article_record(data)
+        hashes[article_key(record)] = content_hash(record)
+        numbers.append(record["number"])
+    return hashes, numpy.array(numbers, dtype=numpy.int64)
+
+
+def _materialize(
+    store: ArticleStore, results: list[tuple[int, float]]
+) -> list[tuple[core.Article, float]]:
+    """Read the articles of scored search results from `store`"""
+    return [(store[number], score) for number, score in results]
 
 
 def _ensure_exists(path: pathlib.Path):
@@ -0,0 +1,295 @@
+"""Search of several corpora, each indexed in a shard of its own
+
+A query is searched in the shards of all corpora at once, and their
+results merged into one ranking, so that adding a corpus adds a shard
+searched in parallel rather than time to every search.
+"""
+
+import heapq
+import logging
+import multiprocessing
+import threading
+import time
+from collections.abc import Callable, Mapping
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from .. import core
+from ..core import instrumentation
+
+log = logging.getLogger(__name__)
+
+# index of the shard served by a ProcessShard worker
+_shard_index: core.AbstractIndex | None = None  # pylint: disable=invalid-name
+
+
+class ShardedIndex(core.AbstractIndex):
+    """Search the indexes of several corpora as one
+
+    `shards` maps corpus names to their indexes. Each search goes to
+    the shards of the corpora of the query, or all of them, in parallel
+    threads, enough for `max_concurrency` searches at once. The scores
+    of different shards are not comparable, so their results are
+    merged by rank into the global top `num_results`: each result
+    scores 1 / (`k` + its rank in its shard), ties going to the shards
+    in order.
+
+    With a `timeout`, shards that have not answered within that many
+    seconds of starting their search are left out of the results, like
+    slow backends of a HybridIndex, as are shards whose search has not
+    started within that many seconds of being submitted.
+    """
+
+    def __init__(
+        self,
+        shards: Mapping[str, core.AbstractIndex],
+        timeout: float | None = None,
+        max_concurrency: int = 32,
+        k: float = 60,
+    ):
+        if not shards:
+            raise ValueError("A sharded index needs at least one shard")
+        self.shards = dict(shards)
+        self.timeout = timeout
+        self.k = k
+        # threads are only started as needed, up to this many
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(self.shards) * max_concurrency,
+            thread_name_prefix="shard-search",
+        )
+        self._local = threading.local()
+
+    @property
+    def last_timings(self) -> dict[str, float | None]:
+        """Seconds taken by each shard in this thread's last search
+
+        A shard that was left out of the results is recorded as None
+        """
+        return getattr(self._local, "timings", {})
+
+    @property
+    def last_search_complete(self) -> bool:
+        """Whether every shard searched fully answered this thread's last
+        search
+
+        Shards with a `last_search_complete` attribute of their own, like
+        a HybridIndex, report it from the worker thread that searched them.
+        """
+        return getattr(self._local, "complete", True)
+
+    def search(self, query, num_results):
+        return core.unscored(self.search_scored(query, num_results))
+
+    def search_batch(self, queries, num_results):
+        return [
+            core.unscored(results)
+            for results in self.search_scored_batch(queries, num_results)
+        ]
+
+    def search_scored(self, query, num_results):
+        names = self._corpora(query)
+        result_sets = self._fan_out(
+            {name: (query,) for name in names}, "search_scored", num_results
+        )
+        return _merge(result_sets.values(), num_results, self.k)
+
+    def search_scored_batch(self, queries, num_results):
+        # each shard searches the queries that include its corpus
+        positions: dict[str, list[int]] = {name: [] for name in self.shards}
+        for i, query in enumerate(queries):
+            for name in self._corpora(query):
+                positions[name].append(i)
+        result_sets = self._fan_out(
+            {
+                name: ([queries[i] for i in shard_positions],)
+                for name, shard_positions in positions.items()
+                if shard_positions
+            },
+            "search_scored_batch",
+            num_results,
+        )
+        merged: list[list] = [[] for _ in queries]
+        for name, shard_results in result_sets.items():
+            for i, results in zip(positions[name], shard_results):
+                merged[i].append(results)
+        return [_merge(results, num_results, self.k) for results in merged]
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _corpora(self, query: core.Query) -> list[str]:
+        """Names of the shards to search for `query`, in shard order"""
+        if query.corpora is None:
+            return list(self.shards)
+        unknown = set(query.corpora) - set(self.shards)
+        if unknown:
+            raise ValueError(f"Unknown corpora: {', '.join(sorted(unknown))}")
+        return [name for name in self.shards if name in query.corpora]
+
+    def _fan_out(self, shard_args: dict[str, tuple], method_name, *args):
+        """Call the named search method of each shard with its arguments
+
+        Returns the results of the shards that answered in time
+        """
+        searches = {
+            name: _ShardSearch(
+                self.shards[name], method_name, *shard_args[name], *args
+            )
+            for name in shard_args
+        }
+        futures = {
+            name: self._executor.submit(search)
+            for name, search in searches.items()
+        }
+        timings: dict[str, float | None] = {}
+        result_sets = {}
+        complete = True
+        for name, future in futures.items():
+            try:
+                seconds, results, shard_complete = searches[name].result(
+                    future, self.timeout
+                )
+            except TimeoutError:
+                future.cancel()
+                timings[name] = None
+                complete = False
+                log.warning(
+                    "Dropping %s shard results after %ss timeout",
+                    name,
+                    self.timeout,
+                )
+                instrumentation.increment("shards_skipped", shard=name)
+                continue
+            result_sets[name] = results
+            timings[name] = seconds
+            complete = complete and shard_complete
+            instrumentation.observe(f"shard.{name}", seconds)
+        self._local.timings = timings
+        self._local.complete = complete
+        return result_sets
+
+
+class _ShardSearch:
+    """A search of one shard, timed from when a worker starts it
+
+    Calling it returns the seconds taken, the results and whether the
+    shard reported them complete, read on the worker thread as the
+    shard may keep that flag per thread.
+    """
+
+    def __init__(self, index: core.AbstractIndex, method_name: str, *args):
+        self._index = index
+        self._method_name = method_name
+        self._args = args
+        self._started = threading.Event()
+        self._submitted = time.perf_counter()
+        self._start = 0.0
+
+    def __call__(self) -> tuple[float, list, bool]:
+        self._start = time.perf_counter()
+        self._started.set()
+        result = getattr(self._index, self._method_name)(*self._args)
+        seconds = time.perf_counter() - self._start
+        return (
+            seconds,
+            result,
+            getattr(self._index, "last_search_complete", True),
+        )
+
+    def result(self, future: Future, timeout: float | None):
+        """Wait for the search run by `future`
+
+        Time spent queued for a worker does not count towards the
+        `timeout` of the search itself, but the search must start
+        within `timeout` of being submitted
+        """
+        if timeout is None:
+            return future.result()
+        # a search cancelled before starting never sets the event itself
+        future.add_done_callback(lambda _: self._started.set())
+        if not self._started.wait(
+            max(0.0, self._submitted + timeout - time.perf_counter())
+        ):
+            raise TimeoutError
+        return future.result(
+            max(0.0, self._start + timeout - time.perf_counter())
+        )
+
+
+class ProcessShard(core.AbstractIndex):
+    """Search an index living in a worker process of its own
+
+    The worker calls `factory` to create the index, so the factory and
+    the queries and articles passed to and fro must be picklable. CPU
+    bound searches of different shards then run in parallel, without
+    contending for the interpreter lock.
+
+    Each of the `max_workers` processes creates an index of its own, so
+    that many searches of the shard run at once at the cost of as many
+    copies of the index in memory. The default of one worker searches
+    the shard one query at a time.
+
+    Like a HybridIndex, `last_search_complete` tells whether the worker
+    fully answered this thread's last search.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], core.AbstractIndex],
+        max_workers: int = 1,
+    ):
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_create_shard_index,
+            initargs=(factory,),
+        )
+        self._local = threading.local()
+
+    @property
+    def last_search_complete(self) -> bool:
+        """Whether the worker fully answered this thread's last search"""
+        return getattr(self._local, "complete", True)
+
+    def search(self, query, num_results):
+        return self._call("search", query, num_results)
+
+    def search_batch(self, queries, num_results):
+        return self._call("search_batch", queries, num_results)
+
+    def search_scored(self, query, num_results):
+        return self._call("search_scored", query, num_results)
+
+    def search_scored_batch(self, queries, num_results):
+        return self._call("search_scored_batch", queries, num_results)
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _call(self, method_name, *args):
+        result, self._local.complete = self._executor.submit(
+            _search_shard_index, method_name, *args
+        ).result()
+        return result
+
+
+def _merge(result_sets, num_results, k):
+    """The top results of several shards, merged by their ranks"""
+    return heapq.nlargest(
+        num_results,
+        (
+            (article, 1 / (k + rank))
+            for results in result_sets
+            for rank, (article, _) in enumerate(results, 1)
+        ),
+        key=lambda result: result[1],
+    )
+
+
+def _create_shard_index(factory):
+    global _shard_index  # pylint: disable=global-statement
+    _shard_index = factory()
+
+
+def _search_shard_index(method_name, *args):
+    result = getattr(_shard_index, method_name)(*args)
+    return result, getattr(_shard_index, "last_search_complete", True)
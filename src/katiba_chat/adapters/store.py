@@ -0,0 +1,175 @@
+"""Read-only store of the indexed articles
+
+The indexes find article numbers, and the articles themselves are kept
+once, in a compact file shared by the indexes. The file is memory-mapped,
+so its pages are shared by the processes on a machine and an article is
+only decoded when a search returns it.
+
+The file holds a header, the article numbers in ascending order, the
+offsets of the records and then the records, each a JSON array of the
+article fields.
+"""
+
+import dataclasses
+import hashlib
+import json
+import logging
+import mmap
+import pathlib
+import struct
+import threading
+from collections.abc import Iterable, Sequence
+
+import numpy
+
+from .. import core
+from . import files
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"KATSTOR1"
+# magic, SHA-256 digest of the source data and number of records
+HEADER = struct.Struct("<8s32sQ")
+FIELDS = tuple(field.name for field in dataclasses.fields(core.Article))
+
+
+class ArticleStore:
+    """Articles by number, from a memory-mapped file at `path`
+
+    With `data_path`, a JSON array of article records, the file is
+    written from it first if missing or written from other data. The
+    file is opened on first use.
+    """
+
+    FILENAME = "articles.store"
+
+    def __init__(
+        self,
+        path: str | pathlib.Path,
+        data_path: str | pathlib.Path | None = None,
+    ):
+        self.path = pathlib.Path(path)
+        self.data_path = None if data_path is None else pathlib.Path(data_path)
+        self._map: mmap.mmap | None = None
+        self._numbers = numpy.empty(0, dtype=numpy.int64)
+        self._offsets = numpy.empty(0, dtype=numpy.uint64)
+        self._data_start = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def write(
+        cls,
+        path: str | pathlib.Path,
+        records: Iterable[dict],
+        source_digest: bytes = bytes(32),
+    ) -> int:
+        """Write `records` to a store at `path`, returning how many
+
+        A record replaces any earlier one with the same number
+        """
+        by_number = {int(r["number"]): r for r in records}
+        numbers = numpy.array(sorted(by_number), dtype=numpy.int64)
+        blobs = [
+            json.dumps(
+                [by_number[n][field] for field in FIELDS], ensure_ascii=False
+            ).encode("utf-8")
+            for n in numbers.tolist()
+        ]
+        offsets = numpy.zeros(len(blobs) + 1, dtype=numpy.uint64)
+        numpy.cumsum([len(b) for b in blobs], out=offsets[1:])
+        with files.replacing(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, source_digest, len(numbers)))
+            f.write(numbers.astype("<i8").tobytes())
+            f.write(offsets.astype("<u8").tobytes())
+            for blob in blobs:
+                f.write(blob)
+        return len(numbers)
+
+    @property
+    def numbers(self) -> numpy.ndarray:
+        """The article numbers in the store, in ascending order"""
+        self.open()
+        return self._numbers
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __contains__(self, number: int):
+        return self._position(number) is not None
+
+    def __getitem__(self, number: int) -> core.Article:
+        position = self._position(number)
+        if position is None:
+            raise KeyError(number)
+        return self._article_at(position)
+
+    def articles(self, numbers: Sequence[int]) -> list[core.Article]:
+        """The articles with the given numbers, in the same order"""
+        return [self[number] for number in numbers]
+
+    def open(self):
+        """Map the file, writing it from `data_path` first if needed"""
+        if self._map is not None:
+            return
+        with self._lock:
+            if self._map is not None:
+                return
+            if self.data_path is not None:
+                self._write_if_stale()
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, _, count = HEADER.unpack_from(mapped)
+            if magic != MAGIC:
+                mapped.close()
+                raise ValueError(f"Not an article store: {self.path}")
+            self._numbers = numpy.frombuffer(
+                mapped, dtype="<i8", count=count, offset=HEADER.size
+            )
+            offsets_start = HEADER.size + self._numbers.nbytes
+            self._offsets = numpy.frombuffer(
+                mapped, dtype="<u8", count=count + 1, offset=offsets_start
+            )
+            self._data_start = offsets_start + self._offsets.nbytes
+            # set last, as searches skip the lock once it is
+            self._map = mapped
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                # the arrays view the map, which cannot close while they do
+                self._numbers = numpy.empty(0, dtype=numpy.int64)
+                self._offsets = numpy.empty(0, dtype=numpy.uint64)
+                self._map.close()
+                self._map = None
+
+    def _position(self, number: int) -> int | None:
+        numbers = self.numbers
+        position = int(numpy.searchsorted(numbers, number))
+        if position < len(numbers) and numbers[position] == number:
+            return position
+        return None
+
+    def _article_at(self, position: int) -> core.Article:
+        assert self._map is not None
+        start = self._data_start + int(self._offsets[position])
+        end = self._data_start + int(self._offsets[position + 1])
+        return core.Article(*json.loads(self._map[start:end]))
+
+    def _write_if_stale(self):
+        assert self.data_path is not None
+        source = self.data_path.read_bytes()
+        digest = hashlib.sha256(source).digest()
+        if _source_digest(self.path) == digest:
+            return
+        log.info("Writing article store at: %s", self.path)
+        self.write(self.path, json.loads(source), digest)
+
+
+def _source_digest(path: pathlib.Path) -> bytes | None:
+    """Digest of the data a store was written from, None if unreadable"""
+    try:
+        with open(path, "rb") as f:
+            magic, digest, _ = HEADER.unpack(f.read(HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return None
+    return digest if magic == MAGIC else None
@@ -0,0 +1,33 @@
+"""Token counting for fitting prompts to a context budget"""
+
+import functools
+from collections.abc import Callable
+
+from .. import core
+
+TokenCounter = Callable[[str], int]
+
+
+def token_counter(tokenizer_name: str = "") -> TokenCounter:
+    """Count tokens with the named Hugging Face tokenizer
+
+    Without a name, tokens are estimated from the length of the text,
+    which avoids loading a tokenizer at the cost of accuracy
+    """
+    if not tokenizer_name:
+        return core.estimate_tokens
+    return _huggingface_token_counter(tokenizer_name)
+
+
+@functools.cache
+def _huggingface_token_counter(tokenizer_name: str) -> TokenCounter:
+    # importing on demand because load time can be quite slow
+    # pylint: disable=import-outside-toplevel
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+
+    def count_tokens(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    return count_tokens
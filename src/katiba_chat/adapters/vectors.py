@@ -0,0 +1,95 @@
+"""Normalized embedding vectors, stored compactly and scored in blocks"""
+
+import pathlib
+
+import numpy
+
+# scale factor mapping normalized embedding components onto int8
+INT8_SCALE = 127
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+# machine epsilon of float32, bounding norms so zero embeddings stay zero
+_FLOAT32_EPSILON = 2.0**-23
+
+
+class NormalizedEmbeddings:
+    """Normalized embeddings, memory-mapped as stored and scored as float32
+
+    float32 embeddings are scored straight from the mapped matrix.
+    float16 and int8 ones are dequantized `block_rows` rows at a time,
+    so scoring holds one block as float32 rather than an upcast copy of
+    the whole matrix.
+    """
+
+    def __init__(self, matrix: numpy.ndarray, block_rows: int = 4096):
+        self.matrix = matrix
+        self.block_rows = block_rows
+
+    @classmethod
+    def load(cls, path: pathlib.Path, block_rows: int = 4096):
+        """Memory-map the embeddings saved at `path`"""
+        return cls(numpy.load(path, mmap_mode="r"), block_rows)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def rows(self, indices) -> numpy.ndarray:
+        """The rows at `indices`, an index array or slice, as float32"""
+        rows = self.matrix[indices]
+        if rows.dtype == numpy.float32:
+            return rows
+        dequantized = rows.astype(numpy.float32)
+        if rows.dtype == numpy.int8:
+            dequantized /= INT8_SCALE
+        return dequantized
+
+    def scores(self, queries: numpy.ndarray) -> numpy.ndarray:
+        """Cosine similarity of a query, or each row of queries, to every
+        embedding"""
+        queries = numpy.asarray(queries, dtype=numpy.float32)
+        if self.matrix.dtype == numpy.float32:
+            return queries @ self.matrix.T
+        scores = numpy.empty(
+            queries.shape[:-1] + (len(self),), dtype=numpy.float32
+        )
+        for start in range(0, len(self), self.block_rows):
+            block = slice(start, start + self.block_rows)
+            scores[..., block] = queries @ self.rows(block).T
+        return scores
+
+
+def normalize(embeddings: numpy.ndarray) -> numpy.ndarray:
+    """Scale each row of `embeddings` to unit length as float32"""
+    embeddings = numpy.asarray(embeddings, dtype=numpy.float32)
+    norms = numpy.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / numpy.maximum(norms, _FLOAT32_EPSILON)
+
+
+def quantize(embeddings: numpy.ndarray, dtype: str) -> numpy.ndarray:
+    """Store normalized embeddings compactly as the given dtype
+
+    int8 values hold the components scaled by INT8_SCALE
+    """
+    if dtype == "int8":
+        scaled = numpy.rint(embeddings * INT8_SCALE)
+        return numpy.clip(scaled, -INT8_SCALE, INT8_SCALE).astype(numpy.int8)
+    return embeddings.astype(dtype)
+
+
+def top_k(scores: numpy.ndarray, k: int) -> numpy.ndarray:
+    """Indices of the `k` highest scores, highest first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return numpy.empty(0, dtype=numpy.intp)
+    candidates = numpy.argpartition(-scores, k - 1)[:k]
+    return candidates[numpy.argsort(-scores[candidates], kind="stable")]
+
+
+def top_k_rows(scores: numpy.ndarray, k: int) -> numpy.ndarray:
+    """Indices of the `k` highest scores in each row, highest first"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return numpy.empty((len(scores), 0), dtype=numpy.intp)
+    candidates = numpy.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = numpy.take_along_axis(scores, candidates, axis=1)
+    order = numpy.argsort(-candidate_scores, axis=1, kind="stable")
+    return numpy.take_along_axis(candidates, order, axis=1)
@@ -0,0 +1,46 @@
+"""Benchmarks
+
+These are run from the repository root, where the evaluation data in
+`notebooks/` is found by default.
+"""
+
+import csv
+import pathlib
+import tempfile
+
+DEFAULT_ARTICLES_PATH = (
+    pathlib.Path(__file__).parent.parent
+    / "data"
+    / "constitution_articles.json"
+)
+DEFAULT_DATASET_PATH = pathlib.Path("notebooks") / "rag_evaluation_data.csv"
+DEFAULT_INDEX_DIR = pathlib.Path(tempfile.gettempdir()) / "katiba_chat_bench"
+
+
+def load_dataset(path: str | pathlib.Path) -> tuple[list[str], list[int]]:
+    """Read the questions and the numbers of the articles they are about"""
+    with open(path, "rt") as f:
+        rows = list(csv.DictReader(f))
+    return (
+        [row["question"] for row in rows],
+        [int(row["article_number"]) for row in rows],
+    )
+
+
+def hit_rate(rankings: list[list[int]], expected: list[int], k: int) -> float:
+    """Fraction of rankings with the expected article in their top `k`"""
+    hits = [e in ranking[:k] for ranking, e in zip(rankings, expected)]
+    return sum(hits) / len(hits) if hits else 0.0
+
+
+def mrr(rankings: list[list[int]], expected: list[int], k: int) -> float:
+    """Mean reciprocal rank of the expected articles, 0 beyond `k`"""
+    reciprocal_ranks = [
+        1 / (ranking.index(e) + 1) if e in ranking[:k] else 0.0
+        for ranking, e in zip(rankings, expected)
+    ]
+    return (
+        sum(reciprocal_ranks) / len(reciprocal_ranks)
+        if reciprocal_ranks
+        else 0.0
+    )
@@ -0,0 +1,5 @@
+"""Run the retrieval benchmark suite"""
+
+from .retrieval import main
+
+main()
@@ -0,0 +1,106 @@
+"""Recall and latency of IVF search against exact search
+
+Usage: python -m katiba_chat.bench.ann [options]
+
+The article embeddings can be padded with random distractors to see how
+the approximation behaves on corpora larger than the constitution.
+"""
+
+import argparse
+import csv
+import time
+
+import numpy
+
+from ..adapters import ann, retrieval, vectors
+from . import DEFAULT_INDEX_DIR
+from .retrieval import add_data_arguments
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    embeddings, query_embeddings = _embeddings(args)
+
+    k = args.num_results
+    exact_ids, exact_latency = _run(
+        lambda q: vectors.top_k(embeddings @ q, k), query_embeddings
+    )
+    start = time.perf_counter()
+    ivf_index = ann.IVFIndex.build(
+        vectors.NormalizedEmbeddings(embeddings), args.num_lists
+    )
+    build_seconds = time.perf_counter() - start
+
+    print(
+        f"corpus: {len(embeddings)} embeddings, "
+        f"{ivf_index.num_lists} lists, built in {build_seconds:.2f}s"
+    )
+    print(f"{'probes':>8} {'recall@' + str(k):>10} {'ms/query':>10}")
+    print(f"{'exact':>8} {1.0:>10.3f} {exact_latency * 1000:>10.3f}")
+    for num_probes in args.probes:
+        ivf_index.num_probes = num_probes
+        approximate_ids, latency = _run(
+            lambda q: ivf_index.search(q, k)[0], query_embeddings
+        )
+        recall = ann.recall_at_k(approximate_ids, exact_ids)
+        print(f"{num_probes:>8} {recall:>10.3f} {latency * 1000:>10.3f}")
+
+
+def _embeddings(args):
+    """The article embeddings, with any distractors, and the queries'"""
+    index = retrieval.SentenceTransformersIndex(
+        args.articles, args.index_dir, model_name=args.model_name
+    )
+    with open(args.dataset, "rt") as f:
+        questions = [row["question"] for row in csv.DictReader(f)]
+    query_embeddings = vectors.normalize(
+        index.model.encode(questions, normalize_embeddings=True)
+    )
+    embeddings = index.embeddings
+    if args.distractors:
+        embeddings = numpy.concatenate(
+            [embeddings, _distractors(embeddings, args.distractors)]
+        )
+    return embeddings, query_embeddings
+
+
+def _distractors(embeddings, size, noise=0.5, seed=0):
+    """Random perturbations of the given embeddings
+
+    Distractors lie near real articles, so they compete with them for
+    the top results as the documents of a larger legal corpus would
+    """
+    rng = numpy.random.default_rng(seed)
+    dimensions = embeddings.shape[1]
+    bases = embeddings[rng.integers(len(embeddings), size=size)]
+    perturbations = rng.normal(size=(size, dimensions)) / dimensions**0.5
+    return vectors.normalize(bases + noise * perturbations)
+
+
+def _run(search, query_embeddings):
+    """Search for each query, returning the results and mean latency"""
+    start = time.perf_counter()
+    results = [search(q) for q in query_embeddings]
+    return results, (time.perf_counter() - start) / len(query_embeddings)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m katiba_chat.bench.ann", description=__doc__
+    )
+    add_data_arguments(parser, DEFAULT_INDEX_DIR / "sentence_transformers")
+    parser.add_argument("--num-lists", type=int, default=None)
+    parser.add_argument(
+        "--probes", type=int, nargs="+", default=[1, 4, 16, 64]
+    )
+    parser.add_argument(
+        "--distractors",
+        type=int,
+        default=0,
+        help="perturbed copies of article embeddings to add to the corpus",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Parity, quality and latency of the query encoder backends
+
+Usage: python -m katiba_chat.bench.encoders [options]
+
+The evaluation questions are encoded by the PyTorch model of Sentence
+Transformers and by its ONNX export, and searched one at a time in a
+semantic index whose articles were embedded by the same encoder, each
+in its own directory. Query embeddings are not cached, so each search
+encodes its question.
+
+The report gives the seconds each encoder took to import and load, the
+cosine similarity of the ONNX query embeddings to the PyTorch ones, and
+for each encoder the hit rate, MRR and latency of the searches. The
+command fails if the ONNX embeddings are less similar than allowed by
+`--min-similarity`.
+"""
+
+import argparse
+import pathlib
+import sys
+
+from .. import core
+from ..adapters import encoding, retrieval
+from ..core import instrumentation
+from . import DEFAULT_INDEX_DIR, load_dataset
+from .retrieval import add_data_arguments, add_warm_up_argument, run_benchmark
+
+ENCODER_NAMES = ("torch", "onnx")
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    questions, expected = load_dataset(args.dataset)
+    queries = [core.Query(question) for question in questions]
+    # ONNX first, so its load time excludes the imports of PyTorch
+    encoders = {
+        "onnx": instrumentation.timed(
+            encoding.OnnxEncoder.from_pretrained,
+            args.model_name,
+            args.onnx_file,
+        ),
+        "torch": instrumentation.timed(_sentence_transformer, args.model_name),
+    }
+
+    parity = encoding.encoder_parity(
+        encoders["torch"][1], encoders["onnx"][1], questions
+    )
+    print(f"{len(queries)} questions, top {args.num_results} results")
+    print(f"onnx against torch: {parity}")
+    print(
+        f"{'encoder':<8} {'load s':>8} {'hit@k':>7} {'mrr@k':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'qps':>8}"
+    )
+    for name in ENCODER_NAMES:
+        load_seconds, encoder = encoders[name]
+        index = retrieval.SentenceTransformersIndex(
+            args.articles,
+            args.index_dir if name == "torch" else args.onnx_index_dir,
+            model_name=args.model_name,
+            cache_size=0,
+            encoder=encoder,
+        )
+        result = run_benchmark(
+            index, queries, expected, args.num_results, args.warm_up
+        )
+        latency = result["latency_ms"]
+        print(
+            f"{name:<8} {load_seconds:>8.2f} "
+            f"{result['hit_rate']:>7.3f} {result['mrr']:>7.3f} "
+            f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} "
+            f"{latency['p99']:>8.2f} {result['qps']:>8.1f}"
+        )
+
+    if parity.min_similarity < args.min_similarity:
+        print(
+            f"PARITY FAILED: {parity.min_similarity:.4f} "
+            f"< {args.min_similarity:.4f}"
+        )
+        sys.exit(1)
+
+
+def _sentence_transformer(model_name):
+    # pylint: disable=import-outside-toplevel
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m katiba_chat.bench.encoders",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    add_data_arguments(parser, DEFAULT_INDEX_DIR / "sentence_transformers")
+    parser.add_argument(
+        "--onnx-index-dir",
+        type=pathlib.Path,
+        default=DEFAULT_INDEX_DIR / "sentence_transformers_onnx",
+    )
+    parser.add_argument("--onnx-file", default=encoding.DEFAULT_ONNX_FILE)
+    add_warm_up_argument(parser)
+    parser.add_argument(
+        "--min-similarity",
+        type=float,
+        default=0.99,
+        help="lowest cosine similarity of ONNX to PyTorch embeddings",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Hit rate, MRR and latency of the hybrid search fusion strategies
+
+Usage: python -m katiba_chat.bench.fusion [options]
+
+Each question is searched once per backend at the largest candidate
+depth. Every strategy then fuses the candidates within each depth, and
+is scored on whether the article the question was written about is
+among its top results.
+"""
+
+import argparse
+import time
+
+from .. import core
+from ..adapters import fusion, retrieval
+from . import hit_rate, load_dataset, mrr
+from .retrieval import add_data_arguments
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    questions, expected = load_dataset(args.dataset)
+    queries = [core.Query(question) for question in questions]
+    k = args.num_results
+
+    candidates = {}
+    print(f"{len(queries)} questions, top {k} results")
+    print(
+        f"{'strategy':<24} {'depth':>6} {'hit@' + str(k):>8} "
+        f"{'mrr@' + str(k):>8} {'ms/query':>10}"
+    )
+    for name, backend in _backends(args).items():
+        start = time.perf_counter()
+        candidates[name] = backend.search_scored_batch(
+            queries, max(args.depths)
+        )
+        latency = (time.perf_counter() - start) / len(queries)
+        rankings = [
+            [article.number for article, _ in results[:k]]
+            for results in candidates[name]
+        ]
+        _print_row(name, k, _quality(rankings, expected, k), latency)
+
+    for label, strategy in _strategies(args):
+        for depth in args.depths:
+            start = time.perf_counter()
+            rankings = _fused_rankings(strategy, candidates, depth, k)
+            latency = (time.perf_counter() - start) / len(queries)
+            _print_row(label, depth, _quality(rankings, expected, k), latency)
+
+
+def _backends(args):
+    return {
+        "lexical": retrieval.WhooshIndex(
+            args.articles, args.index_dir / "whoosh"
+        ),
+        "semantic": retrieval.SentenceTransformersIndex(
+            args.articles,
+            args.index_dir / "sentence_transformers",
+            model_name=args.model_name,
+        ),
+    }
+
+
+def _strategies(args):
+    for k in args.rrf_k:
+        yield f"rrf k={k:g}", fusion.ReciprocalRankFusion(k)
+    for weight in args.semantic_weights:
+        weights = {"lexical": 1 - weight, "semantic": weight}
+        yield f"weighted w={weight:g}", fusion.WeightedScoreFusion(weights)
+    for weight in args.semantic_weights:
+        yield f"convex alpha={weight:g}", fusion.ConvexCombination(weight)
+
+
+def _fused_rankings(strategy, candidates, depth, k):
+    """The top `k` article numbers fused from `depth` candidates each"""
+    num_queries = len(next(iter(candidates.values())))
+    return [
+        [
+            article.number
+            for article in retrieval.fuse_results(
+                strategy,
+                {
+                    name: results[i][:depth]
+                    for name, results in candidates.items()
+                },
+            )[:k]
+        ]
+        for i in range(num_queries)
+    ]
+
+
+def _quality(rankings, expected, k):
+    return hit_rate(rankings, expected, k), mrr(rankings, expected, k)
+
+
+def _print_row(label, depth, quality, latency):
+    hits, reciprocal_rank = quality
+    print(
+        f"{label:<24} {depth:>6} {hits:>8.3f} {reciprocal_rank:>8.3f} "
+        f"{latency * 1000:>10.3f}"
+    )
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m katiba_chat.bench.fusion", description=__doc__
+    )
+    add_data_arguments(parser)
+    parser.add_argument(
+        "--depths",
+        type=int,
+        nargs="+",
+        default=[5, 20, 50],
+        help="candidates taken from each backend",
+    )
+    parser.add_argument("--rrf-k", type=float, nargs="+", default=[10, 60])
+    parser.add_argument(
+        "--semantic-weights",
+        type=float,
+        nargs="+",
+        default=[0.3, 0.5, 0.7],
+        help="weight of the semantic scores in the score fusions",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""Offline evaluation of the answers of the whole RAG pipeline
+
+Usage: python -m katiba_chat.bench.rag --output answers.jsonl [options]
+
+Each question of the evaluation dataset is answered by retrieving
+articles, fitting them into the prompt and generating an answer, with
+up to `--concurrency` questions in flight. Answers are appended to the
+output file as they complete, so an interrupted run picks up where it
+left off when run again with the same output.
+
+With `--judge-model`, an LLM then rates each answer against the article
+the question was written about, as in `offline_rag_evaluation.ipynb`.
+Verdicts are checkpointed the same way, next to the answers.
+
+The LLM is reached at `--base-url` with the key in LLM_API_KEY. With
+`--stub`, a local stub server answers instead, which needs neither
+network access nor keys and measures the throughput of the pipeline
+itself.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import pathlib
+import threading
+import time
+from collections.abc import Callable, Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from decouple import config
+
+from .. import core
+from ..adapters import generation, retrieval
+from ..core import instrumentation
+from . import (
+    DEFAULT_ARTICLES_PATH,
+    DEFAULT_DATASET_PATH,
+    DEFAULT_INDEX_DIR,
+    hit_rate,
+    load_dataset,
+    stub_llm,
+)
+from .retrieval import latency_percentiles
+
+log = logging.getLogger(__name__)
+
+JUDGE_PROMPT_TEMPLATE = """
+You are an expert evaluator for a Retrieval-Augmented Generation (RAG)
+system. Your task is to analyze the relevance of the generated answer
+compared to the original answer provided. Based on the relevance and
+similarity of the generated answer to the original answer, you will
+classify it as `NON_RELEVANT`, `PARTLY_RELEVANT`, or `RELEVANT`.
+
+Here is the data for evaluation:
+
+# Original Answer
+{original_answer}
+
+# Question
+{question}
+
+# Generated Answer
+{answer}
+
+Please analyze the content and context of the generated answer in
+relation to the original answer and provide your evaluation in parsable
+JSON without using code blocks:
+
+{{
+  "Relevance": "NON_RELEVANT" | "PARTLY_RELEVANT" | "RELEVANT",
+  "Explanation": "[Provide a brief explanation for your evaluation]"
+}}
+""".strip()
+
+
+class Checkpoint:
+    """Records appended to a JSON lines file, keyed by their "id"
+
+    A line left incomplete by an interrupted run is ignored, so that its
+    record is produced again.
+    """
+
+    def __init__(self, path: str | pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.records: dict[int, dict] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, "rt") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.records[record["id"]] = record
+
+    def __contains__(self, record_id: int):
+        return record_id in self.records
+
+    def append(self, record: dict):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "at") as f:
+                f.write(json.dumps(record) + "\n")
+            self.records[record["id"]] = record
+
+
+def run_checkpointed(
+    items: Mapping[int, dict],
+    process: Callable[[dict], dict],
+    checkpoint: Checkpoint,
+    concurrency: int = 8,
+) -> int:
+    """Process the items not yet in `checkpoint`, `concurrency` at a time
+
+    Each result is checkpointed with the id of its item and the seconds
+    taken. Items that fail are logged and left for the next run.
+    Returns the number of failures.
+    """
+    pending = {i: item for i, item in items.items() if i not in checkpoint}
+    log.info(
+        "%d of %d items already done, %d to go",
+        len(items) - len(pending),
+        len(items),
+        len(pending),
+    )
+    failures = 0
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="rag-eval"
+    ) as executor:
+        futures = {
+            executor.submit(instrumentation.timed, process, item): i
+            for i, item in pending.items()
+        }
+        for future in as_completed(futures):
+            item_id = futures[future]
+            try:
+                seconds, result = future.result()
+            except Exception:  # pylint: disable=broad-exception-caught
+                log.exception("Failed to process item %d", item_id)
+                failures += 1
+                continue
+            checkpoint.append({"id": item_id, **result, "seconds": seconds})
+    return failures
+
+
+def answerer(
+    index: core.AbstractIndex,
+    llm: core.AbstractLLM,
+    make_prompt: Callable[[core.Query, list[core.Article]], core.Prompt],
+    num_results: int = 5,
+) -> Callable[[dict], dict]:
+    """Answer a question item through the RAG pipeline"""
+
+    def answer(item: dict) -> dict:
+        query = core.Query(item["question"])
+        articles = list(core.search(index, query, num_results))
+        prompt = make_prompt(query, articles)
+        response = core.generate(llm, prompt)
+        return {
+            "question": item["question"],
+            "article_number": item["article_number"],
+            "retrieved": [article.number for article in articles],
+            "answer": response.text,
+        }
+
+    return answer
+
+
+def judge(
+    llm: core.AbstractLLM, articles: Mapping[int, core.Article]
+) -> Callable[[dict], dict]:
+    """Rate an answer against the article its question is about"""
+
+    def rate(item: dict) -> dict:
+        prompt = judge_prompt(
+            question=item["question"],
+            answer=item["answer"],
+            original_answer=str(articles[item["article_number"]]),
+        )
+        verdict = core.generate(llm, prompt).text
+        try:
+            relevance = json.loads(verdict)["Relevance"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            relevance = None
+        return {"relevance": relevance, "verdict": verdict}
+
+    return rate
+
+
+def judge_prompt(
+    question: str, answer: str, original_answer: str
+) -> core.Prompt:
+    """Prompt asking an LLM to rate a generated answer"""
+    text = JUDGE_PROMPT_TEMPLATE.format(
+        question=question, answer=answer, original_answer=original_answer
+    )
+    # the filled in template is the whole prompt, with no context
+    return core.Prompt("{query}", core.Query(text), [])
+
+
+def summarize(
+    answers: Iterable[dict], verdicts: Iterable[dict], num_results: int
+) -> dict:
+    """Retrieval hit rate, answer latency and judged relevance"""
+    answers = list(answers)
+    relevance = collections.Counter(v["relevance"] for v in verdicts)
+    return {
+        "answers": len(answers),
+        "hit_rate": hit_rate(
+            [a["retrieved"] for a in answers],
+            [a["article_number"] for a in answers],
+            num_results,
+        ),
+        "latency_ms": latency_percentiles([a["seconds"] for a in answers]),
+        "relevance": {str(k): n for k, n in relevance.most_common()},
+    }
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    log.setLevel(logging.INFO)
+    items = _items(args.dataset, args.limit)
+    base_url, api_key, stub_server = _llm_endpoint(args)
+
+    def llm(model_name):
+        return generation.OpenAICompatibleLLM.pooled(
+            model_name,
+            api_key,
+            base_url,
+            max_connections=args.concurrency,
+            max_keepalive_connections=args.concurrency,
+        )
+
+    answers = Checkpoint(args.output)
+    num_answered = len(answers.records)
+    start = time.perf_counter()
+    failures = run_checkpointed(
+        items,
+        answerer(
+            _index(args),
+            llm(args.model_name),
+            _make_prompt,
+            args.num_results,
+        ),
+        answers,
+        args.concurrency,
+    )
+    elapsed = time.perf_counter() - start
+    num_answered = len(answers.records) - num_answered
+
+    verdicts = Checkpoint(_verdicts_path(args.output))
+    if args.judge_model:
+        failures += run_checkpointed(
+            {i: answers.records[i] for i in items if i in answers},
+            judge(llm(args.judge_model), _articles(args.articles)),
+            verdicts,
+            args.concurrency,
+        )
+    if stub_server is not None:
+        stub_server.shutdown()
+
+    summary = summarize(
+        (answers.records[i] for i in items if i in answers),
+        (verdicts.records[i] for i in items if i in verdicts),
+        args.num_results,
+    )
+    summary["failures"] = failures
+    # throughput of this run, which may have resumed an earlier one
+    summary["answers_per_second"] = num_answered / elapsed if elapsed else 0
+    print(json.dumps(summary, indent=2))
+
+
+def _items(dataset_path, limit: int | None) -> dict[int, dict]:
+    """The questions of the dataset, the first `limit` if given"""
+    questions, expected = load_dataset(dataset_path)
+    items = {
+        i: {"question": question, "article_number": article_number}
+        for i, (question, article_number) in enumerate(
+            zip(questions, expected)
+        )
+    }
+    if limit is not None:
+        items = {i: items[i] for i in list(items)[:limit]}
+    return items
+
+
+def _llm_endpoint(args):
+    """Base URL and API key of the LLM, and the stub server if started"""
+    if not args.stub:
+        return args.base_url, config("LLM_API_KEY"), None
+    stub_server = stub_llm.make_server(port=0, latency=args.stub_latency)
+    threading.Thread(target=stub_server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{stub_server.server_port}/v1"
+    return base_url, "stub", stub_server
+
+
+def _articles(articles_path) -> dict[int, core.Article]:
+    with open(articles_path, "rt") as f:
+        return {
+            article.number: article
+            for article in (core.Article(**d) for d in json.load(f))
+        }
+
+
+def _index(args):
+    if args.retrieval == "lexical":
+        return retrieval.WhooshIndex(args.articles, args.index_dir / "whoosh")
+    return retrieval.HybridIndex.from_index_locations(
+        args.index_dir / "whoosh",
+        args.index_dir / "sentence_transformers",
+        args.articles,
+        semantic_index_options={"model_name": args.embedding_model},
+    )
+
+
+def _make_prompt(query, articles):
+    # the app's prompt and its settings, read on import
+    # pylint: disable=import-outside-toplevel
+    from ..entrypoints import factories
+
+    return factories.prompt(query, articles)
+
+
+def _verdicts_path(answers_path) -> pathlib.Path:
+    path = pathlib.Path(answers_path)
+    return path.with_name(f"{path.stem}.verdicts{path.suffix}")
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m katiba_chat.bench.rag",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--output", required=True, help="JSON lines file of the answers"
+    )
+    parser.add_argument("--articles", default=DEFAULT_ARTICLES_PATH)
+    parser.add_argument("--dataset", default=DEFAULT_DATASET_PATH)
+    parser.add_argument(
+        "--index-dir", type=pathlib.Path, default=DEFAULT_INDEX_DIR
+    )
+    parser.add_argument(
+        "--retrieval", choices=("hybrid", "lexical"), default="hybrid"
+    )
+    parser.add_argument(
+        "--embedding-model", default=retrieval.DEFAULT_ST_MODELNAME
+    )
+    parser.add_argument("--num-results", type=int, default=5)
+    parser.add_argument("--limit", type=int, help="questions to answer")
+    parser.add_argument(
+        "--base-url", default=generation.OpenAICompatibleLLM.OPENAI_BASE_URL
+    )
+    parser.add_argument(
+        "--model-name", default=config("LLM_MODEL_NAME", default="stub")
+    )
+    parser.add_argument("--judge-model", help="LLM rating the answers")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="questions answered at the same time",
+    )
+    parser.add_argument(
+        "--stub", action="store_true", help="answer with a local stub LLM"
+    )
+    parser.add_argument(
+        "--stub-latency",
+        type=float,
+        default=0.0,
+        help="seconds the stub LLM takes per request",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
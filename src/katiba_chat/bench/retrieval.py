@@ -0,0 +1,318 @@
+"""Quality, latency and memory of the search indexes
+
+Usage: python -m katiba_chat.bench [options]
+
+Each index is loaded in a process of its own, where it answers every
+question of the evaluation dataset one at a time, after a few warm-up
+searches for other questions. The report gives the hit rate and MRR of
+the article each question was written about, percentiles of the
+per-query latency, the queries answered per second and the peak
+resident memory of the process.
+
+With `--output`, the report is saved as JSON. With `--baseline`, it is
+compared against a report saved earlier, and the command fails if
+quality dropped or latency grew beyond the tolerances.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import pathlib
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from .. import core
+from ..adapters import retrieval
+from ..adapters.store import ArticleStore
+from ..core import instrumentation
+from . import (
+    DEFAULT_ARTICLES_PATH,
+    DEFAULT_DATASET_PATH,
+    DEFAULT_INDEX_DIR,
+    hit_rate,
+    load_dataset,
+    mrr,
+)
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore[assignment]
+
+INDEX_NAMES = ("lexical", "semantic", "hybrid")
+LATENCY_PERCENTILES = (50, 95, 99)
+REPORT_VERSION = 1
+# searched before measuring, so that no measured search hits a cache
+WARM_UP_QUESTIONS = (
+    "What are the functions of Parliament?",
+    "How is the President elected?",
+    "What rights does an arrested person have?",
+    "Who appoints the Chief Justice?",
+    "How are county governments funded?",
+)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    questions, expected = load_dataset(args.dataset)
+    queries = [core.Query(question) for question in questions]
+    report = {
+        "version": REPORT_VERSION,
+        "dataset": str(args.dataset),
+        "num_queries": len(queries),
+        "num_results": args.num_results,
+        "model_name": args.model_name,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "indexes": {},
+    }
+    print(f"{len(queries)} questions, top {args.num_results} results")
+    print(
+        f"{'index':<10} {'load s':>8} {'hit@k':>7} {'mrr@k':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'qps':>8} "
+        f"{'rss MB':>8}"
+    )
+    for name in args.indexes:
+        # a fresh process per index keeps their peak memory apart
+        with ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            result = executor.submit(
+                _benchmark_index, args, name, queries, expected
+            ).result()
+        report["indexes"][name] = result
+        _print_row(name, result)
+
+    if args.output:
+        with open(args.output, "wt") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to: {args.output}")
+    if args.baseline:
+        with open(args.baseline, "rt") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(
+            report,
+            baseline,
+            quality_tolerance=args.quality_tolerance,
+            latency_tolerance=args.latency_tolerance,
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against: {args.baseline}")
+
+
+def run_benchmark(
+    index: core.AbstractIndex,
+    queries: list[core.Query],
+    expected: list[int],
+    num_results: int,
+    warm_up: int = 5,
+) -> dict:
+    """Search for each query in turn, measuring quality and latency
+
+    `warm_up` other queries are searched beforehand, without being
+    measured, so that lazily loaded models are ready but no measured
+    search finds its results cached.
+    """
+    measured = {str(query) for query in queries}
+    warm_up_questions = [q for q in WARM_UP_QUESTIONS if q not in measured]
+    for question in itertools.islice(
+        itertools.cycle(warm_up_questions), warm_up
+    ):
+        index.search(core.Query(question), num_results)
+
+    latencies = []
+    rankings = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        results = index.search(query, num_results)
+        latencies.append(time.perf_counter() - query_start)
+        rankings.append([article.number for article in results])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "hit_rate": hit_rate(rankings, expected, num_results),
+        "mrr": mrr(rankings, expected, num_results),
+        "latency_ms": latency_percentiles(latencies),
+        "qps": len(queries) / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def latency_percentiles(latencies: list[float]) -> dict[str, float]:
+    """Percentiles of latencies in seconds, in milliseconds"""
+    if not latencies:
+        return {f"p{p}": 0.0 for p in LATENCY_PERCENTILES}
+    values = numpy.percentile(
+        numpy.asarray(latencies) * 1000, LATENCY_PERCENTILES
+    )
+    return {f"p{p}": float(v) for p, v in zip(LATENCY_PERCENTILES, values)}
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident memory of this process in MB, None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return peak * scale / 2**20
+
+
+def compare_reports(
+    report: dict,
+    baseline: dict,
+    quality_tolerance: float = 0.01,
+    latency_tolerance: float = 0.2,
+) -> list[str]:
+    """Describe how `report` regressed from `baseline`
+
+    Hit rate and MRR may drop by `quality_tolerance` in absolute terms.
+    Latency percentiles and peak memory may grow, and QPS drop, by the
+    `latency_tolerance` fraction of their baseline value. Indexes
+    missing from either report are not compared.
+    """
+    regressions = []
+    for name, result in report["indexes"].items():
+        base = baseline.get("indexes", {}).get(name)
+        if base is None:
+            continue
+        for metric in ("hit_rate", "mrr"):
+            if result[metric] < base[metric] - quality_tolerance:
+                regressions.append(
+                    f"{name} {metric}: {result[metric]:.3f} "
+                    f"< {base[metric]:.3f}"
+                )
+        growing = [
+            (f"latency {p}", result["latency_ms"][p], base["latency_ms"][p])
+            for p in base["latency_ms"]
+            if p in result["latency_ms"]
+        ]
+        if result.get("peak_rss_mb") and base.get("peak_rss_mb"):
+            growing.append(
+                ("peak_rss_mb", result["peak_rss_mb"], base["peak_rss_mb"])
+            )
+        for metric, value, base_value in growing:
+            if value > base_value * (1 + latency_tolerance):
+                regressions.append(
+                    f"{name} {metric}: {value:.3f} > {base_value:.3f}"
+                )
+        if result["qps"] < base["qps"] * (1 - latency_tolerance):
+            regressions.append(
+                f"{name} qps: {result['qps']:.1f} < {base['qps']:.1f}"
+            )
+    return regressions
+
+
+def _benchmark_index(args, name, queries, expected) -> dict:
+    """Load the named index and benchmark it"""
+    load_seconds, index = _load_index(args, name)
+    result = run_benchmark(
+        index, queries, expected, args.num_results, args.warm_up
+    )
+    result["load_seconds"] = load_seconds
+    return result
+
+
+def _load_index(args, name):
+    """The named index with the seconds to load it"""
+    store = ArticleStore(args.index_dir / ArticleStore.FILENAME, args.articles)
+    backends = {}
+    if name in ("lexical", "hybrid"):
+        backends["lexical"] = instrumentation.timed(
+            retrieval.WhooshIndex,
+            args.articles,
+            args.index_dir / "whoosh",
+            store=store,
+        )
+    if name in ("semantic", "hybrid"):
+        backends["semantic"] = instrumentation.timed(
+            retrieval.SentenceTransformersIndex,
+            args.articles,
+            args.index_dir / "sentence_transformers",
+            model_name=args.model_name,
+            store=store,
+        )
+    if name != "hybrid":
+        return backends[name]
+    return (
+        backends["lexical"][0] + backends["semantic"][0],
+        retrieval.HybridIndex(
+            backends["lexical"][1], backends["semantic"][1], store=store
+        ),
+    )
+
+
+def _print_row(name, result):
+    latency = result["latency_ms"]
+    rss = result["peak_rss_mb"]
+    print(
+        f"{name:<10} {result['load_seconds']:>8.2f} "
+        f"{result['hit_rate']:>7.3f} {result['mrr']:>7.3f} "
+        f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} "
+        f"{latency['p99']:>8.2f} {result['qps']:>8.1f} "
+        f"{rss if rss is not None else float('nan'):>8.1f}"
+    )
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m katiba_chat.bench",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    add_data_arguments(parser)
+    parser.add_argument(
+        "--indexes",
+        nargs="+",
+        choices=INDEX_NAMES,
+        default=list(INDEX_NAMES),
+    )
+    add_warm_up_argument(parser)
+    parser.add_argument("--output", help="file to save the JSON report to")
+    parser.add_argument(
+        "--baseline", help="JSON report to check for regressions against"
+    )
+    parser.add_argument(
+        "--quality-tolerance",
+        type=float,
+        default=0.01,
+        help="drop in hit rate and MRR allowed",
+    )
+    parser.add_argument(
+        "--latency-tolerance",
+        type=float,
+        default=0.2,
+        help="fraction by which latency and memory may grow, and QPS drop",
+    )
+    return parser.parse_args(argv)
+
+
+def add_data_arguments(
+    parser: argparse.ArgumentParser,
+    index_dir: pathlib.Path = DEFAULT_INDEX_DIR,
+):
+    """Add the arguments locating the articles, questions and indexes"""
+    parser.add_argument("--articles", default=DEFAULT_ARTICLES_PATH)
+    parser.add_argument("--dataset", default=DEFAULT_DATASET_PATH)
+    parser.add_argument("--index-dir", type=pathlib.Path, default=index_dir)
+    parser.add_argument("--model-name", default=retrieval.DEFAULT_ST_MODELNAME)
+    parser.add_argument("--num-results", type=int, default=5)
+
+
+def add_warm_up_argument(parser: argparse.ArgumentParser):
+    """Add the argument of how many queries to search before measuring"""
+    parser.add_argument(
+        "--warm-up",
+        type=int,
+        default=5,
+        help="queries searched before measuring",
+    )
@@ -0,0 +1,152 @@
+"""Deterministic OpenAI-compatible chat completions server
+
+Usage: python -m katiba_chat.bench.stub_llm [options]
+
+Answers every chat completion request, streamed or not, with text
+derived from a hash of the prompt, so the same prompt always gets the
+same answer. Prompts asking for a relevance judgement get a JSON
+verdict. An optional delay per request stands in for the latency of a
+real provider, so the pipeline can be benchmarked and tested without
+network access or API keys.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8766
+COMPLETIONS_PATH = "/v1/chat/completions"
+RELEVANCE_LABELS = ("RELEVANT", "PARTLY_RELEVANT", "NON_RELEVANT")
+
+
+def stub_answer(prompt: str) -> str:
+    """The answer the stub gives to `prompt`"""
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    if '"Relevance"' in prompt:
+        return json.dumps(
+            {
+                "Relevance": RELEVANCE_LABELS[int(digest, 16) % 3],
+                "Explanation": f"Stub verdict {digest[:8]}",
+            }
+        )
+    return f"Stub answer {digest[:8]} to a prompt of {len(prompt)} characters"
+
+
+def make_server(
+    host: str = "127.0.0.1", port: int = DEFAULT_PORT, latency: float = 0.0
+) -> ThreadingHTTPServer:
+    """Create a stub server that waits `latency` seconds per request"""
+
+    class CompletionsHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            if self.path != COMPLETIONS_PATH:
+                self.send_error(404)
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+                prompt = "".join(m["content"] for m in request["messages"])
+            except (ValueError, KeyError, TypeError):
+                self.send_error(400, "Expected a chat completions request")
+                return
+            time.sleep(latency)
+            answer = stub_answer(prompt)
+            model = request.get("model", "stub")
+            if request.get("stream"):
+                self._stream(model, answer)
+            else:
+                self._send_json(_completion(model, prompt, answer))
+
+        def log_message(self, format, *args):
+            # pylint: disable=redefined-builtin
+            log.debug(format, *args)
+
+        def _send_json(self, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, model, answer):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            for i, word in enumerate(answer.split(" ")):
+                content = word if i == 0 else f" {word}"
+                self._send_event(_chunk(model, {"content": content}))
+            self._send_event(_chunk(model, {}, finish_reason="stop"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def _send_event(self, data):
+            self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+    return ThreadingHTTPServer((host, port), CompletionsHandler)
+
+
+def _completion(model: str, prompt: str, answer: str) -> dict:
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": len(prompt.split()),
+            "completion_tokens": len(answer.split()),
+            "total_tokens": len(prompt.split()) + len(answer.split()),
+        },
+    }
+
+
+def _chunk(model: str, delta: dict, finish_reason: str | None = None):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": model,
+        "choices": [
+            {"index": 0, "delta": delta, "finish_reason": finish_reason}
+        ],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m katiba_chat.bench.stub_llm", description=__doc__
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds to wait before answering each request",
+    )
+    args = parser.parse_args(argv)
+    server = make_server(args.host, args.port, args.latency)
+    print(f"Serving stub completions at http://{args.host}:{args.port}/v1")
+    with server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
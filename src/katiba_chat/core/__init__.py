@@ -1,20 +1,38 @@
 """Entity and Use Case Layer"""
 
+import dataclasses
+import math
+import re
 import textwrap
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable, Iterator, Sequence
 from dataclasses import dataclass
-from typing import Protocol
+from typing import AsyncIterator, Protocol
+
+from . import instrumentation
+
+# a numbered clause such as "(1)" or "(2A)" starting a line
+CLAUSE_MARKER = re.compile(r"^\(\d+[A-Z]?\)", re.MULTILINE)
+CONTEXT_SEPARATOR = "\n\n"
+# ends the clauses of an article cut short to fit the prompt
+TRUNCATION_MARKER = "[...]"
+
+
+class IndexNotReadyError(Exception):
+    """Raised by an index that is still loading and cannot search yet"""
 
 
 @dataclass
 class Query:
+    """A question, searched in the named `corpora` only if given"""
+
     text: str
+    corpora: frozenset[str] | None = None
 
     def __str__(self):
         return self.text
 
 
-@dataclass
+@dataclass(slots=True)
 class Article:
     title: str
     clauses: str
@@ -35,18 +53,79 @@ class Article:
         return fmt.format(self.clauses).strip()
 
 
+@dataclass
+class Clause:
+    """A passage of an article's clauses"""
+
+    article_number: int
+    position: int
+    text: str
+
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    """Rough number of LLM tokens in `text`
+
+    English text averages about four characters per token with the
+    tokenizers of most LLMs.
+    """
+    return math.ceil(len(text) / chars_per_token)
+
+
 @dataclass
 class Prompt:
+    """A prompt for the LLM, with the context fitted to a token budget
+
+    Context items are added in their ranked order while they fit in
+    `max_context_tokens`, as counted by `count_tokens`. The first item
+    that does not fit has its clauses cut short to fill what remains of
+    the budget, down to the leading words of its first line, and items
+    that do not fit even then are left out.
+    """
+
     template: str
     query: Query
     context: Iterable[Article]
+    max_context_tokens: int | None = None
+    count_tokens: Callable[[str], int] = dataclasses.field(
+        default=estimate_tokens, repr=False
+    )
 
     def __str__(self):
         return self.template.format(
             query=str(self.query),
-            context="\n\n".join([str(item) for item in self.context]),
+            context=CONTEXT_SEPARATOR.join(
+                [str(item) for item in self.context_items]
+            ),
         )
 
+    @property
+    def context_items(self) -> list[Article]:
+        """The context items that fit in `max_context_tokens`"""
+        if self.max_context_tokens is None:
+            return list(self.context)
+        separator_tokens = self.count_tokens(CONTEXT_SEPARATOR)
+        items: list[Article] = []
+        remaining = self.max_context_tokens
+        for item in self.context:
+            if items:
+                budget = remaining - separator_tokens
+            else:
+                budget = remaining
+            tokens = self.count_tokens(str(item))
+            if tokens > budget:
+                truncated = _truncate(item, budget, self.count_tokens)
+                if truncated is None:
+                    continue
+                item, tokens = truncated
+            items.append(item)
+            remaining = budget - tokens
+        return items
+
+    @property
+    def token_count(self) -> int:
+        """Tokens in the whole prompt, as counted by `count_tokens`"""
+        return self.count_tokens(str(self))
+
 
 @dataclass
 class LLMResponse:
@@ -56,22 +135,250 @@ class LLMResponse:
         return self.text
 
 
-class AbstractIndex(Protocol):  # pylint: disable=too-few-public-methods
+class AbstractIndex(Protocol):
     def search(self, query: Query, num_results: int) -> Iterable[Article]: ...
 
+    def search_batch(
+        self, queries: Sequence[Query], num_results: int
+    ) -> list[Iterable[Article]]:
+        """Search for each of the queries
+
+        Falls back to searching for them one at a time
+        """
+        return [self.search(query, num_results) for query in queries]
+
+    def search_scored(
+        self, query: Query, num_results: int
+    ) -> list[tuple[Article, float]]:
+        """Search, pairing each article with its relevance score
 
-class AbstractLLM(Protocol):  # pylint: disable=too-few-public-methods
+        Falls back to scores that decrease with the rank of the results
+        """
+        return [
+            (article, 1 / rank)
+            for rank, article in enumerate(self.search(query, num_results), 1)
+        ]
+
+    def search_scored_batch(
+        self, queries: Sequence[Query], num_results: int
+    ) -> list[list[tuple[Article, float]]]:
+        """Search for each of the queries, with relevance scores
+
+        Falls back to searching for them one at a time
+        """
+        return [self.search_scored(query, num_results) for query in queries]
+
+    def search_ids(
+        self, query: Query, num_results: int
+    ) -> list[tuple[int, float]]:
+        """Search, giving the article numbers with their relevance scores
+
+        Indexes that look articles up by number only after ranking them
+        can skip reading the articles that are not returned in the end.
+        Falls back to the numbers of the articles of a scored search.
+        """
+        return [
+            (article.number, score)
+            for article, score in self.search_scored(query, num_results)
+        ]
+
+    def search_ids_batch(
+        self, queries: Sequence[Query], num_results: int
+    ) -> list[list[tuple[int, float]]]:
+        """Search for each of the queries, giving article numbers
+
+        Falls back to searching for them one at a time
+        """
+        return [self.search_ids(query, num_results) for query in queries]
+
+
+class AbstractLLM(Protocol):
     def generate(self, prompt: Prompt) -> LLMResponse: ...
 
+    def generate_stream(self, prompt: Prompt) -> Iterator[LLMResponse]:
+        """Yield the response in parts as they are generated
+
+        Falls back to a single part containing the complete response
+        """
+        yield self.generate(prompt)
+
+    def generate_batch(self, prompts: Sequence[Prompt]) -> list[LLMResponse]:
+        """Generate a response to each of the prompts
+
+        Falls back to generating them one at a time
+        """
+        return [self.generate(prompt) for prompt in prompts]
+
+
+class AbstractAsyncIndex(Protocol):
+    # pylint: disable=too-few-public-methods
+    async def search(
+        self, query: Query, num_results: int
+    ) -> Iterable[Article]: ...
+
+
+class AbstractAsyncLLM(Protocol):
+    async def generate(self, prompt: Prompt) -> LLMResponse: ...
+
+    async def generate_stream(
+        self, prompt: Prompt
+    ) -> AsyncIterator[LLMResponse]:
+        """Yield the response in parts as they are generated
+
+        Falls back to a single part containing the complete response
+        """
+        yield await self.generate(prompt)
+
+
+def split_clauses(article: Article, max_chars: int = 1000) -> list[Clause]:
+    """Split the clauses of an article into passages
+
+    Passages start at numbered clauses. Text without numbered clauses,
+    and clauses longer than `max_chars`, are split between lines.
+    """
+    text = article.clauses
+    starts = [match.start() for match in CLAUSE_MARKER.finditer(text)]
+    bounds = sorted({0, *starts, len(text)})
+    passages = []
+    for start, end in zip(bounds, bounds[1:]):
+        if piece := text[start:end].strip():
+            passages.extend(_split_lines(piece, max_chars))
+    return [
+        Clause(article.number, position, passage)
+        for position, passage in enumerate(passages)
+    ]
+
+
+def excerpt(article: Article, clauses: Iterable[Clause]) -> Article:
+    """Copy `article`, keeping only the given clauses in article order"""
+    ordered = sorted(clauses, key=lambda clause: clause.position)
+    return dataclasses.replace(
+        article, clauses="\n".join(clause.text for clause in ordered)
+    )
+
+
+def _truncate(
+    article: Article, budget: int, count_tokens: Callable[[str], int]
+) -> tuple[Article, int] | None:
+    """Keep as many leading lines of the clauses as fit in `budget`
+
+    If not even the first line fits, as many of its leading words as fit
+    are kept instead. Returns the truncated article and its tokens, or
+    None if not even the first word fits
+    """
+    lines = article.clauses.splitlines()
+    truncated = _keep_leading(article, lines, "\n", budget, count_tokens)
+    if truncated is None and lines:
+        truncated = _keep_leading(
+            article, lines[0].split(), " ", budget, count_tokens
+        )
+    return truncated
+
+
+def _keep_leading(
+    article: Article,
+    parts: list[str],
+    separator: str,
+    budget: int,
+    count_tokens: Callable[[str], int],
+) -> tuple[Article, int] | None:
+    """Keep the most leading `parts` of the clauses that fit, but not all"""
+    best = None
+    low, high = 1, len(parts) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        truncated = dataclasses.replace(
+            article,
+            clauses=separator.join(parts[:middle] + [TRUNCATION_MARKER]),
+        )
+        tokens = count_tokens(str(truncated))
+        if tokens <= budget:
+            best = truncated, tokens
+            low = middle + 1
+        else:
+            high = middle - 1
+    return best
+
+
+def _split_lines(text: str, max_chars: int) -> list[str]:
+    """Group the lines of `text` into pieces of up to `max_chars`"""
+    pieces: list[str] = []
+    lines: list[str] = []
+    size = 0
+    for line in text.splitlines():
+        if lines and size + len(line) > max_chars:
+            pieces.append("\n".join(lines))
+            lines, size = [], 0
+        lines.append(line)
+        size += len(line) + 1
+    if lines:
+        pieces.append("\n".join(lines))
+    return pieces
+
+
+def unscored(results: Iterable[tuple[Article, float]]) -> list[Article]:
+    """The articles of scored search results, in their order"""
+    return [article for article, _ in results]
+
 
 def search(
     index: AbstractIndex, query: Query, num_results: int = 5
 ) -> Iterable[Article]:
-    return index.search(query, num_results)
+    with instrumentation.span("search", num_results=num_results):
+        return index.search(query, num_results)
+
+
+def search_batch(
+    index: AbstractIndex, queries: Sequence[Query], num_results: int = 5
+) -> list[Iterable[Article]]:
+    with instrumentation.span("search_batch", num_queries=len(queries)):
+        return index.search_batch(queries, num_results)
 
 
 def generate(
     llm: AbstractLLM,
     prompt: Prompt,
 ) -> LLMResponse:
-    return llm.generate(prompt)
+    with instrumentation.span("generate"):
+        return llm.generate(prompt)
+
+
+def generate_stream(
+    llm: AbstractLLM,
+    prompt: Prompt,
+) -> Iterator[LLMResponse]:
+    return instrumentation.timed_iter(
+        "generate_stream", llm.generate_stream(prompt)
+    )
+
+
+def generate_batch(
+    llm: AbstractLLM,
+    prompts: Sequence[Prompt],
+) -> list[LLMResponse]:
+    with instrumentation.span("generate_batch", num_prompts=len(prompts)):
+        return llm.generate_batch(prompts)
+
+
+async def search_async(
+    index: AbstractAsyncIndex, query: Query, num_results: int = 5
+) -> Iterable[Article]:
+    with instrumentation.span("search", num_results=num_results):
+        return await index.search(query, num_results)
+
+
+async def generate_async(
+    llm: AbstractAsyncLLM,
+    prompt: Prompt,
+) -> LLMResponse:
+    with instrumentation.span("generate"):
+        return await llm.generate(prompt)
+
+
+def generate_stream_async(
+    llm: AbstractAsyncLLM,
+    prompt: Prompt,
+) -> AsyncIterator[LLMResponse]:
+    return instrumentation.timed_aiter(
+        "generate_stream", llm.generate_stream(prompt)
+    )
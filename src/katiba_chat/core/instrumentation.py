@@ -0,0 +1,285 @@
+"""Timings and counters of the stages of answering a question
+
+Instrumentation is off by default, in which case spans and counters
+return after checking a flag. Once `enable`d, each span records its
+duration in a histogram by stage name and is logged as a JSON line at
+debug level, with the trace it belongs to. Counters add up quantities
+such as tokens and cache hits, and gauges hold the latest value of
+settings and levels. `render` gives all of them in the Prometheus text
+format.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+METRIC_PREFIX = "katiba_chat"
+# upper bounds in seconds of the span duration histogram buckets
+BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+Labels = tuple[tuple[str, str], ...]
+
+_current_span: contextvars.ContextVar[tuple[str, str] | None]
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Histogram:
+    """Counts of observations by bucket, with their count and sum"""
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def render(self, metric: str, labels: str) -> list[str]:
+        """The lines of `metric` with `labels` in the Prometheus format"""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(
+            (*map(str, BUCKETS), "+Inf"), self.bucket_counts
+        ):
+            cumulative += count
+            lines.append(
+                f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            )
+        lines.append(f"{metric}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{metric}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Registry:
+    """Span histograms, counters and gauges, recorded only while enabled"""
+
+    def __init__(self):
+        self.enabled = False
+        self._histograms: dict[str, Histogram] = {}
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._gauges: dict[tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float):
+        """Record a duration of the stage called `name`"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        """Add `value` to the counter called `name` with `labels`"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        """Set the gauge called `name` with `labels` to `value`"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def counter(self, name: str, **labels: str) -> float:
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def gauge(self, name: str, **labels: str) -> float | None:
+        return self._gauges.get((name, tuple(sorted(labels.items()))))
+
+    def histogram(self, name: str) -> Histogram | None:
+        return self._histograms.get(name)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+        lines = []
+        if histograms:
+            metric = f"{METRIC_PREFIX}_span_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+        for name, histogram in histograms:
+            lines.extend(histogram.render(metric, f'span="{name}"'))
+        typed = set()
+        for kind, (name, labels), value in [
+            *(("counter", key, value) for key, value in counters),
+            *(("gauge", key, value) for key, value in gauges),
+        ]:
+            metric = f"{METRIC_PREFIX}_{name}"
+            if kind == "counter":
+                metric += "_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} {kind}")
+                typed.add(metric)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(
+                f"{metric}{{{label_text}}} {value}"
+                if label_text
+                else f"{metric} {value}"
+            )
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+registry = Registry()
+
+
+def enable():
+    registry.enabled = True
+
+
+def disable():
+    registry.enabled = False
+
+
+def enabled() -> bool:
+    return registry.enabled
+
+
+def increment(name: str, value: float = 1, **labels: str):
+    registry.increment(name, value, **labels)
+
+
+def observe(name: str, seconds: float):
+    registry.observe(name, seconds)
+
+
+def set_gauge(name: str, value: float, **labels: str):
+    registry.set_gauge(name, value, **labels)
+
+
+def render() -> str:
+    return registry.render()
+
+
+def span(name: str, **attributes):
+    """Time the stage called `name` as a span of the current trace
+
+    Spans started within it, in the same thread or task, are its
+    children. `attributes` are added to the span's log line.
+    """
+    if not registry.enabled:
+        return contextlib.nullcontext()
+    return _span(name, attributes)
+
+
+def timed(func: Callable, *args, **kwargs) -> tuple[float, Any]:
+    """Call `func`, returning the seconds it took and its result"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def timed_iter(name: str, items: Iterator) -> Iterator:
+    """Pass on `items`, recording the time to the first one and to the end
+
+    Unlike a span, this does not make the stage the parent of the spans
+    of whoever consumes the items, as a generator cannot tell.
+    """
+    if not registry.enabled:
+        return items
+    return _timed_iter(name, items)
+
+
+def _timed_iter(name: str, items: Iterator) -> Iterator:
+    start = time.perf_counter()
+    first = True
+    try:
+        for item in items:
+            if first:
+                registry.observe(
+                    f"{name}.first_item", time.perf_counter() - start
+                )
+                first = False
+            yield item
+    finally:
+        registry.observe(name, time.perf_counter() - start)
+
+
+def timed_aiter(name: str, items: AsyncIterator) -> AsyncIterator:
+    """Like `timed_iter`, for asynchronous iterators"""
+    if not registry.enabled:
+        return items
+    return _timed_aiter(name, items)
+
+
+async def _timed_aiter(name: str, items: AsyncIterator) -> AsyncIterator:
+    start = time.perf_counter()
+    first = True
+    try:
+        async for item in items:
+            if first:
+                registry.observe(
+                    f"{name}.first_item", time.perf_counter() - start
+                )
+                first = False
+            yield item
+    finally:
+        registry.observe(name, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def _span(name: str, attributes: dict):
+    parent = _current_span.get()
+    trace_id = parent[0] if parent else uuid.uuid4().hex[:16]
+    span_id = uuid.uuid4().hex[:8]
+    token = _current_span.set((trace_id, span_id))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _current_span.reset(token)
+        registry.observe(name, seconds)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                json.dumps(
+                    {
+                        "span": name,
+                        "trace_id": trace_id,
+                        "span_id": span_id,
+                        "parent_id": parent[1] if parent else None,
+                        "duration_ms": round(seconds * 1000, 3),
+                        **attributes,
+                    }
+                )
+            )
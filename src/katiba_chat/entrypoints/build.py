@@ -0,0 +1,70 @@
+"""Offline index build
+
+Creates the search indexes where the other entrypoints look for them,
+so that they are never built at request time.
+"""
+
+import argparse
+import os
+
+from ..adapters import indexing
+from . import common, factories
+
+
+def build_indexes(batch_size: int = 64, workers: int = 1, procs: int = 1):
+    """Build both indexes of each corpus from scratch
+
+    The article store they share is written too, if it is out of date.
+    Returns a report for each index.
+    """
+    reports = []
+    for corpus in common.CORPORA:
+        data_path = factories.index_data_path(corpus)
+        factories.article_store(corpus).open()
+        lexical_report = indexing.build_lexical_index(
+            data_path,
+            common.corpus_data_dir(corpus, common.LEXICAL_INDEX_DIRNAME),
+            procs=procs,
+            index_cls=common.HYBRID_INDEX_CLS.LEXICAL_INDEX_CLS,
+        )
+        semantic_report = indexing.build_semantic_index(
+            data_path,
+            common.corpus_data_dir(corpus, common.SEMANTIC_INDEX_DIRNAME),
+            batch_size=batch_size,
+            workers=workers,
+            index_cls=common.HYBRID_INDEX_CLS.SEMANTIC_INDEX_CLS,
+            index_options=common.SEMANTIC_INDEX_OPTIONS,
+            encoder=factories.query_encoder(),
+        )
+        if len(common.CORPORA) > 1:
+            for report in (lexical_report, semantic_report):
+                report.name = f"{corpus} {report.name}"
+        reports.extend([lexical_report, semantic_report])
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m katiba_chat build-index", description=__doc__
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="articles embedded per batch",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes embedding batches in parallel",
+    )
+    parser.add_argument(
+        "--procs",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="processes writing the lexical index",
+    )
+    args = parser.parse_args(argv)
+    for report in build_indexes(args.batch_size, args.workers, args.procs):
+        print(report)
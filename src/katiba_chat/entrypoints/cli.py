@@ -1,27 +1,69 @@
 """CLI Interface"""
 
+import atexit
+import functools
 import sys
+from collections.abc import Iterator
 
 from .. import core
-from ..adapters import generation, retrieval
-from . import common
+from ..adapters import caching
+from ..core import instrumentation
+from . import common, factories, server
 
-st_index_dirname = common.user_data_dir("sentence_transformers_index")
-whoosh_index_dirname = common.user_data_dir("whoosh_index")
-
-hybrid_index = retrieval.HybridIndex.from_index_locations(
-    whoosh_index_dirname, st_index_dirname, data_location=common.ARTICLES_PATH
+hybrid_index = factories.hybrid_index()
+reranked_index = factories.reranked_index(factories.corpus_index(hybrid_index))
+index = caching.CachedIndex(
+    reranked_index, max_size=common.RETRIEVAL_CACHE_SIZE
 )
+atexit.register(factories.save_metrics)
+
+
+@functools.cache
+def llm():
+    """The LLM, created on first use so that forwarding needs no settings"""
+    return factories.cached_llm(
+        factories.shared_llm(), hybrid_index.semantic_index
+    )
 
 
 def entrypoint(question: str):
+    """Print the answer to `question`
+
+    The question is forwarded to a running query server if there is
+    one, and answered in this process otherwise
+    """
+
+    try:
+        answer_parts = server.forward(
+            question, common.SERVER_HOST, common.SERVER_PORT
+        )
+    except server.ServerUnavailableError:
+        answer_parts = answer(question)
+    for part in answer_parts:
+        print(part, end="", file=sys.stdout, flush=True)
+    print(file=sys.stdout)
+
+
+def answer(question: str) -> Iterator[str]:
 
     query = core.Query(question)
 
-    retrieval_results = core.search(hybrid_index, query)
-    prompt = core.Prompt(common.PROMPT_TEMPLATE, query, retrieval_results)
-    llm = generation.OpenAICompatibleLLM(
-        common.LLM_MODEL_NAME, common.LLM_API_KEY, common.LLM_BASE_URL
+    retrieval_results = core.search(index, query, common.NUM_RESULTS)
+    prompt = factories.prompt(query, retrieval_results)
+    for response in core.generate_stream(llm(), prompt):
+        yield str(response)
+
+
+def serve():
+    """Load the indexes and answer questions until interrupted"""
+    llm()
+    hybrid_index.lexical_index.get()
+    hybrid_index.semantic_index.get()
+    if common.RERANK:
+        reranked_index.warm_up()
+    server.serve(
+        answer,
+        common.SERVER_HOST,
+        common.SERVER_PORT,
+        metrics=instrumentation.render if common.INSTRUMENTATION else None,
     )
-    response = core.generate(llm, prompt)
-    print(response, file=sys.stdout)
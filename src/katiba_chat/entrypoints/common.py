@@ -6,22 +6,165 @@ import sys
 
 from decouple import config
 
-from ..adapters import generation
+from ..adapters import ann, generation, retrieval
+from ..adapters.encoding import DEFAULT_ONNX_FILE
+from ..adapters.reranking import DEFAULT_CROSS_ENCODER
+from ..core import instrumentation
+from . import server
+
+
+def _optional_float(value):
+    return float(value) if value else None
+
 
-LLM_API_KEY = config("LLM_API_KEY")
 LLM_BASE_URL = config(
     "LLM_BASE_URL", default=generation.OpenAICompatibleLLM.OPENAI_BASE_URL
 )
-LLM_MODEL_NAME = config("LLM_MODEL_NAME")
+LLM_CLIENT_OPTIONS = {
+    "max_connections": config("LLM_MAX_CONNECTIONS", default=100, cast=int),
+    "max_keepalive_connections": config(
+        "LLM_MAX_KEEPALIVE_CONNECTIONS", default=20, cast=int
+    ),
+    "keepalive_expiry": config(
+        "LLM_KEEPALIVE_EXPIRY", default=30.0, cast=float
+    ),
+    "max_retries": config("LLM_MAX_RETRIES", default=3, cast=int),
+    "timeout": config("LLM_TIMEOUT", default=600.0, cast=float),
+}
+
+
+HYBRID_SEARCH_CONCURRENT = config(
+    "HYBRID_SEARCH_CONCURRENT", default=False, cast=bool
+)
+HYBRID_SEARCH_TIMEOUTS = {
+    "lexical": config(
+        "LEXICAL_SEARCH_TIMEOUT", default="", cast=_optional_float
+    ),
+    "semantic": config(
+        "SEMANTIC_SEARCH_TIMEOUT", default="", cast=_optional_float
+    ),
+}
+FUSION = config("FUSION", default="rrf")
+FUSION_SEMANTIC_WEIGHT = config(
+    "FUSION_SEMANTIC_WEIGHT", default=0.5, cast=float
+)
+if FUSION == "rrf":
+    FUSION_OPTIONS = {"k": config("RRF_K", default=60, cast=float)}
+elif FUSION == "weighted":
+    FUSION_OPTIONS = {
+        "weights": {
+            "lexical": 1 - FUSION_SEMANTIC_WEIGHT,
+            "semantic": FUSION_SEMANTIC_WEIGHT,
+        }
+    }
+else:
+    FUSION_OPTIONS = {"alpha": FUSION_SEMANTIC_WEIGHT}
+FUSION_CANDIDATE_DEPTH = config(
+    "FUSION_CANDIDATE_DEPTH", default="", cast=lambda v: int(v) if v else None
+)
+SEMANTIC_INDEX_OPTIONS = {
+    "embedding_dtype": config("EMBEDDING_DTYPE", default="float32"),
+}
+ENCODER_BACKEND = config("ENCODER_BACKEND", default="torch")
+ENCODER_ONNX_FILE = config("ENCODER_ONNX_FILE", default=DEFAULT_ONNX_FILE)
+SEMANTIC_SEARCH = config("SEMANTIC_SEARCH", default="exact")
+HYBRID_INDEX_CLASSES: dict[str, type[retrieval.HybridIndex]] = {
+    "exact": retrieval.HybridIndex,
+    "ivf": ann.ApproximateHybridIndex,
+}
+HYBRID_INDEX_CLS = HYBRID_INDEX_CLASSES[SEMANTIC_SEARCH]
+if SEMANTIC_SEARCH == "ivf":
+    SEMANTIC_INDEX_OPTIONS["num_probes"] = config(
+        "IVF_NUM_PROBES", default=8, cast=int
+    )
+QUERY_BATCHING = config("QUERY_BATCHING", default=False, cast=bool)
+QUERY_BATCHING_OPTIONS = {
+    "max_batch_size": config("QUERY_BATCH_SIZE", default=32, cast=int),
+    "max_wait": config("QUERY_BATCH_WAIT", default=0.005, cast=float),
+}
+RETRIEVAL_CACHE_SIZE = config("RETRIEVAL_CACHE_SIZE", default=1024, cast=int)
+RETRIEVAL_GRANULARITY = config("RETRIEVAL_GRANULARITY", default="article")
+if RETRIEVAL_GRANULARITY == "clause":
+    LEXICAL_INDEX_DIRNAME = "whoosh_clause_index"
+    SEMANTIC_INDEX_DIRNAME = "sentence_transformers_clause_index"
+    ARTICLE_STORE_FILENAME = "clause_passages.store"
+else:
+    LEXICAL_INDEX_DIRNAME = "whoosh_index"
+    SEMANTIC_INDEX_DIRNAME = "sentence_transformers_index"
+    ARTICLE_STORE_FILENAME = "articles.store"
+MAX_CONTEXT_TOKENS = config(
+    "MAX_CONTEXT_TOKENS", default="", cast=lambda v: int(v) if v else None
+)
+CONTEXT_TOKENIZER = config("CONTEXT_TOKENIZER", default="")
+NUM_RESULTS = config("NUM_RESULTS", default=5, cast=int)
+RERANK = config("RERANK", default=False, cast=bool)
+RERANK_OPTIONS = {
+    "model_name": config("RERANK_MODEL", default=DEFAULT_CROSS_ENCODER),
+    "candidate_depth": config("RERANK_CANDIDATES", default=20, cast=int),
+    "latency_budget": config(
+        "RERANK_LATENCY_BUDGET", default="", cast=_optional_float
+    ),
+}
+
+ANSWER_CACHE = config("ANSWER_CACHE", default=False, cast=bool)
+ANSWER_CACHE_OPTIONS = {
+    "similarity_threshold": config(
+        "ANSWER_CACHE_SIMILARITY", default=0.9, cast=float
+    ),
+    "max_size": config("ANSWER_CACHE_SIZE", default=1024, cast=int),
+    "ttl": config("ANSWER_CACHE_TTL", default="", cast=_optional_float),
+    "path": config("ANSWER_CACHE_PATH", default="") or None,
+}
+
+GRADIO_CONCURRENCY_LIMIT = config(
+    "GRADIO_CONCURRENCY_LIMIT", default=256, cast=int
+)
+
+SERVER_HOST = config("SERVER_HOST", default=server.DEFAULT_HOST)
+SERVER_PORT = config("SERVER_PORT", default=server.DEFAULT_PORT, cast=int)
+
+STARTUP_REPORT = config("STARTUP_REPORT", default=False, cast=bool)
+INSTRUMENTATION = config("INSTRUMENTATION", default=False, cast=bool)
+METRICS_PATH = config("METRICS_PATH", default="")
+if INSTRUMENTATION:
+    instrumentation.enable()
+
 ARTICLES_PATH = os.path.join(
     os.path.dirname(__file__), "..", "data", "constitution_articles.json"
 )
+# the corpus of ARTICLES_PATH, whose indexes keep their original place
+DEFAULT_CORPUS = "constitution"
+
+
+def _corpora(value):
+    """Map the corpus names in `value` to the paths of their articles
+
+    Corpora are separated by commas, each written `name=path`. The
+    constitution bundled with the package needs no path.
+    """
+    corpora = {}
+    for item in value.split(","):
+        name, _, path = item.strip().partition("=")
+        if not path and name == DEFAULT_CORPUS:
+            path = ARTICLES_PATH
+        if not path:
+            raise ValueError(f"No articles path for corpus: {name}")
+        corpora[name] = path
+    return corpora
+
+
+CORPORA = config("CORPORA", default=DEFAULT_CORPUS, cast=_corpora)
+PRIMARY_CORPUS = next(iter(CORPORA))
+SHARD_PROCESSES = config("SHARD_PROCESSES", default=False, cast=bool)
+SHARD_SEARCH_TIMEOUT = config(
+    "SHARD_SEARCH_TIMEOUT", default="", cast=_optional_float
+)
 
 PROMPT_TEMPLATE = """
 You are an expert in kenyan legal and constitutional affairs.
 Answer the `QUESTION` based on the provided `CONTEXT`.
 Use only facts from the `CONTEXT` when answering the `QUESTION`.
-The `CONTEXT` contains the relevant articles from the Kenya 2010 constitution.
+The `CONTEXT` contains the relevant articles of the searched Kenyan laws.
 
 # QUESTION
 {query}
@@ -31,6 +174,27 @@ The `CONTEXT` contains the relevant articles from the Kenya 2010 constitution.
 """
 
 
+def llm_model_name() -> str:
+    """The LLM model name, read on use as only answering needs it"""
+    return config("LLM_MODEL_NAME")
+
+
+def llm_api_key() -> str:
+    """The LLM API key, read on use as only answering needs it"""
+    return config("LLM_API_KEY")
+
+
+def corpus_data_dir(corpus: str, file_name):
+    """The location of a file of the indexes of `corpus`
+
+    Files of the default corpus are where they were before corpora
+    were introduced, the others are in a directory per corpus.
+    """
+    if corpus == DEFAULT_CORPUS:
+        return user_data_dir(file_name)
+    return user_data_dir(pathlib.Path("corpora", corpus, file_name))
+
+
 def user_data_dir(file_name):
     r"""
     Get the OS specific location for the destination path
@@ -0,0 +1,340 @@
+"""Creation of the indexes and LLMs of the entrypoints
+
+Each is created as configured by the settings read in common
+"""
+
+import atexit
+import contextlib
+import functools
+import hashlib
+import logging
+import sys
+import threading
+import time
+import typing
+
+from .. import core
+from ..adapters import caching, chunking, fusion, generation, retrieval
+from ..adapters.batching import MicroBatchingIndex
+from ..adapters.encoding import OnnxEncoder
+from ..adapters.files import replacing
+from ..adapters.reranking import RerankingIndex
+from ..adapters.sharding import ProcessShard, ShardedIndex
+from ..adapters.store import ArticleStore
+from ..adapters.tokenization import token_counter
+from ..core import instrumentation
+from . import common
+
+log = logging.getLogger(__name__)
+
+
+class StartupTimings:
+    """Record how long each step of starting up takes"""
+
+    def __init__(self):
+        self.steps: list[tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.steps.append((name, elapsed))
+
+    def report(self) -> str:
+        with self._lock:
+            steps = list(self.steps)
+        width = max((len(name) for name, _ in steps), default=0)
+        return "\n".join(
+            f"{name:<{width}} {elapsed:8.3f}s" for name, elapsed in steps
+        )
+
+
+startup_timings = StartupTimings()
+
+
+def hybrid_index(warm_up: bool = False, corpus: str = common.PRIMARY_CORPUS):
+    """Create the hybrid index of `corpus` without loading its backends yet
+
+    Both backends are loaded on the first search. With `warm_up` set,
+    the semantic index instead starts loading in a background thread
+    right away, and searches use the lexical index alone until it is
+    ready.
+    """
+    lexical_index = retrieval.LazyIndex(
+        functools.partial(_load_lexical_index, corpus),
+        name=_step_name(corpus, "lexical index"),
+    )
+    semantic_index = retrieval.LazyIndex(
+        functools.partial(_load_semantic_index, corpus),
+        name=_step_name(corpus, "semantic index"),
+        wait=not warm_up,
+    )
+    if warm_up:
+        semantic_index.warm_up()
+    return common.HYBRID_INDEX_CLS(
+        lexical_index,
+        semantic_index,
+        concurrent=common.HYBRID_SEARCH_CONCURRENT,
+        timeouts=common.HYBRID_SEARCH_TIMEOUTS,
+        fusion=fusion.fusion_strategy(common.FUSION, **common.FUSION_OPTIONS),
+        candidate_depth=common.FUSION_CANDIDATE_DEPTH,
+        store=article_store(corpus),
+    )
+
+
+def article_index(index, corpus: str = common.PRIMARY_CORPUS):
+    """Search `index` of `corpus` for whole articles, whatever it indexes
+
+    At clause granularity, the clause passages found are reassembled
+    into articles holding only the best clauses
+    """
+    if common.RETRIEVAL_GRANULARITY == "clause":
+        return chunking.ClauseIndex(index, common.CORPORA[corpus])
+    return index
+
+
+def corpus_index(index, warm_up: bool = False):
+    """Search all CORPORA for whole articles, the first through `index`
+
+    Every other corpus is searched through a shard of its own, in
+    parallel, and the results are merged. With SHARD_PROCESSES set, each of
+    those shards is searched in a worker process of its own.
+    """
+    primary_index = article_index(index)
+    if len(common.CORPORA) == 1:
+        return primary_index
+    shards = {common.PRIMARY_CORPUS: primary_index}
+    for corpus in list(common.CORPORA)[1:]:
+        if common.SHARD_PROCESSES:
+            shards[corpus] = ProcessShard(
+                functools.partial(shard_index, corpus)
+            )
+        else:
+            shards[corpus] = shard_index(corpus, warm_up)
+    return ShardedIndex(shards, timeout=common.SHARD_SEARCH_TIMEOUT)
+
+
+def shard_index(corpus: str, warm_up: bool = False):
+    """Search `corpus` alone for whole articles"""
+    return article_index(hybrid_index(warm_up, corpus), corpus)
+
+
+def reranked_index(index, warm_up: bool = False):
+    """Put the cross-encoder reranking stage after `index` if enabled
+
+    With `warm_up` set, the cross-encoder starts loading in a
+    background thread right away.
+    """
+    if not common.RERANK:
+        return index
+    reranking_index = RerankingIndex(index, **common.RERANK_OPTIONS)
+    if warm_up:
+        threading.Thread(
+            target=reranking_index.warm_up,
+            name="warm-up-reranker",
+            daemon=True,
+        ).start()
+    return reranking_index
+
+
+def index_data_path(corpus: str = common.PRIMARY_CORPUS):
+    """The records of `corpus` to index, clause passages or articles"""
+    if common.RETRIEVAL_GRANULARITY == "clause":
+        return chunking.write_passages(
+            common.CORPORA[corpus],
+            common.corpus_data_dir(corpus, "clause_passages.json"),
+        )
+    return common.CORPORA[corpus]
+
+
+def article_store(corpus: str = common.PRIMARY_CORPUS):
+    """The store of the indexed records of `corpus`, shared by its indexes
+
+    It is written from the records, if needed, on first use
+    """
+    return _article_store(corpus)
+
+
+@functools.cache
+def _article_store(corpus: str):
+    return ArticleStore(
+        common.corpus_data_dir(corpus, common.ARTICLE_STORE_FILENAME),
+        index_data_path(corpus),
+    )
+
+
+def _step_name(corpus: str, name: str) -> str:
+    return name if corpus == common.DEFAULT_CORPUS else f"{corpus} {name}"
+
+
+def _load_lexical_index(corpus: str = common.PRIMARY_CORPUS):
+    with startup_timings.step(f"load {_step_name(corpus, 'lexical index')}"):
+        return common.HYBRID_INDEX_CLS.LEXICAL_INDEX_CLS(
+            index_data_path(corpus),
+            common.corpus_data_dir(corpus, common.LEXICAL_INDEX_DIRNAME),
+            store=article_store(corpus),
+        )
+
+
+def query_encoder():
+    """The encoder of the configured backend, None for Sentence Transformers"""
+    if common.ENCODER_BACKEND == "onnx":
+        return _onnx_encoder()
+    return None
+
+
+def _load_semantic_index(corpus: str = common.PRIMARY_CORPUS):
+    encoder = query_encoder()
+    if encoder is None:
+        with startup_timings.step("import sentence_transformers"):
+            # pylint: disable=import-outside-toplevel,unused-import
+            import sentence_transformers  # noqa: F401
+    with startup_timings.step(f"load {_step_name(corpus, 'semantic index')}"):
+        semantic_index = common.HYBRID_INDEX_CLS.SEMANTIC_INDEX_CLS(
+            index_data_path(corpus),
+            common.corpus_data_dir(corpus, common.SEMANTIC_INDEX_DIRNAME),
+            store=article_store(corpus),
+            encoder=encoder,
+            **common.SEMANTIC_INDEX_OPTIONS,
+        )
+    if common.STARTUP_REPORT:
+        # printed, as the Gradio app does not configure logging
+        print(
+            f"Startup timings:\n{startup_timings.report()}",
+            file=sys.stderr,
+        )
+    if common.QUERY_BATCHING:
+        return MicroBatchingIndex(
+            semantic_index, **common.QUERY_BATCHING_OPTIONS
+        )
+    return semantic_index
+
+
+@functools.cache
+def _onnx_encoder():
+    with startup_timings.step("load onnx encoder"):
+        return OnnxEncoder.from_pretrained(
+            retrieval.DEFAULT_ST_MODELNAME, common.ENCODER_ONNX_FILE
+        )
+
+
+def prompt(query, context):
+    """Fit `context` into the prompt for `query` within the token budget"""
+    result = core.Prompt(
+        common.PROMPT_TEMPLATE,
+        query,
+        context,
+        max_context_tokens=common.MAX_CONTEXT_TOKENS,
+        count_tokens=token_counter(common.CONTEXT_TOKENIZER),
+    )
+    if instrumentation.enabled():
+        with instrumentation.span("prompt"):
+            token_count = result.token_count
+        instrumentation.increment("prompt_tokens", token_count)
+        log.debug("Prompt of %d tokens", token_count)
+    elif log.isEnabledFor(logging.DEBUG):
+        log.debug("Prompt of %d tokens", result.token_count)
+    return result
+
+
+def shared_llm():
+    """Get an LLM backed by the process-wide, pooled client"""
+    return generation.OpenAICompatibleLLM.pooled(
+        common.llm_model_name(),
+        common.llm_api_key(),
+        common.LLM_BASE_URL,
+        **common.LLM_CLIENT_OPTIONS,
+    )
+
+
+def shared_async_llm():
+    """Get an async LLM backed by the process-wide, pooled client
+
+    Identical prompts in flight at the same time share one generation
+    """
+    return caching.CoalescingLLM(
+        generation.AsyncOpenAICompatibleLLM.pooled(
+            common.llm_model_name(),
+            common.llm_api_key(),
+            common.LLM_BASE_URL,
+            **common.LLM_CLIENT_OPTIONS,
+        )
+    )
+
+
+def cached_llm(llm, semantic_index: retrieval.LazyIndex | None = None):
+    """Put the answer cache in front of `llm` if it is enabled
+
+    Reworded questions are matched with embeddings from the lazily
+    loaded `semantic_index`, once it is ready. Unsaved answers are
+    saved on exit.
+    """
+    if not common.ANSWER_CACHE:
+        return llm
+    result = caching.CachedLLM(
+        llm,
+        _cache_embedder(semantic_index),
+        version=_answer_cache_version(),
+        **common.ANSWER_CACHE_OPTIONS,
+    )
+    atexit.register(result.cache.save)
+    return result
+
+
+def cached_async_llm(llm, semantic_index: retrieval.LazyIndex | None = None):
+    """Put the answer cache in front of the async `llm` if it is enabled"""
+    if not common.ANSWER_CACHE:
+        return llm
+    result = caching.AsyncCachedLLM(
+        llm,
+        _cache_embedder(semantic_index),
+        version=_answer_cache_version(),
+        **common.ANSWER_CACHE_OPTIONS,
+    )
+    atexit.register(result.cache.save)
+    return result
+
+
+def _answer_cache_version() -> str:
+    """Identify the model, prompt and corpora that answers come from
+
+    Saved answers are not reused once any of them changes
+    """
+    digest = hashlib.sha256()
+    for part in [
+        common.llm_model_name(),
+        common.PROMPT_TEMPLATE,
+        *common.CORPORA,
+    ]:
+        digest.update(part.encode("utf-8") + b"\0")
+    for path in common.CORPORA.values():
+        with open(path, "rb") as f:
+            digest.update(hashlib.file_digest(f, "sha256").digest())
+    return digest.hexdigest()
+
+
+def _cache_embedder(semantic_index: retrieval.LazyIndex | None):
+    if semantic_index is None:
+        return None
+    return functools.partial(_embed, semantic_index)
+
+
+def _embed(semantic_index: retrieval.LazyIndex, query):
+    index = typing.cast(
+        retrieval.SentenceTransformersIndex | MicroBatchingIndex,
+        semantic_index.get(),
+    )
+    return index.embed(query)
+
+
+def save_metrics():
+    """Write the metrics to METRICS_PATH, if set, for a textfile collector"""
+    if not (common.INSTRUMENTATION and common.METRICS_PATH):
+        return
+    with replacing(common.METRICS_PATH) as f:
+        f.write(instrumentation.render())
@@ -1,20 +1,29 @@
 """Gradio front-end"""
 
-import time
-from collections.abc import Iterable
+import atexit
+from collections.abc import AsyncIterator, Iterable
 
 import gradio as gr
 
 from .. import core
-from ..adapters import generation, retrieval
-from . import common
-
-st_index_dirname = common.user_data_dir("sentence_transformers_index")
-whoosh_index_dirname = common.user_data_dir("whoosh_index")
-
-hybrid_index = retrieval.HybridIndex.from_index_locations(
-    whoosh_index_dirname, st_index_dirname, data_location=common.ARTICLES_PATH
+from ..adapters import caching, retrieval
+from . import common, factories
+
+hybrid_index = factories.hybrid_index(warm_up=True)
+# searches run in worker threads, leaving the event loop to the chats
+# that are waiting on the LLM
+index = retrieval.ExecutorIndex(
+    caching.CachedIndex(
+        factories.reranked_index(
+            factories.corpus_index(hybrid_index, warm_up=True), warm_up=True
+        ),
+        max_size=common.RETRIEVAL_CACHE_SIZE,
+    )
+)
+llm = factories.cached_async_llm(
+    factories.shared_async_llm(), hybrid_index.semantic_index
 )
+atexit.register(factories.save_metrics)
 
 RESPONSE_TEMPLATE = """
 {llm_response}
@@ -25,7 +34,9 @@ RESPONSE_TEMPLATE = """
 """
 
 
-def rag(question: str, history):  # pylint: disable=unused-argument
+async def rag(
+    question: str, history  # pylint: disable=unused-argument
+) -> AsyncIterator[str]:
 
     if not question:
         yield "I cannot read your mind (yet 😎!). What would you like to know?"
@@ -33,21 +44,17 @@ def rag(question: str, history):  # pylint: disable=unused-argument
 
     query = core.Query(question)
 
-    retrieval_results = core.search(hybrid_index, query)
-    prompt = core.Prompt(common.PROMPT_TEMPLATE, query, retrieval_results)
-    llm = generation.OpenAICompatibleLLM(
-        common.LLM_MODEL_NAME, common.LLM_API_KEY, common.LLM_BASE_URL
+    retrieval_results = await core.search_async(
+        index, query, common.NUM_RESULTS
     )
-    response = core.generate(llm, prompt)
-    llm_response_text = str(response)
+    prompt = factories.prompt(query, retrieval_results)
     references_text = _format_references(retrieval_results)
-    response_text = RESPONSE_TEMPLATE.format(
-        llm_response=llm_response_text, context=references_text
-    )
-    chunk_size = 10
-    for i in range(chunk_size, len(response_text) + chunk_size, chunk_size):
-        yield response_text[:i]
-        time.sleep(0.05)
+    llm_response_text = ""
+    async for response in core.generate_stream_async(llm, prompt):
+        llm_response_text += str(response)
+        yield RESPONSE_TEMPLATE.format(
+            llm_response=llm_response_text, context=references_text
+        )
 
 
 def _format_references(retrieval_results: Iterable[core.Article]) -> str:
@@ -68,6 +75,7 @@ if __name__ == "__main__":
         rag,
         type="messages",
         examples=example_questions,
+        concurrency_limit=common.GRADIO_CONCURRENCY_LIMIT,
         title="katiba.KE",
         description=(
             "<p style='text-align:center'>"
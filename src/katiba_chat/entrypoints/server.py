@@ -0,0 +1,166 @@
+"""Local query server
+
+Keeps the indexes and models loaded in one long-running process so that
+repeated CLI queries skip loading them. Questions are posted as JSON to
+a localhost HTTP endpoint and answers are streamed back as plain text.
+Metrics, when given, are served in the Prometheus text format.
+The server has no authentication and only binds to the loopback
+interface.
+"""
+
+import codecs
+import http.client
+import ipaddress
+import json
+import logging
+from collections.abc import Callable, Iterable, Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+QUERY_PATH = "/query"
+METRICS_PATH = "/metrics"
+
+Answerer = Callable[[str], Iterable[str]]
+MetricsRenderer = Callable[[], str]
+
+
+class ServerUnavailableError(Exception):
+    """Raised when no query server is listening or it fails to answer"""
+
+
+def make_server(
+    answer: Answerer,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    metrics: MetricsRenderer | None = None,
+) -> ThreadingHTTPServer:
+    """Create a server that streams the parts of `answer(question)`
+
+    With `metrics`, the text it renders is served at METRICS_PATH.
+    Raises ValueError if `host` is not a loopback address.
+    """
+    if not _is_loopback(host):
+        raise ValueError(f"Refusing to serve on non-loopback host {host}")
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path != METRICS_PATH or metrics is None:
+                self.send_error(404)
+                return
+            body = metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header(
+                "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+            )
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            if self.path != QUERY_PATH:
+                self.send_error(404)
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                question = json.loads(self.rfile.read(length))["question"]
+            except (ValueError, KeyError, TypeError):
+                self.send_error(400, "Expected a JSON object with a question")
+                return
+
+            parts = iter(answer(question))
+            try:
+                # surface errors before the response is committed to
+                first_part = next(parts, "")
+            except Exception:  # pylint: disable=broad-exception-caught
+                log.exception("Failed to answer: %s", question)
+                self.send_error(500)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.end_headers()
+            for part in (first_part, *parts):
+                self.wfile.write(part.encode("utf-8"))
+                self.wfile.flush()
+
+        def log_message(self, format, *args):
+            # pylint: disable=redefined-builtin
+            log.info(format, *args)
+
+    return ThreadingHTTPServer((host, port), QueryHandler)
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(
+    answer: Answerer,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    metrics: MetricsRenderer | None = None,
+):
+    server = make_server(answer, host, port, metrics)
+    log.info("Serving queries at http://%s:%s%s", host, port, QUERY_PATH)
+    if metrics is not None:
+        log.info("Serving metrics at http://%s:%s%s", host, port, METRICS_PATH)
+    with server:
+        server.serve_forever()
+
+
+def forward(
+    question: str,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    connect_timeout: float = 1.0,
+) -> Iterator[str]:
+    """Ask a running server, returning the parts of its answer
+
+    Raises ServerUnavailableError if no server is listening or it fails
+    to answer, before any part of the answer has been returned
+    """
+    connection = http.client.HTTPConnection(
+        host, port, timeout=connect_timeout
+    )
+    try:
+        connection.connect()
+    except OSError as e:
+        raise ServerUnavailableError(f"No server at {host}:{port}") from e
+    # answers take as long as the LLM takes
+    connection.sock.settimeout(None)
+    try:
+        connection.request(
+            "POST",
+            QUERY_PATH,
+            body=json.dumps({"question": question}),
+            headers={"Content-Type": "application/json"},
+        )
+        response = connection.getresponse()
+    except (OSError, http.client.HTTPException) as e:
+        connection.close()
+        raise ServerUnavailableError(f"No answer from {host}:{port}") from e
+    if response.status != 200:
+        connection.close()
+        raise ServerUnavailableError(
+            f"Server error: {response.status} {response.reason}"
+        )
+    return _read_text(connection, response)
+
+
+def _read_text(connection, response) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while chunk := response.read1():
+            if text := decoder.decode(chunk):
+                yield text
+        if text := decoder.decode(b"", final=True):
+            yield text
+    finally:
+        connection.close()
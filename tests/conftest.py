@@ -2,12 +2,59 @@
 
 import os
 import tempfile
+import threading
+import time
 
 import pytest
 
+from katiba_chat import core
+
 FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
 
 
+def make_article(number):
+    return core.Article("foo", "bar", "quux", number, "baz")
+
+
+def numbers(articles):
+    return [a.number for a in articles]
+
+
+class FakeIndex(core.AbstractIndex):
+    """Find the articles with the given numbers, in order, after `delay`
+
+    Articles are scored by their number. `store` holds them by number.
+    """
+
+    def __init__(self, article_numbers=(), delay=0.0):
+        self.store = {n: make_article(n) for n in article_numbers}
+        self.delay = delay
+
+    def search(self, query, num_results=5):
+        return [a for a, _ in self.search_scored(query, num_results)]
+
+    def search_scored(self, query, num_results=5):
+        # pylint: disable=unused-argument
+        time.sleep(self.delay)
+        articles = list(self.store.values())[:num_results]
+        return [(a, float(a.number)) for a in articles]
+
+
+class MeetingIndex(FakeIndex):
+    """Find articles once all the parties to `barrier` are searching
+
+    Searches that do not run in parallel break the barrier and raise.
+    """
+
+    def __init__(self, article_numbers, barrier):
+        super().__init__(article_numbers)
+        self.barrier = barrier
+
+    def search_scored(self, query, num_results=5):
+        self.barrier.wait()
+        return super().search_scored(query, num_results)
+
+
 @pytest.fixture
 def temp_dir_name():
     with tempfile.TemporaryDirectory() as tempdirname:
@@ -17,3 +64,30 @@ def temp_dir_name():
 @pytest.fixture
 def constitution_articles_path():
     return os.path.join(FIXTURES_DIR, "constitution.json")
+
+
+@pytest.fixture
+def stub_llm_url():
+    """URL of a stub LLM server answering like an OpenAI compatible API"""
+    # pylint: disable=import-outside-toplevel
+    from katiba_chat.bench import stub_llm
+
+    server = stub_llm.make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def instrumented():
+    """Record metrics for the duration of a test"""
+    # pylint: disable=import-outside-toplevel
+    from katiba_chat.core import instrumentation
+
+    instrumentation.registry.reset()
+    instrumentation.enable()
+    yield instrumentation.registry
+    instrumentation.disable()
+    instrumentation.registry.reset()
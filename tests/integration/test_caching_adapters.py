@@ -0,0 +1,279 @@
+"""Tests for caching adapters"""
+
+import asyncio
+import json
+import os
+import time
+
+import numpy
+
+from katiba_chat import core
+from katiba_chat.adapters import caching
+
+
+class CountingLLM(core.AbstractLLM):  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        return core.LLMResponse(f"answer to {prompt.query}")
+
+
+class CountingIndex(core.AbstractIndex):
+    # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, num_results):
+        self.calls += 1
+        return [
+            core.Article("foo", "bar", "quux", i + 1, "baz")
+            for i in range(num_results)
+        ]
+
+
+def fake_embed(query):
+    # queries mentioning "sovereign" are similar to each other
+    text = str(query).lower()
+    vector = numpy.array([1.0 if "sovereign" in text else 0.0, 1.0])
+    return vector / numpy.linalg.norm(vector)
+
+
+def make_prompt(text):
+    return core.Prompt("{query}{context}", core.Query(text), [])
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = caching.LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats.hits == 3
+    assert cache.stats.misses == 1
+
+
+def test_lru_cache_expires_entries():
+    cache = caching.LRUCache(ttl=60)
+    cache.put("a", 1, created=0)
+    assert cache.get("a") is None
+
+
+def test_memoizes_search_results_per_query_and_size():
+    index = CountingIndex()
+    cached_index = caching.CachedIndex(index)
+    query = core.Query("Who holds sovereign power?")
+
+    first = cached_index.search(query, 3)
+    second = cached_index.search(query, 3)
+    cached_index.search(query, 5)
+    cached_index.search(
+        core.Query(query.text, corpora=frozenset({"statutes"})), 3
+    )
+
+    assert first == second
+    assert index.calls == 3
+    assert cached_index.results_cache.stats.hits == 1
+
+
+def test_batch_search_only_searches_uncached_queries():
+    index = CountingIndex()
+    cached_index = caching.CachedIndex(index)
+    cached_index.search(core.Query("foo"), 3)
+
+    results = cached_index.search_batch(
+        [core.Query("foo"), core.Query("bar")], 3
+    )
+
+    assert len(results) == 2
+    assert index.calls == 2
+    assert cached_index.results_cache.stats.hits == 1
+
+
+def test_answers_normalized_questions_from_cache():
+    llm = CountingLLM()
+    cached_llm = caching.CachedLLM(llm)
+
+    first = cached_llm.generate(make_prompt("Who holds sovereign power?"))
+    second = cached_llm.generate(make_prompt("  who holds SOVEREIGN power"))
+
+    assert first.text == second.text
+    assert llm.calls == 1
+    assert cached_llm.stats.hits == 1
+    assert cached_llm.stats.misses == 1
+
+
+def test_answers_similar_questions_from_cache():
+    llm = CountingLLM()
+    cached_llm = caching.CachedLLM(llm, embed=fake_embed)
+
+    cached_llm.generate(make_prompt("Who holds sovereign power?"))
+    cached_llm.generate(make_prompt("who has sovereign power in Kenya"))
+    cached_llm.generate(make_prompt("What is the role of the Senate?"))
+
+    assert llm.calls == 2
+    assert cached_llm.stats.semantic_hits == 1
+
+
+def test_batch_generation_only_generates_uncached_answers():
+    llm = CountingLLM()
+    cached_llm = caching.CachedLLM(llm)
+    cached_llm.generate(make_prompt("foo"))
+
+    responses = cached_llm.generate_batch(
+        [make_prompt("foo"), make_prompt("bar"), make_prompt("bar")]
+    )
+
+    assert [r.text for r in responses] == [
+        "answer to foo",
+        "answer to bar",
+        "answer to bar",
+    ]
+    assert llm.calls == 3
+
+
+def test_caches_streamed_answers():
+    llm = CountingLLM()
+    cached_llm = caching.CachedLLM(llm)
+    prompt = make_prompt("Who holds sovereign power?")
+
+    first = "".join(str(p) for p in cached_llm.generate_stream(prompt))
+    second = "".join(str(p) for p in cached_llm.generate_stream(prompt))
+
+    assert first == second
+    assert llm.calls == 1
+
+
+def test_answer_cache_survives_restarts(temp_dir_name):
+    path = os.path.join(temp_dir_name, "answers.json")
+    llm = CountingLLM()
+    prompt = make_prompt("Who holds sovereign power?")
+
+    cached_llm = caching.CachedLLM(llm, embed=fake_embed, path=path)
+    cached_llm.generate(prompt)
+    cached_llm.cache.save()
+    restarted = caching.CachedLLM(llm, embed=fake_embed, path=path)
+    restarted.generate(make_prompt("who has sovereign power in Kenya"))
+
+    assert llm.calls == 1
+    assert restarted.stats.semantic_hits == 1
+
+
+def test_answers_saved_under_another_version_are_not_loaded(temp_dir_name):
+    path = os.path.join(temp_dir_name, "answers.json")
+    llm = CountingLLM()
+    prompt = make_prompt("Who holds sovereign power?")
+
+    cached_llm = caching.CachedLLM(llm, path=path, version="old model")
+    cached_llm.generate(prompt)
+    cached_llm.cache.save()
+    restarted = caching.CachedLLM(llm, path=path, version="new model")
+    restarted.generate(prompt)
+
+    assert llm.calls == 2
+
+
+def test_answer_cache_saves_in_the_background(temp_dir_name):
+    path = os.path.join(temp_dir_name, "answers.json")
+    cached_llm = caching.CachedLLM(CountingLLM(), path=path, save_interval=0.5)
+
+    cached_llm.generate(make_prompt("foo"))
+    cached_llm.generate(make_prompt("bar"))
+
+    assert not os.path.exists(path)
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    with open(path, "rt") as f:
+        assert len(json.load(f)) == 2
+
+
+def test_evicted_answers_are_not_matched_by_similarity():
+    llm = CountingLLM()
+    cached_llm = caching.CachedLLM(llm, embed=fake_embed, max_size=1)
+
+    cached_llm.generate(make_prompt("Who holds sovereign power?"))
+    cached_llm.generate(make_prompt("What is the role of the Senate?"))
+    cached_llm.generate(make_prompt("who has sovereign power in Kenya"))
+
+    assert llm.calls == 3
+    assert cached_llm.stats.semantic_hits == 0
+
+
+class SlowAsyncLLM(core.AbstractAsyncLLM):
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return core.LLMResponse(f"answer to {prompt.query}")
+
+    async def generate_stream(self, prompt):
+        self.calls += 1
+        for word in ["answer", " to", f" {prompt.query}"]:
+            await asyncio.sleep(0.01)
+            yield core.LLMResponse(word)
+
+
+def test_coalesces_identical_prompts_in_flight():
+    llm = SlowAsyncLLM()
+    coalescing_llm = caching.CoalescingLLM(llm)
+
+    async def ask(*questions):
+        return await asyncio.gather(
+            *(coalescing_llm.generate(make_prompt(q)) for q in questions)
+        )
+
+    responses = asyncio.run(ask("foo", "foo", "bar"))
+
+    assert [r.text for r in responses] == [
+        "answer to foo",
+        "answer to foo",
+        "answer to bar",
+    ]
+    assert llm.calls == 2
+    assert coalescing_llm.coalesced == 1
+
+
+def test_coalesced_streams_get_every_part():
+    llm = SlowAsyncLLM()
+    coalescing_llm = caching.CoalescingLLM(llm)
+
+    async def read(question, delay):
+        await asyncio.sleep(delay)
+        return [
+            str(part)
+            async for part in coalescing_llm.generate_stream(
+                make_prompt(question)
+            )
+        ]
+
+    async def ask():
+        return await asyncio.gather(read("foo", 0), read("foo", 0.015))
+
+    first, second = asyncio.run(ask())
+
+    assert first == second == ["answer", " to", " foo"]
+    assert llm.calls == 1
+
+
+def test_async_cache_answers_repeated_questions():
+    llm = SlowAsyncLLM()
+    cached_llm = caching.AsyncCachedLLM(llm)
+
+    async def ask():
+        first = await cached_llm.generate(make_prompt("foo"))
+        parts = cached_llm.generate_stream(make_prompt("Foo?"))
+        return first, [str(part) async for part in parts]
+
+    first, streamed = asyncio.run(ask())
+
+    assert streamed == [first.text]
+    assert llm.calls == 1
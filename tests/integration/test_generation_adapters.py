@@ -1,6 +1,12 @@
 """Tests for generation adapters"""
 
+import asyncio
+import contextlib
+from types import SimpleNamespace
+
+from katiba_chat import core
 from katiba_chat.adapters import generation
+from katiba_chat.bench import stub_llm
 
 
 def test_can_create_openai_request_args():
@@ -13,3 +19,87 @@ def test_can_create_openai_request_args():
         "model": "foo",
         "messages": [{"role": "user", "content": "bar"}],
     }
+
+
+def _chunk(content):
+    delta = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+class FakeCompletions:  # pylint: disable=too-few-public-methods
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.request_args = {}
+
+    def create(self, **request_args):
+        self.request_args = request_args
+        return contextlib.nullcontext(iter(self.chunks))
+
+
+def test_can_stream_openai_completions(monkeypatch):
+    completions = FakeCompletions(
+        [_chunk("foo"), _chunk(None), SimpleNamespace(choices=[]), _chunk("!")]
+    )
+    llm = generation.OpenAICompatibleLLM("foo", api_key="bar")
+    monkeypatch.setattr(
+        llm,
+        "client",
+        SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+    )
+    prompt = core.Prompt("{query}{context}", core.Query("bar"), [])
+
+    parts = list(llm.generate_stream(prompt))
+
+    assert [p.text for p in parts] == ["foo", "!"]
+    assert completions.request_args["stream"] is True
+
+
+def test_pooled_llms_share_a_client():
+    llm_1 = generation.OpenAICompatibleLLM.pooled("foo", api_key="bar")
+    llm_2 = generation.OpenAICompatibleLLM.pooled("quux", api_key="bar")
+    llm_3 = generation.OpenAICompatibleLLM.pooled(
+        "foo", api_key="bar", max_retries=5
+    )
+
+    assert llm_1.client is llm_2.client
+    assert llm_1.client is not llm_3.client
+    assert llm_3.client.max_retries == 5
+
+
+class FakeChatCompletions:  # pylint: disable=too-few-public-methods
+    def create(self, **request_args):
+        content = request_args["messages"][0]["content"]
+        message = SimpleNamespace(content=f"answer to {content}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_can_generate_batch_of_responses(monkeypatch):
+    llm = generation.OpenAICompatibleLLM("foo", api_key="bar")
+    monkeypatch.setattr(
+        llm,
+        "client",
+        SimpleNamespace(
+            chat=SimpleNamespace(completions=FakeChatCompletions())
+        ),
+    )
+    prompts = [
+        core.Prompt("{query}{context}", core.Query(q), []) for q in "abc"
+    ]
+
+    responses = llm.generate_batch(prompts, max_concurrency=2)
+
+    assert [r.text for r in responses] == [f"answer to {q}" for q in "abc"]
+
+
+def test_async_llm_generates_and_streams(stub_llm_url):
+    llm = generation.AsyncOpenAICompatibleLLM("stub", "key", stub_llm_url)
+    prompt = core.Prompt("{query}{context}", core.Query("foo"), [])
+
+    async def ask():
+        response = await llm.generate(prompt)
+        parts = [str(p) async for p in llm.generate_stream(prompt)]
+        return response, parts
+
+    response, parts = asyncio.run(ask())
+
+    assert response.text == "".join(parts) == stub_llm.stub_answer("foo")
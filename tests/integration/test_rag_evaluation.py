@@ -0,0 +1,66 @@
+"""Tests for the offline RAG evaluation against the stub LLM"""
+
+import json
+
+from conftest import FakeIndex, make_article
+
+from katiba_chat import core
+from katiba_chat.adapters import generation
+from katiba_chat.bench import rag, stub_llm
+
+
+def make_prompt(query, articles):
+    return core.Prompt("{query}{context}", query, articles)
+
+
+def test_stub_answers_are_deterministic(stub_llm_url):
+    llm = generation.OpenAICompatibleLLM("stub", "key", stub_llm_url)
+    prompt = make_prompt(core.Query("Who holds sovereign power?"), [])
+
+    answer = llm.generate(prompt).text
+    streamed = "".join(str(p) for p in llm.generate_stream(prompt))
+
+    assert answer == streamed == stub_llm.stub_answer(str(prompt))
+
+
+def test_evaluation_resumes_from_checkpoint(stub_llm_url, temp_dir_name):
+    llm = generation.OpenAICompatibleLLM("stub", "key", stub_llm_url)
+    answer = rag.answerer(
+        FakeIndex(range(1, 11)), llm, make_prompt, num_results=3
+    )
+    items = {
+        i: {"question": f"question {i}", "article_number": i} for i in range(6)
+    }
+    path = f"{temp_dir_name}/answers.jsonl"
+
+    first_run = rag.Checkpoint(path)
+    rag.run_checkpointed(dict(list(items.items())[:4]), answer, first_run)
+    # a line cut short by an interruption
+    with open(path, "at") as f:
+        f.write('{"id": 4, "answ')
+
+    processed = []
+
+    def counting_answer(item):
+        processed.append(item["question"])
+        return answer(item)
+
+    resumed = rag.Checkpoint(path)
+    failures = rag.run_checkpointed(items, counting_answer, resumed, 2)
+
+    assert failures == 0
+    assert sorted(processed) == ["question 4", "question 5"]
+    assert sorted(resumed.records) == list(range(6))
+    summary = rag.summarize(resumed.records.values(), [], num_results=3)
+    assert summary["hit_rate"] == 0.5
+
+
+def test_judge_verdicts_are_parsed(stub_llm_url):
+    llm = generation.OpenAICompatibleLLM("stub", "key", stub_llm_url)
+    articles = {1: make_article(1)}
+    rate = rag.judge(llm, articles)
+
+    result = rate({"question": "foo", "answer": "bar", "article_number": 1})
+
+    assert result["relevance"] in stub_llm.RELEVANCE_LABELS
+    assert json.loads(result["verdict"])["Relevance"] == result["relevance"]
@@ -1,9 +1,14 @@
 """Retrieval adapters integration tests """
 
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from whoosh import index as whoosh_index_module
 
 from katiba_chat import core
-from katiba_chat.adapters import retrieval
+from katiba_chat.adapters import ann, batching, chunking, indexing, retrieval
 
 
 def test_can_search_whoosh_index(temp_dir_name, constitution_articles_path):
@@ -17,6 +22,17 @@ def test_can_search_whoosh_index(temp_dir_name, constitution_articles_path):
     assert all(isinstance(r, core.Article) for r in results)
 
 
+def test_can_batch_search_whoosh_index(
+    temp_dir_name, constitution_articles_path
+):
+    whoosh_index = retrieval.WhooshIndex(
+        constitution_articles_path, temp_dir_name
+    )
+    queries = [core.Query("sovereign power"), core.Query("Senate")]
+    results = whoosh_index.search_batch(queries, 3)
+    assert results == [whoosh_index.search(q, 3) for q in queries]
+
+
 def test_can_search_sentence_transformers_index(
     temp_dir_name, constitution_articles_path
 ):
@@ -30,6 +46,108 @@ def test_can_search_sentence_transformers_index(
     assert all(isinstance(r, core.Article) for r in results)
 
 
+def test_can_batch_search_sentence_transformers_index(
+    temp_dir_name, constitution_articles_path
+):
+    st_transformers_index = retrieval.SentenceTransformersIndex(
+        constitution_articles_path, temp_dir_name
+    )
+    queries = [core.Query("sovereign power"), core.Query("Senate")]
+    results = st_transformers_index.search_batch(queries, 3)
+    assert results == [st_transformers_index.search(q, 3) for q in queries]
+
+
+def test_sentence_transformers_index_encodes_with_given_encoder(
+    temp_dir_name, constitution_articles_path
+):
+    built = retrieval.SentenceTransformersIndex(
+        constitution_articles_path, temp_dir_name
+    )
+    encoded = []
+
+    class RecordingEncoder:  # pylint: disable=too-few-public-methods
+        def encode(self, texts, *args, **kwargs):
+            encoded.append(texts)
+            return built.model.encode(texts, *args, **kwargs)
+
+    index = retrieval.SentenceTransformersIndex(
+        constitution_articles_path, temp_dir_name, encoder=RecordingEncoder()
+    )
+    query = core.Query("Who holds sovereign power")
+
+    assert index.search(query, 3) == built.search(query, 3)
+    # the built article embeddings are reused
+    assert encoded == [str(query)]
+
+
+def test_sentence_transformers_index_reembeds_for_another_encoder(
+    temp_dir_name, constitution_articles_path
+):
+    built = retrieval.SentenceTransformersIndex(
+        constitution_articles_path, temp_dir_name
+    )
+
+    class OtherEncoder:  # pylint: disable=too-few-public-methods
+        identity = "onnx:model.onnx"
+
+        def encode(self, texts, *args, **kwargs):
+            return built.model.encode(texts, *args, **kwargs) * -1
+
+    other = retrieval.SentenceTransformersIndex(
+        constitution_articles_path, temp_dir_name, encoder=OtherEncoder()
+    )
+    rebuilt = retrieval.SentenceTransformersIndex(
+        constitution_articles_path, temp_dir_name
+    )
+
+    assert other.manifest.encoder == "onnx:model.onnx"
+    assert (other.embeddings == -built.embeddings).all()
+    assert rebuilt.manifest == built.manifest
+    assert (rebuilt.embeddings == built.embeddings).all()
+
+
+def test_micro_batched_search_matches_search(
+    temp_dir_name, constitution_articles_path
+):
+    st_transformers_index = retrieval.SentenceTransformersIndex(
+        constitution_articles_path, temp_dir_name
+    )
+    index = batching.MicroBatchingIndex(st_transformers_index)
+    query = core.Query("Who holds sovereign power")
+    results = index.search(query, 3)
+    index.close()
+    assert results == st_transformers_index.search(query, 3)
+
+
+@pytest.mark.parametrize("embedding_dtype", ["float16", "int8"])
+def test_can_search_compact_sentence_transformers_index(
+    temp_dir_name, constitution_articles_path, embedding_dtype
+):
+    st_transformers_index = retrieval.SentenceTransformersIndex(
+        constitution_articles_path,
+        temp_dir_name,
+        embedding_dtype=embedding_dtype,
+    )
+    query = core.Query("Who holds sovereign power")
+    num_results = 3
+    results = st_transformers_index.search(query, num_results)
+    assert len(results) == num_results
+    assert all(isinstance(r, core.Article) for r in results)
+
+
+def test_can_search_approximate_sentence_transformers_index(
+    temp_dir_name, constitution_articles_path
+):
+    st_transformers_index = ann.ApproximateSentenceTransformersIndex(
+        constitution_articles_path, temp_dir_name, num_lists=4, num_probes=4
+    )
+    query = core.Query("Who holds sovereign power")
+    num_results = 3
+    results = st_transformers_index.search(query, num_results)
+    assert len(results) == num_results
+    assert all(isinstance(r, core.Article) for r in results)
+
+
 def test_can_search_hybrid_index(temp_dir_name, constitution_articles_path):
     whoosh_index = retrieval.WhooshIndex(
         constitution_articles_path, os.path.join(temp_dir_name, "whoosh")
@@ -45,3 +163,213 @@ def test_can_search_hybrid_index(temp_dir_name, constitution_articles_path):
     results = hybrid_index.search(query, num_results)
     assert len(results) == num_results
     assert all(isinstance(r, core.Article) for r in results)
+
+
+def test_hybrid_index_reads_articles_from_shared_store(
+    temp_dir_name, constitution_articles_path
+):
+    hybrid_index = retrieval.HybridIndex.from_index_locations(
+        os.path.join(temp_dir_name, "whoosh"),
+        os.path.join(temp_dir_name, "st"),
+        constitution_articles_path,
+    )
+    query = core.Query("Who holds sovereign power")
+
+    results = hybrid_index.search(query, 3)
+
+    assert hybrid_index.lexical_index.store is hybrid_index.store
+    assert hybrid_index.semantic_index.store is hybrid_index.store
+    # without the store, the articles found by the backends are fused
+    hybrid_index.store = None
+    assert results == hybrid_index.search(query, 3)
+    assert hybrid_index.search_batch([query], 3) == [results]
+
+
+def test_whoosh_index_sees_index_updates(
+    temp_dir_name, constitution_articles_path
+):
+    # pylint: disable=protected-access
+    whoosh_index = retrieval.WhooshIndex(
+        constitution_articles_path, temp_dir_name
+    )
+    searchers = whoosh_index._searchers
+    assert searchers is not None
+    query = core.Query("quuxification")
+    assert not whoosh_index.search(query, 3)
+    old_searcher = searchers.get()
+
+    writer = whoosh_index_module.open_dir(temp_dir_name).writer()
+    writer.add_document(
+        title="Article 999: Quuxification",
+        clauses="(1) quuxification",
+        chapter="foo",
+        part="bar",
+        number=999,
+    )
+    writer.commit()
+
+    # the document is not in the article store, so only its number is found
+    results = whoosh_index.search_ids(query, 3)
+    assert [number for number, _ in results] == [999]
+    assert old_searcher.is_closed
+    whoosh_index.close()
+
+
+def test_whoosh_index_searches_with_a_searcher_per_thread(
+    temp_dir_name, constitution_articles_path
+):
+    # pylint: disable=protected-access
+    whoosh_index = retrieval.WhooshIndex(
+        constitution_articles_path, temp_dir_name
+    )
+    searchers = whoosh_index._searchers
+    assert searchers is not None
+    query = core.Query("sovereign power")
+    expected = whoosh_index.search(query, 3)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(lambda _: whoosh_index.search(query, 3), range(8))
+        )
+
+    assert results == [expected] * 8
+    assert len(searchers) > 1
+    whoosh_index.close()
+    assert not searchers
+    # searching again opens a new searcher
+    assert whoosh_index.search(query, 3) == expected
+    whoosh_index.close()
+
+
+def edit_articles(source_path, destination_path):
+    """Copy articles, changing the first, removing the second and adding one"""
+    with open(source_path, "rt") as f:
+        articles = json.load(f)
+    articles[0]["clauses"] = "(1) quuxification"
+    added = dict(articles[1], title="Article 999: Foo", number=999)
+    articles = [articles[0], *articles[2:], added]
+    with open(destination_path, "wt") as f:
+        json.dump(articles, f)
+    return articles
+
+
+def test_whoosh_index_updates_changed_articles(
+    temp_dir_name, constitution_articles_path
+):
+    index_dir = os.path.join(temp_dir_name, "whoosh")
+    retrieval.WhooshIndex(constitution_articles_path, index_dir)
+    removed_number = 2
+    edited_path = os.path.join(temp_dir_name, "edited.json")
+    articles = edit_articles(constitution_articles_path, edited_path)
+
+    whoosh_index = retrieval.WhooshIndex(edited_path, index_dir)
+
+    results = whoosh_index.search(core.Query("quuxification"), 3)
+    assert [r.number for r in results] == [articles[0]["number"]]
+    with whoosh_index_module.open_dir(index_dir).reader() as reader:
+        assert reader.doc_count() == len(articles)
+        indexed = {fields["number"] for _, fields in reader.iter_docs()}
+    assert removed_number not in indexed
+    assert 999 in indexed
+
+
+def test_sentence_transformers_index_only_embeds_changed_articles(
+    temp_dir_name, constitution_articles_path
+):
+    # pylint: disable=protected-access
+    index_dir = os.path.join(temp_dir_name, "st")
+    original = retrieval.SentenceTransformersIndex(
+        constitution_articles_path, index_dir
+    )
+    original_embeddings = dict(
+        zip(original._numbers.tolist(), original.embeddings)
+    )
+    edited_path = os.path.join(temp_dir_name, "edited.json")
+    articles = edit_articles(constitution_articles_path, edited_path)
+
+    updated = retrieval.SentenceTransformersIndex(edited_path, index_dir)
+
+    updated_embeddings = dict(
+        zip(updated._numbers.tolist(), updated.embeddings)
+    )
+    assert list(updated_embeddings) == [a["number"] for a in articles]
+    for article in articles[1:-1]:
+        number = article["number"]
+        assert (
+            updated_embeddings[number] == original_embeddings[number]
+        ).all()
+    first = articles[0]["number"]
+    assert not (updated_embeddings[first] == original_embeddings[first]).all()
+    assert updated.manifest != original.manifest
+    assert not os.path.exists(os.path.join(index_dir, "articles.json"))
+
+
+def test_built_indexes_are_used_without_rebuilding(
+    temp_dir_name, constitution_articles_path
+):
+    lexical_dir = os.path.join(temp_dir_name, "whoosh")
+    semantic_dir = os.path.join(temp_dir_name, "st")
+    lexical_report = indexing.build_lexical_index(
+        constitution_articles_path, lexical_dir, procs=2
+    )
+    semantic_report = indexing.build_semantic_index(
+        constitution_articles_path, semantic_dir, batch_size=4
+    )
+    built_files = {
+        name: os.stat(os.path.join(semantic_dir, name)).st_mtime_ns
+        for name in os.listdir(semantic_dir)
+    }
+
+    hybrid_index = retrieval.HybridIndex.from_index_locations(
+        lexical_dir, semantic_dir, constitution_articles_path
+    )
+
+    assert lexical_report.num_articles == semantic_report.num_articles == 10
+    assert built_files == {
+        name: os.stat(os.path.join(semantic_dir, name)).st_mtime_ns
+        for name in os.listdir(semantic_dir)
+    }
+    results = hybrid_index.search(core.Query("Who holds sovereign power"), 3)
+    assert len(results) == 3
+
+
+def test_can_search_clause_index(temp_dir_name, constitution_articles_path):
+    passages_path = chunking.write_passages(
+        constitution_articles_path,
+        os.path.join(temp_dir_name, "passages.json"),
+    )
+    whoosh_index = retrieval.WhooshIndex(
+        passages_path, os.path.join(temp_dir_name, "whoosh")
+    )
+    clause_index = chunking.ClauseIndex(
+        whoosh_index, constitution_articles_path
+    )
+
+    results = clause_index.search(core.Query("Who holds sovereign power"), 3)
+
+    assert 0 < len(results) <= 3
+    with open(constitution_articles_path, "rt") as f:
+        articles = {a["number"]: a for a in json.load(f)}
+    for result in results:
+        assert result.title == articles[result.number]["title"]
+        assert len(result.clauses) <= len(articles[result.number]["clauses"])
+
+
+@pytest.mark.parametrize(
+    "index_cls",
+    [retrieval.WhooshIndex, retrieval.SentenceTransformersIndex],
+)
+def test_scored_search_matches_search(
+    temp_dir_name, constitution_articles_path, index_cls
+):
+    index = index_cls(constitution_articles_path, temp_dir_name)
+    query = core.Query("Who holds sovereign power")
+
+    scored = index.search_scored(query, 5)
+
+    assert [article for article, _ in scored] == index.search(query, 5)
+    scores = [score for _, score in scored]
+    assert scores == sorted(scores, reverse=True)
+    (batch_scored,) = index.search_scored_batch([query], 5)
+    assert [article for article, _ in batch_scored] == index.search(query, 5)
+    assert [score for _, score in batch_scored] == pytest.approx(scores)
@@ -0,0 +1,94 @@
+"""Tests for the local query server"""
+
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from katiba_chat.entrypoints import server
+
+
+def fake_answer(question):
+    yield "You asked: "
+    yield question
+
+
+def server_address(query_server):
+    """Host and port of a server listening on the loopback interface"""
+    host, port = query_server.server_address[:2]
+    if isinstance(host, bytes):
+        host = host.decode("ascii")
+    return host, port
+
+
+@pytest.fixture(name="running_server")
+def fixture_running_server():
+    query_server = server.make_server(fake_answer, port=0)
+    thread = threading.Thread(target=query_server.serve_forever, daemon=True)
+    thread.start()
+    yield query_server
+    query_server.shutdown()
+    query_server.server_close()
+
+
+def test_can_forward_questions_to_server(running_server):
+    host, port = server_address(running_server)
+    parts = server.forward("Who holds sovereign power?", host, port)
+    assert "".join(parts) == "You asked: Who holds sovereign power?"
+
+
+def test_forwarding_fails_without_server(running_server):
+    host, port = server_address(running_server)
+    running_server.shutdown()
+    running_server.server_close()
+
+    with pytest.raises(server.ServerUnavailableError):
+        server.forward("Who holds sovereign power?", host, port)
+
+
+def test_serves_metrics_when_given():
+    query_server = server.make_server(
+        fake_answer, port=0, metrics=lambda: "katiba_chat_foo_total 1\n"
+    )
+    thread = threading.Thread(target=query_server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server_address(query_server)
+    try:
+        url = f"http://{host}:{port}{server.METRICS_PATH}"
+        with urllib.request.urlopen(url) as response:
+            assert response.read() == b"katiba_chat_foo_total 1\n"
+    finally:
+        query_server.shutdown()
+        query_server.server_close()
+
+
+def test_metrics_are_not_served_by_default(running_server):
+    host, port = server_address(running_server)
+    url = f"http://{host}:{port}{server.METRICS_PATH}"
+    with pytest.raises(urllib.error.HTTPError):
+        urllib.request.urlopen(url)  # pylint: disable=consider-using-with
+
+
+def test_forwarding_fails_on_server_errors():
+    def failing_answer(question):
+        if question:
+            raise RuntimeError(question)
+        yield ""
+
+    query_server = server.make_server(failing_answer, port=0)
+    thread = threading.Thread(target=query_server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server_address(query_server)
+    try:
+        with pytest.raises(server.ServerUnavailableError):
+            server.forward("Who holds sovereign power?", host, port)
+    finally:
+        query_server.shutdown()
+        query_server.server_close()
+
+
+@pytest.mark.parametrize("host", ["0.0.0.0", "192.0.2.1", "example.com"])
+def test_refuses_to_serve_beyond_loopback(host):
+    with pytest.raises(ValueError):
+        server.make_server(fake_answer, host, port=0)
@@ -0,0 +1,82 @@
+"""Test approximate nearest neighbour search"""
+
+import os
+
+import numpy
+
+from katiba_chat.adapters import ann, vectors
+
+
+def random_embeddings(size, dimensions=16, seed=0):
+    rng = numpy.random.default_rng(seed)
+    return vectors.normalize(rng.normal(size=(size, dimensions)))
+
+
+def indexed(embeddings):
+    return vectors.NormalizedEmbeddings(embeddings.astype(numpy.float32))
+
+
+def exact_search(embeddings, queries, k):
+    return [vectors.top_k(embeddings @ q, k) for q in queries]
+
+
+def test_probing_all_lists_is_exact():
+    embeddings = random_embeddings(500)
+    queries = random_embeddings(20, seed=1)
+    ivf_index = ann.IVFIndex.build(
+        indexed(embeddings), num_lists=10, num_probes=10
+    )
+
+    approximate = [ivf_index.search(q, 5)[0] for q in queries]
+    exact = exact_search(embeddings, queries, 5)
+
+    for approx_ids, exact_ids in zip(approximate, exact):
+        assert list(approx_ids) == list(exact_ids)
+
+
+def test_recall_grows_with_probes():
+    embeddings = random_embeddings(2000)
+    queries = random_embeddings(50, seed=1)
+    ivf_index = ann.IVFIndex.build(indexed(embeddings), num_lists=40)
+    exact = exact_search(embeddings, queries, 10)
+
+    recalls = []
+    for num_probes in (1, 8, 40):
+        ivf_index.num_probes = num_probes
+        approximate = [ivf_index.search(q, 10)[0] for q in queries]
+        recalls.append(ann.recall_at_k(approximate, exact))
+
+    assert recalls == sorted(recalls)
+    assert recalls[-1] == 1.0
+
+
+def test_saved_index_gives_same_results(temp_dir_name):
+    embeddings = indexed(random_embeddings(300))
+    query = random_embeddings(1, seed=1)[0]
+    ivf_index = ann.IVFIndex.build(embeddings, num_lists=8, num_probes=2)
+    ivf_index.save(temp_dir_name)
+
+    loaded_index = ann.IVFIndex.load(temp_dir_name, embeddings)
+
+    assert loaded_index.num_probes == 2
+    # the candidates are scored from the embeddings given, not a copy
+    assert len(os.listdir(temp_dir_name)) == 4
+    ids, scores = ivf_index.search(query, 5)
+    loaded_ids, loaded_scores = loaded_index.search(query, 5)
+    assert list(ids) == list(loaded_ids)
+    assert numpy.allclose(scores, loaded_scores)
+
+
+def test_saving_over_a_loaded_index_leaves_it_intact(temp_dir_name):
+    query = random_embeddings(1, seed=1)[0]
+    embeddings = indexed(random_embeddings(300))
+    ann.IVFIndex.build(embeddings, num_lists=8).save(temp_dir_name)
+    loaded_index = ann.IVFIndex.load(temp_dir_name, embeddings)
+    ids, _ = loaded_index.search(query, 5)
+
+    replacement_embeddings = indexed(random_embeddings(100, seed=2))
+    replacement = ann.IVFIndex.build(replacement_embeddings)
+    replacement.save(temp_dir_name)
+
+    assert list(loaded_index.search(query, 5)[0]) == list(ids)
+    assert len(ann.IVFIndex.load(temp_dir_name, replacement_embeddings)) == 100
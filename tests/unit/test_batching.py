@@ -0,0 +1,105 @@
+"""Test micro-batching of concurrent searches with a fake index"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pytest
+from conftest import FakeIndex
+
+from katiba_chat import core
+from katiba_chat.adapters import batching
+
+
+class BatchableIndex(FakeIndex):
+    """Score articles by their number, recording each batch searched"""
+
+    def __init__(self, article_numbers, error=None):
+        super().__init__(article_numbers)
+        self._error = error
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed(self, query):  # pylint: disable=unused-argument
+        return numpy.zeros(1)
+
+    def search_ids_batch(self, queries, num_results):
+        with self._lock:
+            self.batches.append([str(query) for query in queries])
+        if self._error is not None:
+            raise self._error
+        return [
+            [(n, float(n)) for n in list(self.store)[:num_results]]
+            for _ in queries
+        ]
+
+
+@pytest.fixture(name="fake_index")
+def fixture_fake_index():
+    return BatchableIndex([1, 2, 3, 4])
+
+
+def search_concurrently(index, queries):
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        return list(
+            executor.map(
+                lambda q: index.search(core.Query(q[0]), q[1]), queries
+            )
+        )
+
+
+def test_concurrent_searches_share_a_batch(fake_index, instrumented):
+    index = batching.MicroBatchingIndex(fake_index, max_wait=0.2)
+
+    results = search_concurrently(index, [("foo", 1), ("bar", 3)])
+    index.close()
+
+    assert [[a.number for a in r] for r in results] == [[1], [1, 2, 3]]
+    assert [sorted(batch) for batch in fake_index.batches] == [["bar", "foo"]]
+    assert instrumented.counter("query_batches") == 1
+    assert instrumented.counter("batched_queries") == 2
+    assert instrumented.gauge("query_batch_max_size") == 32
+
+
+def test_batches_are_limited_in_size(fake_index):
+    index = batching.MicroBatchingIndex(
+        fake_index, max_batch_size=2, max_wait=0.2
+    )
+
+    search_concurrently(index, [(q, 2) for q in ("foo", "bar", "baz")])
+    index.close()
+
+    assert sorted(len(batch) for batch in fake_index.batches) == [1, 2]
+
+
+def test_errors_reach_every_caller_in_the_batch():
+    index = batching.MicroBatchingIndex(
+        BatchableIndex([1], error=core.IndexNotReadyError("loading")),
+        max_wait=0.2,
+    )
+
+    with pytest.raises(core.IndexNotReadyError):
+        search_concurrently(index, [("foo", 1), ("bar", 1)])
+    index.close()
+
+
+def test_searches_directly_once_closed(fake_index):
+    index = batching.MicroBatchingIndex(fake_index)
+    index.close()
+
+    assert [a.number for a in index.search(core.Query("foo"), 2)] == [1, 2]
+    assert not fake_index.batches
+
+
+def test_searches_racing_close_are_all_answered(fake_index):
+    index = batching.MicroBatchingIndex(fake_index, max_wait=0.01)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [
+            executor.submit(index.search, core.Query(str(i)), 1)
+            for i in range(200)
+        ]
+        index.close()
+        results = [future.result(timeout=5) for future in futures]
+
+    assert all([a.number for a in r] == [1] for r in results)
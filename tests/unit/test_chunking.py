@@ -0,0 +1,84 @@
+"""Test clause level retrieval"""
+
+import json
+import os
+
+import pytest
+
+from katiba_chat import core
+from katiba_chat.adapters import chunking
+
+ARTICLES = [
+    {
+        "title": f"Article {n}",
+        "clauses": f"(1) first of {n}\n(2) second of {n}\n(3) third of {n}",
+        "chapter": "foo",
+        "part": "bar",
+        "number": n,
+    }
+    for n in (1, 2, 3)
+]
+
+
+class FakePassageIndex(core.AbstractIndex):
+    # pylint: disable=too-few-public-methods
+    def __init__(self, passage_numbers):
+        passages = {
+            p["number"]: core.Article(**p)
+            for p in chunking.passage_records(ARTICLES)
+        }
+        self._results = [passages[n] for n in passage_numbers]
+
+    def search(self, query, num_results):  # pylint: disable=unused-argument
+        return self._results[:num_results]
+
+
+def write_articles(temp_dir_name):
+    path = os.path.join(temp_dir_name, "articles.json")
+    with open(path, "wt") as f:
+        json.dump(ARTICLES, f)
+    return path
+
+
+def test_passage_numbers_point_back_to_articles():
+    records = chunking.passage_records(ARTICLES)
+
+    assert len(records) == 9
+    clause = chunking.clause_of(core.Article(**records[4]))
+    assert (clause.article_number, clause.position) == (2, 1)
+    assert clause.text == "(2) second of 2"
+
+
+def test_too_many_passages_are_refused():
+    clauses = "\n".join(f"({i}) foo" for i in range(1001))
+    article = dict(ARTICLES[0], clauses=clauses)
+
+    with pytest.raises(ValueError):
+        chunking.passage_records([article], max_chars=1)
+
+
+def test_returns_articles_with_only_matching_clauses(temp_dir_name):
+    # best passages: third clause of 2, then first of 3 and first of 2
+    passage_index = FakePassageIndex([2002, 3000, 2000, 1001])
+    clause_index = chunking.ClauseIndex(
+        passage_index, write_articles(temp_dir_name)
+    )
+
+    results = clause_index.search(core.Query("foo"), 2)
+
+    assert [r.number for r in results] == [2, 3]
+    assert results[0].clauses == "(1) first of 2\n(3) third of 2"
+    assert results[1].clauses == "(1) first of 3"
+
+
+def test_passages_are_only_rewritten_when_changed(temp_dir_name):
+    data_path = write_articles(temp_dir_name)
+    destination = os.path.join(temp_dir_name, "passages.json")
+
+    chunking.write_passages(data_path, destination)
+    written = os.stat(destination).st_mtime_ns
+    chunking.write_passages(data_path, destination)
+
+    assert os.stat(destination).st_mtime_ns == written
+    with open(destination, "rt") as f:
+        assert json.load(f) == chunking.passage_records(ARTICLES)
@@ -1,22 +1,16 @@
 """Test core package"""
 
+import asyncio
+
+from conftest import FakeIndex, make_article
+
 from katiba_chat import core
 
 NUM_ARTICLES = 264
 
 
 def article_factory(number):
-    return [
-        core.Article("foo", "bar", "quux", i + 1, "baz") for i in range(number)
-    ]
-
-
-class FakeIndex(core.AbstractIndex):  # pylint: disable=too-few-public-methods
-    def __init__(self):
-        self._index = article_factory(264)
-
-    def search(self, query, num_results=5):  # pylint: disable=unused-argument
-        return self._index[:num_results]
+    return [make_article(i + 1) for i in range(number)]
 
 
 class FakeLLM(core.AbstractLLM):  # pylint: disable=too-few-public-methods
@@ -29,7 +23,7 @@ class FakeLLM(core.AbstractLLM):  # pylint: disable=too-few-public-methods
 
 def test_returns_default_results_num():
     query = core.Query("Who holds sovereign power?")
-    index = FakeIndex()
+    index = FakeIndex(range(1, NUM_ARTICLES + 1))
     num_results = 3
     results = core.search(index, query, num_results)
     assert len(list(results)) == num_results
@@ -100,3 +94,190 @@ def test_generation_from_prompt():
     llm = FakeLLM()
     response = core.generate(llm, prompt)
     assert response.text
+
+
+def test_streamed_generation_falls_back_to_full_response():
+    prompt_template = "{query} {context}"
+    query = core.Query("foo")
+    context = article_factory(3)
+    prompt = core.Prompt(prompt_template, query, context)
+    llm = FakeLLM()
+    parts = list(core.generate_stream(llm, prompt))
+    assert len(parts) == 1
+    assert parts[0].text == llm.generate(prompt).text
+
+
+def test_batch_search_falls_back_to_single_searches():
+    queries = [core.Query("foo"), core.Query("bar")]
+    index = FakeIndex(range(1, NUM_ARTICLES + 1))
+    results = core.search_batch(index, queries, 3)
+    assert len(results) == len(queries)
+    assert all(len(list(r)) == 3 for r in results)
+
+
+def test_unscored_keeps_articles_in_order():
+    scored = [(make_article(3), 0.9), (make_article(1), 0.5)]
+    assert core.unscored(scored) == [make_article(3), make_article(1)]
+
+
+def test_batch_generation_falls_back_to_single_generations():
+    prompts = [
+        core.Prompt("{query} {context}", core.Query(q), article_factory(1))
+        for q in ("foo", "bar")
+    ]
+    llm = FakeLLM()
+    responses = core.generate_batch(llm, prompts)
+    assert [r.text for r in responses] == [
+        llm.generate(p).text for p in prompts
+    ]
+
+
+class FakeAsyncLLM(core.AbstractAsyncLLM):
+    # pylint: disable=too-few-public-methods
+
+    async def generate(self, prompt):
+        return core.LLMResponse(str(prompt.context[0]))
+
+
+def test_async_streamed_generation_falls_back_to_full_response():
+    prompt = core.Prompt(
+        "{query} {context}", core.Query("foo"), article_factory(1)
+    )
+
+    async def stream():
+        return [
+            part.text
+            async for part in core.generate_stream_async(
+                FakeAsyncLLM(), prompt
+            )
+        ]
+
+    assert asyncio.run(stream()) == [str(article_factory(1)[0])]
+
+
+def test_splits_articles_at_numbered_clauses():
+    article = core.Article(
+        "title", "(1) foo\n(a) bar\n(2) baz\n(2A) quux", "chapter", 7, "part"
+    )
+
+    clauses = core.split_clauses(article)
+
+    assert [c.text for c in clauses] == [
+        "(1) foo\n(a) bar",
+        "(2) baz",
+        "(2A) quux",
+    ]
+    assert [c.position for c in clauses] == [0, 1, 2]
+    assert all(c.article_number == 7 for c in clauses)
+
+
+def test_splits_long_unnumbered_clauses_between_lines():
+    lines = [f"line {i} " + "x" * 20 for i in range(10)]
+    article = core.Article("title", "\n".join(lines), "chapter", 1, "part")
+
+    clauses = core.split_clauses(article, max_chars=60)
+
+    assert all(len(c.text) <= 60 for c in clauses)
+    assert "\n".join(c.text for c in clauses) == article.clauses
+
+
+def test_excerpt_keeps_given_clauses_in_article_order():
+    article = core.Article("title", "(1) foo\n(2) bar\n(3) baz", "c", 1, "p")
+    first, _, third = core.split_clauses(article)
+
+    excerpt = core.excerpt(article, [third, first])
+
+    assert excerpt.clauses == "(1) foo\n(3) baz"
+    assert excerpt.title == article.title
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def long_article(number, num_lines):
+    clauses = "\n".join(f"({i}) foo bar baz" for i in range(num_lines))
+    return core.Article("title", clauses, "chapter", number, "part")
+
+
+def test_prompt_context_fills_token_budget_in_order():
+    articles = article_factory(10)
+    item_tokens = count_words(str(articles[0]))
+    prompt = core.Prompt(
+        "{query}{context}",
+        core.Query("foo"),
+        articles,
+        max_context_tokens=item_tokens * 3,
+        count_tokens=count_words,
+    )
+
+    assert prompt.context_items == articles[:3]
+    assert str(prompt).count("Chapter:") == 3
+
+
+def test_prompt_truncates_item_that_overflows_budget():
+    short, long = article_factory(1)[0], long_article(2, 50)
+    budget = count_words(str(short)) + count_words(str(long)) // 2
+    prompt = core.Prompt(
+        "{query}{context}",
+        core.Query("foo"),
+        [short, long],
+        max_context_tokens=budget,
+        count_tokens=count_words,
+    )
+
+    items = prompt.context_items
+
+    assert items[0] == short
+    assert items[1].number == long.number
+    assert items[1].clauses.endswith(core.TRUNCATION_MARKER)
+    assert long.clauses.startswith(
+        items[1].clauses.removesuffix(core.TRUNCATION_MARKER)
+    )
+    context_tokens = sum(count_words(str(item)) for item in items)
+    assert budget - 4 < context_tokens <= budget
+
+
+def test_prompt_truncates_first_line_that_overflows_budget():
+    article = core.Article("title", "foo " * 100, "chapter", 1, "part")
+    budget = count_words(str(article)) // 2
+    prompt = core.Prompt(
+        "{query}{context}",
+        core.Query("foo"),
+        [article],
+        max_context_tokens=budget,
+        count_tokens=count_words,
+    )
+
+    [item] = prompt.context_items
+
+    assert item.clauses.startswith("foo foo")
+    assert item.clauses.endswith(core.TRUNCATION_MARKER)
+    assert count_words(str(item)) == budget
+
+
+def test_prompt_skips_items_that_cannot_fit():
+    long, short = long_article(1, 50), article_factory(2)[1]
+    prompt = core.Prompt(
+        "{query}{context}",
+        core.Query("foo"),
+        [long, short],
+        max_context_tokens=count_words(str(short)),
+        count_tokens=count_words,
+    )
+
+    assert prompt.context_items == [short]
+
+
+def test_prompt_reports_token_count():
+    prompt = core.Prompt(
+        "{query} {context}",
+        core.Query("foo"),
+        article_factory(2),
+        count_tokens=count_words,
+    )
+
+    assert prompt.token_count == count_words(str(prompt))
+    assert core.Prompt(
+        "{query}", core.Query("x" * 40), []
+    ).token_count == core.estimate_tokens("x" * 40)
@@ -0,0 +1,77 @@
+"""Test ONNX encoding with a word-level tokenizer and a fake session"""
+
+import types
+
+import numpy
+import pytest
+from tokenizers import Tokenizer, models, pre_tokenizers
+
+from katiba_chat.adapters import encoding
+
+
+class FakeSession:
+    """Embed each token as its id and a one, recording the batches run"""
+
+    def __init__(self):
+        self.batches = []
+
+    def get_inputs(self):
+        return [
+            types.SimpleNamespace(name="input_ids"),
+            types.SimpleNamespace(name="attention_mask"),
+        ]
+
+    def run(self, output_names, feeds):  # pylint: disable=unused-argument
+        self.batches.append(feeds["input_ids"].shape)
+        ids = feeds["input_ids"].astype(numpy.float32)
+        return [numpy.stack([ids, numpy.ones_like(ids)], axis=-1)]
+
+
+@pytest.fixture(name="tokenizer")
+def fixture_tokenizer():
+    vocab = {"[PAD]": 0, "[UNK]": 1, "a": 2, "b": 3, "c": 4}
+    result = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    result.pre_tokenizer = pre_tokenizers.Whitespace()
+    result.enable_padding()
+    return result
+
+
+def test_encodes_texts_in_batches_of_similar_length(tokenizer):
+    session = FakeSession()
+    encoder = encoding.OnnxEncoder(tokenizer, session)
+
+    embeddings = encoder.encode(["a", "c c c", "b c", "b"], batch_size=2)
+
+    # mean pooling leaves out the padding
+    assert embeddings.tolist() == [[2, 1], [4, 1], [3.5, 1], [3, 1]]
+    assert session.batches == [(2, 3), (2, 1)]
+
+
+def test_encodes_a_text_as_a_normalized_vector(tokenizer):
+    encoder = encoding.OnnxEncoder(tokenizer, FakeSession(), normalize=True)
+
+    embedding = encoder.encode("b c")
+
+    assert embedding.shape == (2,)
+    assert numpy.linalg.norm(embedding) == pytest.approx(1.0)
+
+
+def test_pools_unmasked_token_embeddings():
+    token_embeddings = numpy.array([[[1.0, 4.0], [3.0, 2.0], [9.0, 9.0]]])
+    mask = numpy.array([[1.0, 1.0, 0.0]])
+
+    assert encoding.pool(token_embeddings, mask, "cls").tolist() == [[1, 4]]
+    assert encoding.pool(token_embeddings, mask, "mean").tolist() == [[2, 3]]
+    assert encoding.pool(token_embeddings, mask, "max").tolist() == [[3, 4]]
+
+
+def test_parity_compares_embeddings_of_both_encoders(tokenizer):
+    reference = encoding.OnnxEncoder(tokenizer, FakeSession())
+    candidate = encoding.OnnxEncoder(tokenizer, FakeSession(), pooling="cls")
+    texts = ["a", "b c"]
+
+    same = encoding.encoder_parity(reference, reference, texts)
+    different = encoding.encoder_parity(reference, candidate, texts)
+
+    assert same.min_similarity == pytest.approx(1.0)
+    assert different.min_similarity < different.mean_similarity < 1.0
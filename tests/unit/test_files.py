@@ -0,0 +1,52 @@
+"""Test replacing files whole"""
+
+import json
+import os
+
+import numpy
+import pytest
+
+from katiba_chat.adapters import files
+
+
+def test_writes_json_and_arrays(temp_dir_name):
+    json_path = os.path.join(temp_dir_name, "nested", "data.json")
+    array_path = os.path.join(temp_dir_name, "data.npy")
+
+    files.write_json(json_path, {"foo": [1, 2]})
+    files.save_array(array_path, numpy.arange(3))
+
+    with open(json_path, "rt") as f:
+        assert json.load(f) == {"foo": [1, 2]}
+    assert numpy.load(array_path).tolist() == [0, 1, 2]
+
+
+def test_failed_write_keeps_previous_file(temp_dir_name):
+    path = os.path.join(temp_dir_name, "data.txt")
+    with files.replacing(path) as f:
+        f.write("old")
+
+    with pytest.raises(RuntimeError):
+        with files.replacing(path) as f:
+            f.write("new")
+            raise RuntimeError("foo")
+
+    with open(path, "rt") as f:
+        assert f.read() == "old"
+    assert os.listdir(temp_dir_name) == ["data.txt"]
+
+    with open(os.path.join(temp_dir_name, "plain.txt"), "wt") as f:
+        f.write("plain")
+    assert os.stat(path).st_mode == os.stat(f.name).st_mode
+
+
+def test_keeps_permissions_of_replaced_file(temp_dir_name):
+    path = os.path.join(temp_dir_name, "data.txt")
+    with files.replacing(path) as f:
+        f.write("old")
+    os.chmod(path, 0o640)
+
+    with files.replacing(path) as f:
+        f.write("new")
+
+    assert os.stat(path).st_mode & 0o777 == 0o640
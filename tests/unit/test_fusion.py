@@ -0,0 +1,70 @@
+"""Test fusion of ranked backend results"""
+
+import numpy
+import pytest
+
+from katiba_chat.adapters import fusion
+
+
+def ranked(ids, scores=None):
+    ids = numpy.array(ids, dtype=numpy.int64)
+    if scores is None:
+        scores = numpy.arange(len(ids), 0, -1, dtype=float)
+    return ids, numpy.array(scores, dtype=float)
+
+
+def test_rrf_sums_reciprocal_ranks():
+    strategy = fusion.ReciprocalRankFusion(k=1)
+    ids, scores = strategy.fuse(
+        {"lexical": ranked([1, 2, 3]), "semantic": ranked([3, 4])}
+    )
+
+    assert ids.tolist() == [3, 1, 2, 4]
+    assert scores.tolist() == pytest.approx(
+        [1 / 4 + 1 / 2, 1 / 2, 1 / 3, 1 / 3]
+    )
+
+
+def test_ties_keep_order_of_first_appearance():
+    strategy = fusion.ReciprocalRankFusion()
+    ids, _ = strategy.fuse(
+        {"lexical": ranked([7, 5]), "semantic": ranked([5, 7])}
+    )
+    assert ids.tolist() == [7, 5]
+
+
+def test_weighted_fusion_uses_scores_not_ranks():
+    # 2 is barely behind 1 lexically, but far ahead semantically
+    result_sets = {
+        "lexical": ranked([1, 2, 3], [10.0, 9.9, 1.0]),
+        "semantic": ranked([2, 1, 3], [0.9, 0.2, 0.1]),
+    }
+
+    weighted = fusion.WeightedScoreFusion()
+    ids, _ = weighted.fuse(result_sets)
+    assert ids[0] == 2
+
+    lexical_only = fusion.WeightedScoreFusion({"semantic": 0.0})
+    ids, _ = lexical_only.fuse(result_sets)
+    assert ids.tolist() == [1, 2, 3]
+
+
+def test_convex_combination_interpolates_between_backends():
+    result_sets = {
+        "lexical": ranked([1, 2], [5.0, 1.0]),
+        "semantic": ranked([2, 1], [0.8, 0.1]),
+    }
+
+    assert fusion.ConvexCombination(0.0).fuse(result_sets)[0][0] == 1
+    assert fusion.ConvexCombination(1.0).fuse(result_sets)[0][0] == 2
+    with pytest.raises(ValueError):
+        fusion.ConvexCombination(1.5)
+
+
+def test_fuses_missing_and_empty_backends():
+    strategy = fusion.fusion_strategy("weighted")
+    ids, _ = strategy.fuse({"lexical": ranked([]), "semantic": ranked([4])})
+    assert ids.tolist() == [4]
+    assert strategy.fuse({})[0].size == 0
+    with pytest.raises(ValueError):
+        fusion.fusion_strategy("foo")
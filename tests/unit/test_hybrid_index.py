@@ -0,0 +1,137 @@
+"""Test hybrid index behaviour with fake backends"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from conftest import FakeIndex, MeetingIndex
+
+from katiba_chat import core
+from katiba_chat.adapters import fusion, retrieval
+
+
+def test_concurrent_search_matches_sequential_search():
+    lexical, semantic = FakeIndex([1, 2, 3]), FakeIndex([2, 3, 4])
+    query = core.Query("foo")
+
+    sequential = retrieval.HybridIndex(lexical, semantic)
+    concurrent = retrieval.HybridIndex(lexical, semantic, concurrent=True)
+
+    expected = [a.number for a in sequential.search(query, 3)]
+    actual = [a.number for a in concurrent.search(query, 3)]
+    assert actual == expected
+    assert set(concurrent.last_timings) == {"lexical", "semantic"}
+
+
+def test_slow_backend_is_dropped_after_timeout():
+    lexical, semantic = FakeIndex([1, 2, 3]), FakeIndex([4, 5, 6], delay=1)
+    hybrid_index = retrieval.HybridIndex(
+        lexical, semantic, concurrent=True, timeouts={"semantic": 0.1}
+    )
+
+    results = hybrid_index.search(core.Query("foo"), 3)
+
+    assert [a.number for a in results] == [1, 2, 3]
+    assert hybrid_index.last_timings["semantic"] is None
+    assert hybrid_index.last_timings["lexical"] is not None
+
+
+def test_lazy_index_is_created_on_first_search():
+    created = []
+
+    def factory():
+        created.append(True)
+        return FakeIndex([1, 2, 3])
+
+    lazy_index = retrieval.LazyIndex(factory)
+    assert not created
+
+    results = lazy_index.search(core.Query("foo"), 2)
+    assert [a.number for a in results] == [1, 2]
+    assert created == [True]
+
+
+def test_searches_skip_a_warming_up_index():
+    loaded = threading.Event()
+
+    def factory():
+        loaded.wait(timeout=5)
+        return FakeIndex([4, 5, 6])
+
+    semantic = retrieval.LazyIndex(factory, wait=False)
+    semantic.warm_up()
+    hybrid_index = retrieval.HybridIndex(FakeIndex([1, 2, 3]), semantic)
+    query = core.Query("foo")
+
+    with pytest.raises(core.IndexNotReadyError):
+        semantic.search(query, 3)
+    results = hybrid_index.search(query, 3)
+    assert [a.number for a in results] == [1, 2, 3]
+    assert not hybrid_index.last_search_complete
+
+    loaded.set()
+    while not semantic.ready:
+        time.sleep(0.01)
+    hybrid_index.search(query, 3)
+    assert hybrid_index.last_search_complete
+
+
+def test_batch_search_matches_single_searches():
+    lexical, semantic = FakeIndex([1, 2, 3]), FakeIndex([2, 3, 4])
+    hybrid_index = retrieval.HybridIndex(lexical, semantic, concurrent=True)
+    queries = [core.Query("foo"), core.Query("bar")]
+
+    results = hybrid_index.search_batch(queries, 3)
+
+    expected = [hybrid_index.search(q, 3) for q in queries]
+    assert results == expected
+
+
+def test_candidate_depth_searches_deeper_than_results():
+    lexical = FakeIndex([1, 2, 3, 4])
+    semantic = FakeIndex([5, 6, 7, 4])
+
+    shallow = retrieval.HybridIndex(lexical, semantic)
+    deep = retrieval.HybridIndex(lexical, semantic, candidate_depth=4)
+
+    # only the deep search sees that 4 is found by both backends
+    assert [a.number for a in shallow.search(core.Query("foo"), 1)] == [1]
+    assert [a.number for a in deep.search(core.Query("foo"), 1)] == [4]
+
+
+def test_fusion_strategy_ranks_by_backend_scores():
+    class ScoredIndex(FakeIndex):
+        def __init__(self, scored):
+            super().__init__([number for number, _ in scored])
+            self._scores = [score for _, score in scored]
+
+        def search_scored(self, query, num_results=5):
+            scored = super().search_scored(query, num_results)
+            return [(a, s) for (a, _), s in zip(scored, self._scores)]
+
+    lexical = ScoredIndex([(1, 10.0), (2, 9.9), (3, 1.0)])
+    semantic = ScoredIndex([(2, 0.9), (3, 0.2), (1, 0.1)])
+    hybrid_index = retrieval.HybridIndex(
+        lexical, semantic, fusion=fusion.ConvexCombination(0.5)
+    )
+
+    results = hybrid_index.search(core.Query("foo"), 3)
+
+    assert [a.number for a in results] == [2, 1, 3]
+
+
+def test_async_searches_run_concurrently_off_the_event_loop():
+    index = retrieval.ExecutorIndex(
+        MeetingIndex([1, 2, 3], threading.Barrier(2, timeout=5))
+    )
+
+    async def search_twice():
+        return await asyncio.gather(
+            core.search_async(index, core.Query("foo"), 2),
+            core.search_async(index, core.Query("bar"), 2),
+        )
+
+    results = asyncio.run(search_twice())
+
+    assert [[a.number for a in r] for r in results] == [[1, 2], [1, 2]]
@@ -0,0 +1,46 @@
+"""Test offline index building helpers"""
+
+import os
+import pathlib
+
+import pytest
+
+from katiba_chat.adapters import indexing
+
+
+def test_failed_build_keeps_previous_directory(temp_dir_name):
+    # pylint: disable=protected-access
+    destination = os.path.join(temp_dir_name, "index")
+    with indexing._replacing_directory(destination) as build_dir:
+        (build_dir / "old").touch()
+
+    with pytest.raises(RuntimeError):
+        with indexing._replacing_directory(destination) as build_dir:
+            (build_dir / "new").touch()
+            raise RuntimeError("build failed")
+
+    # only the directory of the last complete build is kept
+    assert sorted(os.listdir(temp_dir_name)) == [
+        os.readlink(destination),
+        "index",
+    ]
+    assert os.listdir(destination) == ["old"]
+
+
+def test_build_replaces_directory_through_a_link(temp_dir_name):
+    # pylint: disable=protected-access
+    destination = os.path.join(temp_dir_name, "index")
+    os.mkdir(destination)
+    (pathlib.Path(destination) / "legacy").touch()
+
+    links = []
+    for name in ("first", "second", "third"):
+        with indexing._replacing_directory(destination) as build_dir:
+            (build_dir / name).touch()
+        links.append(os.readlink(destination))
+
+    assert os.path.islink(destination)
+    assert os.listdir(destination) == ["third"]
+    # the previous build is kept for processes still reading it
+    assert sorted(os.listdir(temp_dir_name)) == sorted([*links[1:], "index"])
+    assert os.listdir(os.path.join(temp_dir_name, links[1])) == ["second"]
@@ -0,0 +1,87 @@
+"""Test the instrumentation of the pipeline stages"""
+
+import json
+import logging
+
+import pytest
+from conftest import FakeIndex
+
+from katiba_chat import core
+from katiba_chat.adapters import caching
+from katiba_chat.core import instrumentation
+
+
+class InstrumentedIndex(FakeIndex):  # pylint: disable=too-few-public-methods
+    def search(self, query, num_results=5):
+        with instrumentation.span("backend"):
+            return super().search(query, num_results)
+
+
+def test_records_nothing_when_disabled():
+    with instrumentation.span("search"):
+        instrumentation.increment("cache_hits", cache="retrieval")
+
+    assert instrumentation.render() == ""
+
+
+def test_spans_are_timed_and_logged_with_their_parent(instrumented, caplog):
+    with caplog.at_level(logging.DEBUG, logger=instrumentation.__name__):
+        core.search(InstrumentedIndex(), core.Query("foo"))
+
+    assert instrumented.histogram("search").count == 1
+    assert instrumented.histogram("backend").count == 1
+    child, parent = [json.loads(r.getMessage()) for r in caplog.records]
+    assert child["span"] == "backend"
+    assert child["parent_id"] == parent["span_id"]
+    assert child["trace_id"] == parent["trace_id"]
+    assert parent["num_results"] == 5
+
+
+def test_times_streams_to_first_item_and_end(instrumented):
+    items = list(instrumentation.timed_iter("stream", iter("abc")))
+
+    assert items == ["a", "b", "c"]
+    assert instrumented.histogram("stream").count == 1
+    assert instrumented.histogram("stream.first_item").count == 1
+
+
+def test_counts_hits_of_named_caches(instrumented):
+    cache = caching.LRUCache(name="retrieval")
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+
+    assert instrumented.counter("cache_hits", cache="retrieval") == 1
+    assert instrumented.counter("cache_misses", cache="retrieval") == 1
+
+
+@pytest.mark.usefixtures("instrumented")
+def test_renders_prometheus_text():
+    instrumentation.observe("search", 0.003)
+    instrumentation.increment("llm_tokens", 12, kind="prompt")
+    instrumentation.set_gauge("query_batch_max_size", 32)
+
+    lines = instrumentation.render().splitlines()
+
+    assert "# TYPE katiba_chat_span_seconds histogram" in lines
+    assert 'katiba_chat_span_seconds_bucket{span="search",le="0.0025"} 0' in (
+        lines
+    )
+    assert 'katiba_chat_span_seconds_bucket{span="search",le="0.005"} 1' in (
+        lines
+    )
+    assert 'katiba_chat_span_seconds_bucket{span="search",le="+Inf"} 1' in (
+        lines
+    )
+    assert 'katiba_chat_span_seconds_count{span="search"} 1' in lines
+    assert "# TYPE katiba_chat_llm_tokens_total counter" in lines
+    assert 'katiba_chat_llm_tokens_total{kind="prompt"} 12' in lines
+    assert "# TYPE katiba_chat_query_batch_max_size gauge" in lines
+    assert "katiba_chat_query_batch_max_size 32" in lines
+
+
+def test_timed_gives_elapsed_seconds_and_result():
+    seconds, result = instrumentation.timed(sorted, [2, 1], reverse=True)
+
+    assert result == [2, 1]
+    assert seconds >= 0
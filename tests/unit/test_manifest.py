@@ -0,0 +1,81 @@
+"""Test index manifests"""
+
+import json
+import os
+
+import pytest
+
+from katiba_chat.adapters import manifest
+
+
+def article(number, clauses="foo"):
+    return {
+        "title": f"Article {number}",
+        "clauses": clauses,
+        "chapter": "bar",
+        "part": "baz",
+        "number": number,
+    }
+
+
+def test_detects_added_changed_and_removed_articles():
+    old = manifest.IndexManifest.from_articles([article(1), article(2)])
+    new = manifest.IndexManifest.from_articles(
+        [article(1), article(2, "quux"), article(3)]
+    )
+
+    changes = old.changes(new)
+
+    assert changes.added == ["3"]
+    assert changes.changed == ["2"]
+    assert not changes.removed
+    assert not new.changes(new)
+    assert new.changes(old).removed == ["3"]
+
+
+def test_content_hash_ignores_field_order():
+    reordered = dict(reversed(list(article(1).items())))
+    assert manifest.content_hash(reordered) == manifest.content_hash(
+        article(1)
+    )
+
+
+def test_manifest_round_trips(temp_dir_name):
+    saved = manifest.IndexManifest.from_articles(
+        [article(1)], "model", "onnx:model.onnx"
+    )
+    saved.save(temp_dir_name)
+
+    loaded = manifest.IndexManifest.load(temp_dir_name)
+
+    assert loaded == saved
+    assert loaded.digest == saved.digest
+    assert manifest.IndexManifest.load(f"{temp_dir_name}/missing") is None
+
+
+def test_digest_changes_with_encoder():
+    articles = [article(1)]
+    default = manifest.IndexManifest.from_articles(articles, "model")
+    onnx = manifest.IndexManifest.from_articles(articles, "model", "onnx")
+
+    assert default.digest != onnx.digest
+
+
+def test_streams_articles_across_chunks(temp_dir_name):
+    articles = [
+        {"number": n, "title": f"Article {n} — {'x' * n}"} for n in range(20)
+    ]
+    path = os.path.join(temp_dir_name, "articles.json")
+    with open(path, "wt") as f:
+        json.dump(articles, f, indent=2)
+
+    assert list(manifest.iter_articles(path, chunk_size=7)) == articles
+
+
+def test_rejects_data_that_is_not_an_array(temp_dir_name):
+    path = os.path.join(temp_dir_name, "articles.json")
+    with open(path, "wt") as f:
+        json.dump({"number": 1}, f)
+
+    with pytest.raises(ValueError):
+        list(manifest.iter_articles(path))
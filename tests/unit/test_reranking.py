@@ -0,0 +1,141 @@
+"""Test cross-encoder reranking with a fake scorer"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import FakeIndex, numbers
+
+from katiba_chat import core
+from katiba_chat.adapters import caching, reranking
+
+
+class FakeScorer:  # pylint: disable=too-few-public-methods
+    """Score articles by their number, the higher the better
+
+    `wait`, if given, is called before scoring, to hold it back.
+    """
+
+    def __init__(self, wait=None):
+        self.pairs = []
+        self._wait = wait
+
+    def __call__(self, pairs):
+        if self._wait is not None:
+            self._wait()
+        self.pairs.extend(pairs)
+        return [
+            float(article.split("Number: ")[1].split()[0])
+            for _, article in pairs
+        ]
+
+
+def test_reranks_over_fetched_candidates():
+    index = reranking.RerankingIndex(
+        FakeIndex([1, 2, 3, 4]), candidate_depth=4, scorer=FakeScorer()
+    )
+
+    results = index.search(core.Query("foo"), 2)
+
+    assert numbers(results) == [4, 3]
+    assert index.last_search_reranked
+
+
+def test_caches_scores_of_repeated_pairs():
+    scorer = FakeScorer()
+    index = reranking.RerankingIndex(
+        FakeIndex([1, 2, 3]), candidate_depth=3, scorer=scorer
+    )
+
+    index.search(core.Query("foo"), 2)
+    index.search(core.Query("foo"), 2)
+    index.search(core.Query("bar"), 2)
+
+    assert len(scorer.pairs) == 6
+    assert index.scores_cache.stats.hits == 3
+
+
+def test_batch_search_scores_all_queries_in_batches():
+    scorer = FakeScorer()
+    index = reranking.RerankingIndex(
+        FakeIndex([1, 2, 3]), candidate_depth=3, batch_size=4, scorer=scorer
+    )
+
+    results = index.search_batch([core.Query("foo"), core.Query("bar")], 1)
+
+    assert [numbers(r) for r in results] == [[3], [3]]
+    assert len(scorer.pairs) == 6
+
+
+def test_keeps_first_stage_order_past_latency_budget():
+    release = threading.Event()
+    index = reranking.RerankingIndex(
+        FakeIndex([1, 2, 3]),
+        candidate_depth=3,
+        latency_budget=0.05,
+        scorer=FakeScorer(release.wait),
+    )
+
+    results = index.search(core.Query("foo"), 2)
+    release.set()
+
+    assert numbers(results) == [1, 2]
+    assert not index.last_search_reranked
+    assert not index.last_search_complete
+
+
+def test_fallback_results_are_not_memoized():
+    release = threading.Event()
+    reranking_index = reranking.RerankingIndex(
+        FakeIndex([1, 2, 3]),
+        candidate_depth=3,
+        latency_budget=0.05,
+        scorer=FakeScorer(release.wait),
+    )
+    index = caching.CachedIndex(reranking_index)
+    query = core.Query("foo")
+
+    assert numbers(index.search(query, 2)) == [1, 2]
+    # the abandoned scoring finishes and fills the scores cache
+    release.set()
+    deadline = time.monotonic() + 5
+    while len(reranking_index.scores_cache) < 3:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert numbers(index.search(query, 2)) == [3, 2]
+
+
+def test_loading_the_cross_encoder_is_outside_the_budget(monkeypatch):
+    def load_slowly(model_name, batch_size):
+        # pylint: disable=unused-argument
+        time.sleep(0.6)
+        return FakeScorer()
+
+    monkeypatch.setattr(reranking, "_cross_encoder_scorer", load_slowly)
+    index = reranking.RerankingIndex(
+        FakeIndex([1, 2, 3]), candidate_depth=3, latency_budget=0.5
+    )
+
+    assert numbers(index.search(core.Query("foo"), 2)) == [3, 2]
+    assert index.last_search_reranked
+
+
+def test_concurrent_searches_are_scored_in_parallel():
+    # scoring one search at a time would break the barrier
+    barrier = threading.Barrier(3, timeout=5)
+    index = reranking.RerankingIndex(
+        FakeIndex([1, 2, 3]),
+        candidate_depth=3,
+        latency_budget=10,
+        scorer=FakeScorer(barrier.wait),
+    )
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(
+            executor.map(
+                lambda text: index.search(core.Query(text), 2),
+                ["foo", "bar", "baz"],
+            )
+        )
+
+    assert [numbers(r) for r in results] == [[3, 2]] * 3
@@ -0,0 +1,142 @@
+"""Test sharded search over several corpora with fake shards"""
+
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from conftest import FakeIndex, MeetingIndex, numbers
+
+from katiba_chat import core
+from katiba_chat.adapters import caching, sharding
+
+
+class NotReadyIndex(FakeIndex):
+    """Find articles, but report them incomplete in the searching thread"""
+
+    def __init__(self, article_numbers):
+        super().__init__(article_numbers)
+        self._local = threading.local()
+
+    @property
+    def last_search_complete(self):
+        return getattr(self._local, "complete", True)
+
+    def search_scored(self, query, num_results=5):
+        self._local.complete = False
+        return super().search_scored(query, num_results)
+
+
+@pytest.fixture(name="sharded_index")
+def fixture_sharded_index():
+    index = sharding.ShardedIndex(
+        {
+            "constitution": FakeIndex([9, 5, 1]),
+            "statutes": FakeIndex([8, 6, 2]),
+        }
+    )
+    yield index
+    index.close()
+
+
+def test_merges_top_results_of_all_shards_by_rank(sharded_index):
+    results = sharded_index.search(core.Query("foo"), 4)
+
+    assert numbers(results) == [9, 8, 5, 6]
+    assert set(sharded_index.last_timings) == {"constitution", "statutes"}
+
+
+def test_searches_only_the_corpora_of_the_query(sharded_index):
+    query = core.Query("foo", corpora=frozenset({"statutes"}))
+
+    assert numbers(sharded_index.search(query, 2)) == [8, 6]
+    assert set(sharded_index.last_timings) == {"statutes"}
+    with pytest.raises(ValueError):
+        sharded_index.search(core.Query("foo", frozenset({"bylaws"})), 2)
+
+
+def test_batch_search_filters_each_query(sharded_index):
+    queries = [
+        core.Query("foo"),
+        core.Query("foo", corpora=frozenset({"constitution"})),
+    ]
+
+    results = sharded_index.search_batch(queries, 2)
+
+    assert [numbers(r) for r in results] == [[9, 8], [9, 5]]
+
+
+def test_shards_are_searched_in_parallel():
+    barrier = threading.Barrier(2, timeout=5)
+    index = sharding.ShardedIndex(
+        {
+            "constitution": MeetingIndex([1], barrier),
+            "statutes": MeetingIndex([2], barrier),
+        }
+    )
+
+    assert sorted(numbers(index.search(core.Query("foo"), 2))) == [1, 2]
+    assert index.last_search_complete
+    index.close()
+
+
+def test_slow_shard_is_dropped_and_not_cached():
+    index = sharding.ShardedIndex(
+        {
+            "constitution": FakeIndex([1]),
+            "statutes": FakeIndex([2], delay=0.5),
+        },
+        timeout=0.1,
+    )
+    cached_index = caching.CachedIndex(index)
+
+    assert numbers(cached_index.search(core.Query("foo"), 2)) == [1]
+    assert index.last_timings["statutes"] is None
+    assert not index.last_search_complete
+    assert len(cached_index.results_cache) == 0
+    index.close()
+
+
+def test_incomplete_shard_results_are_not_cached():
+    index = sharding.ShardedIndex(
+        {
+            "constitution": FakeIndex([1]),
+            "statutes": NotReadyIndex([2]),
+        }
+    )
+    cached_index = caching.CachedIndex(index)
+
+    assert numbers(cached_index.search(core.Query("foo"), 2)) == [1, 2]
+    assert not index.last_search_complete
+    assert len(cached_index.results_cache) == 0
+    index.close()
+
+
+def test_time_queued_behind_other_searches_is_not_timed_out():
+    index = sharding.ShardedIndex(
+        {
+            "constitution": FakeIndex([1], delay=0.2),
+            "statutes": FakeIndex([2], delay=0.2),
+        },
+        timeout=0.3,
+        max_concurrency=1,
+    )
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(
+            executor.map(
+                lambda _: index.search(core.Query("foo"), 2), range(2)
+            )
+        )
+
+    assert [numbers(r) for r in results] == [[1, 2], [1, 2]]
+    index.close()
+
+
+def test_searches_shard_in_worker_process():
+    shard = sharding.ProcessShard(functools.partial(FakeIndex, [3, 2]))
+
+    assert numbers(shard.search(core.Query("foo"), 1)) == [3]
+    assert shard.search_scored(core.Query("foo"), 2)[1][1] == 2.0
+    assert shard.last_search_complete
+    shard.close()
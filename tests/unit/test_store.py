@@ -0,0 +1,56 @@
+"""Test the memory-mapped article store"""
+
+import dataclasses
+import json
+
+import pytest
+
+from katiba_chat import core
+from katiba_chat.adapters import store as article_store
+
+
+def write_articles(path, numbers, title="foo"):
+    records = [
+        dataclasses.asdict(core.Article(title, f"clause {n}", "bar", n, "baz"))
+        for n in numbers
+    ]
+    with open(path, "wt") as f:
+        json.dump(records, f)
+    return records
+
+
+def test_reads_articles_by_number(tmp_path):
+    article_store.ArticleStore.write(
+        tmp_path / "articles.store",
+        write_articles(tmp_path / "articles.json", [3, 1, 20]),
+    )
+    store = article_store.ArticleStore(tmp_path / "articles.store")
+
+    assert store.numbers.tolist() == [1, 3, 20]
+    assert store[20] == core.Article("foo", "clause 20", "bar", 20, "baz")
+    assert [a.number for a in store.articles([3, 1])] == [3, 1]
+    assert 2 not in store
+    with pytest.raises(KeyError):
+        store[2]  # pylint: disable=pointless-statement
+    store.close()
+
+
+def test_is_written_from_data_when_stale(tmp_path):
+    data_path = tmp_path / "articles.json"
+    write_articles(data_path, [1, 2])
+    store = article_store.ArticleStore(tmp_path / "articles.store", data_path)
+    assert len(store) == 2
+    store.close()
+
+    write_articles(data_path, [1, 2, 3], title="quux")
+    store = article_store.ArticleStore(tmp_path / "articles.store", data_path)
+
+    assert len(store) == 3
+    assert store[1].title == "quux"
+    store.close()
+
+
+def test_articles_have_no_instance_dict():
+    article = core.Article("foo", "bar", "baz", 1, "quux")
+
+    assert not hasattr(article, "__dict__")
@@ -1,16 +1,23 @@
 """Test various helper utilities"""
 
-from katiba_chat import core
-from katiba_chat.adapters import retrieval
+import pathlib
 
+import numpy
 
-def test_rrf_score():
+from katiba_chat import bench, core
+from katiba_chat.adapters import fusion, retrieval, tokenization, vectors
+from katiba_chat.bench import retrieval as retrieval_bench
+
+
+def test_rrf_scores_by_reciprocal_rank():
     # formula: 1 / (k + rank)
     k = 60
     expected_top_5 = [1 / (k + i + 1) for i in range(5)]
-    rrf_func = retrieval.HybridIndex.rrf_score
-    actual = [rrf_func(i + 1) for i in range(5)]
-    assert expected_top_5 == actual
+    ids = numpy.arange(5)
+    _, actual = fusion.ReciprocalRankFusion(k).fuse(
+        {"lexical": (ids, numpy.zeros(5))}
+    )
+    assert numpy.allclose(actual, expected_top_5)
 
 
 def test_hybrid_results_ranking():
@@ -20,11 +27,130 @@ def test_hybrid_results_ranking():
     ]  # -> 1, 2, 3
     results_2 = results_1[1:]  # -> 2, 3
 
-    # pylint: disable=protected-access
-    ranking_func = retrieval.HybridIndex._rank_results
-    ranked_results = ranking_func(results_1, results_2)
+    ranked_results = retrieval.fuse_results(
+        fusion.ReciprocalRankFusion(),
+        {
+            "lexical": [(article, 0.0) for article in results_1],
+            "semantic": [(article, 0.0) for article in results_2],
+        },
+    )
     expected_order = [2, 3, 1]
 
     assert len(ranked_results) == len(expected_order)
     for i, r in enumerate(ranked_results):
         assert r.number == expected_order[i]
+
+
+def test_top_k_returns_highest_scores_first():
+    scores = numpy.array([0.1, 0.9, 0.3, 0.7, 0.5])
+    assert list(vectors.top_k(scores, 3)) == [1, 3, 4]
+    assert list(vectors.top_k(scores, 10)) == [1, 3, 4, 2, 0]
+    assert len(vectors.top_k(scores, 0)) == 0
+
+
+def test_quantized_embeddings_preserve_similarity():
+    rng = numpy.random.default_rng(0)
+    embeddings = vectors.normalize(rng.normal(size=(10, 32)))
+    assert numpy.allclose(numpy.linalg.norm(embeddings, axis=1), 1)
+
+    query = embeddings[0]
+    exact = embeddings @ query
+    for dtype, scale in [("float16", 1), ("int8", vectors.INT8_SCALE)]:
+        quantized = vectors.quantize(embeddings, dtype)
+        assert quantized.dtype == numpy.dtype(dtype)
+        approximate = (quantized @ query) / scale
+        assert numpy.allclose(approximate, exact, atol=0.02)
+
+
+def test_quantized_embeddings_are_scored_in_blocks(temp_dir_name):
+    rng = numpy.random.default_rng(0)
+    embeddings = vectors.normalize(rng.normal(size=(10, 32)))
+    queries = embeddings[:2]
+    for dtype in ["float32", "float16", "int8"]:
+        path = pathlib.Path(temp_dir_name) / f"{dtype}.npy"
+        numpy.save(path, vectors.quantize(embeddings, dtype))
+        mapped = vectors.NormalizedEmbeddings.load(path, block_rows=3)
+
+        expected = queries @ mapped.rows(slice(None)).T
+        assert numpy.allclose(mapped.rows(slice(None)), embeddings, atol=0.01)
+        assert numpy.allclose(mapped.scores(queries), expected, atol=1e-6)
+        assert numpy.allclose(
+            mapped.scores(queries[0]), expected[0], atol=1e-6
+        )
+
+
+def test_top_k_rows_matches_top_k_per_row():
+    rng = numpy.random.default_rng(0)
+    scores = rng.normal(size=(4, 20))
+    expected = [list(vectors.top_k(row, 5)) for row in scores]
+    actual = [list(row) for row in vectors.top_k_rows(scores, 5)]
+    assert actual == expected
+
+
+def test_token_counter_defaults_to_estimate():
+    count_tokens = tokenization.token_counter()
+    assert count_tokens("x" * 10) == core.estimate_tokens("x" * 10) == 3
+
+
+def test_retrieval_metrics():
+    rankings = [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    expected = [1, 6, 10]
+    assert bench.hit_rate(rankings, expected, 3) == 2 / 3
+    assert bench.hit_rate(rankings, expected, 1) == 1 / 3
+    assert bench.mrr(rankings, expected, 3) == (1 + 1 / 3) / 3
+
+
+def test_latency_percentiles_in_milliseconds():
+    latencies = [i / 1000 for i in range(1, 101)]
+    percentiles = retrieval_bench.latency_percentiles(latencies)
+    assert list(percentiles) == ["p50", "p95", "p99"]
+    assert percentiles["p50"] == numpy.percentile(range(1, 101), 50)
+
+
+def test_benchmark_warms_up_with_unmeasured_queries():
+    searched = []
+
+    class RecordingIndex(core.AbstractIndex):
+        # pylint: disable=too-few-public-methods
+        def search(self, query, num_results):
+            searched.append(str(query))
+            return []
+
+    measured = retrieval_bench.WARM_UP_QUESTIONS[0]
+    queries = [core.Query(measured), core.Query("foo")]
+
+    retrieval_bench.run_benchmark(
+        RecordingIndex(), queries, [1, 2], 5, warm_up=7
+    )
+
+    warm_up, searched = searched[:7], searched[7:]
+    assert measured not in warm_up and "foo" not in warm_up
+    assert searched == [measured, "foo"]
+
+
+def test_compare_reports_flags_regressions_beyond_tolerance():
+    def report(hit_rate, p95, qps):
+        return {
+            "indexes": {
+                "lexical": {
+                    "hit_rate": hit_rate,
+                    "mrr": 0.5,
+                    "latency_ms": {"p50": 1.0, "p95": p95},
+                    "qps": qps,
+                    "peak_rss_mb": 100.0,
+                }
+            }
+        }
+
+    baseline = report(0.8, 10.0, 100.0)
+    assert not retrieval_bench.compare_reports(
+        report(0.795, 11.0, 90.0), baseline
+    )
+    regressions = retrieval_bench.compare_reports(
+        report(0.7, 13.0, 70.0), baseline
+    )
+    assert [r.split(":")[0] for r in regressions] == [
+        "lexical hit_rate",
+        "lexical latency p95",
+        "lexical qps",
+    ]